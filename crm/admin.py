@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import FacebookPage, FacebookPost, FacebookComment, FacebookMessage
+from .models import FacebookPage, FacebookPost, FacebookUser, FacebookComment, FacebookConversation, FacebookMessage, FacebookPermissionStatus, FacebookPageToken, FacebookLookupMemo, SyncJob, PageDailyStats, PostDailySnapshot, EngagementHistoryChunk
 
 
 @admin.register(FacebookPage)
@@ -19,10 +19,58 @@ class FacebookCommentAdmin(admin.ModelAdmin):
     list_filter = ['created_time']
     search_fields = ['from_name', 'message']
 
+@admin.register(FacebookConversation)
+class FacebookConversationAdmin(admin.ModelAdmin):
+    list_display = ['conversation_id', 'page', 'updated_time', 'last_synced_at']
+    list_filter = ['page']
+    search_fields = ['conversation_id']
+
 @admin.register(FacebookMessage)
 class FacebookMessageAdmin(admin.ModelAdmin):
     list_display = ['message_id', 'from_name', 'page', 'created_time']
     list_filter = ['page', 'created_time']
     search_fields = ['from_name', 'message']
-    
 
+@admin.register(FacebookUser)
+class FacebookUserAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user_id', 'resolved', 'updated_at']
+    list_filter = ['resolved']
+    search_fields = ['name', 'user_id']
+
+@admin.register(FacebookPermissionStatus)
+class FacebookPermissionStatusAdmin(admin.ModelAdmin):
+    list_display = ['token_fingerprint', 'token_valid', 'token_expires_at', 'checked_at']
+
+@admin.register(FacebookPageToken)
+class FacebookPageTokenAdmin(admin.ModelAdmin):
+    list_display = ['page_id', 'fetched_at', 'expires_at']
+    exclude = ['access_token']
+
+@admin.register(FacebookLookupMemo)
+class FacebookLookupMemoAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'key', 'value', 'expires_at']
+    list_filter = ['kind']
+    search_fields = ['key']
+
+@admin.register(PageDailyStats)
+class PageDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['page', 'date', 'posts_count', 'comments_count', 'messages_count', 'reactions_count', 'shares_count', 'followers_count']
+    list_filter = ['page']
+    date_hierarchy = 'date'
+
+@admin.register(PostDailySnapshot)
+class PostDailySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['post', 'date', 'likes_count', 'comments_count', 'shares_count', 'captured_at']
+    date_hierarchy = 'date'
+    raw_id_fields = ['post']
+
+@admin.register(EngagementHistoryChunk)
+class EngagementHistoryChunkAdmin(admin.ModelAdmin):
+    list_display = ['id', 'start_time', 'end_time', 'records', 'created_at']
+    exclude = ['data']
+
+@admin.register(SyncJob)
+class SyncJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'created_at', 'started_at', 'finished_at', 'posts_processed', 'comments_processed', 'messages_processed']
+    list_filter = ['status']
+    readonly_fields = ['result', 'metrics', 'error']
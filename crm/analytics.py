@@ -0,0 +1,239 @@
+"""
+Vectorized engagement analytics.
+
+Each report reads the columns it needs with a single `values_list` query,
+with times converted to unix seconds by the database (Epoch), turns them
+into NumPy arrays and computes the result in one vectorized pass: no per-row
+ORM instances and no Python loops over posts, comments or messages. Reports return JSON-ready dicts and are cached for
+FACEBOOK_ANALYTICS_CACHE_TTL seconds by get_report(), which the
+`analytics/<report>/` endpoints serve.
+"""
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BigIntegerField, Func
+from django.utils import timezone
+
+from .models import FacebookComment, FacebookMessage, FacebookPage, FacebookPost, FacebookUser
+
+
+ANALYTICS_CACHE_KEY = 'crm:analytics:{report}:{page}'
+
+# Upper bounds (seconds) of the response time histogram buckets; the last bucket is open-ended
+RESPONSE_TIME_BUCKETS = [5 * 60, 15 * 60, 60 * 60, 4 * 3600, 24 * 3600]
+RESPONSE_TIME_PERCENTILES = [50, 75, 90, 95]
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _columns(queryset, *fields):
+    """One list per field from a single values_list query"""
+    rows = list(queryset.order_by().values_list(*fields))
+    if not rows:
+        return [[] for _ in fields]
+    return [list(column) for column in zip(*rows)]
+
+
+class Epoch(Func):
+    """Unix seconds of a datetime column, computed by the database"""
+    template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) AS BIGINT)'
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite stores UTC text; whole seconds only, as strftime rounds fractions through a float.
+        # %s is doubled once for the template and once for the query
+        template = "CAST(strftime('%%%%s', substr(%(expressions)s, 1, 19)) AS INTEGER)"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+
+def _filtered(queryset, page, page_field='page'):
+    return queryset.filter(**{page_field: page}) if page is not None else queryset
+
+
+def _post_columns(page=None):
+    post_pks, page_pks, created, likes, comments, shares = _columns(
+        _filtered(FacebookPost.objects.annotate(created=Epoch('created_time')), page),
+        'pk', 'page_id', 'created', 'likes_count', 'comments_count', 'shares_count',
+    )
+    likes, comments, shares = (numpy.array(column, dtype=numpy.int64) for column in (likes, comments, shares))
+    return {
+        'pk': numpy.array(post_pks, dtype=numpy.int64),
+        'page': numpy.array(page_pks, dtype=numpy.int64),
+        'created': numpy.array(created, dtype=numpy.int64),
+        'engagement': likes + comments + shares,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Reports
+# ---------------------------------------------------------------------------
+
+def engagement_rates(page=None):
+    """Per page: average likes + comments + shares per post, and that as a share of followers"""
+    pages = _filtered(FacebookPage.objects.order_by('pk'), page and page.pk, 'pk')
+    pks, page_ids, names, followers = _columns(pages, 'pk', 'page_id', 'name', 'followers_count')
+    posts = _post_columns(page)
+    pks = numpy.array(pks, dtype=numpy.int64)
+    followers = numpy.array(followers, dtype=numpy.float64)
+
+    index = numpy.searchsorted(pks, posts['page'])
+    counts = numpy.bincount(index, minlength=len(pks))
+    totals = numpy.bincount(index, weights=posts['engagement'], minlength=len(pks))
+    per_post = numpy.divide(totals, counts, out=numpy.zeros(len(pks)), where=counts > 0)
+    rates = numpy.divide(per_post, followers, out=numpy.full(len(pks), numpy.nan), where=followers > 0)
+
+    order = numpy.argsort(-numpy.nan_to_num(rates, nan=-1.0), kind='stable')
+    return {'pages': [
+        {
+            'page_id': page_ids[i], 'name': names[i], 'followers': int(followers[i]), 'posts': int(counts[i]),
+            'engagement': int(totals[i]), 'engagement_per_post': round(float(per_post[i]), 2),
+            'engagement_rate': None if numpy.isnan(rates[i]) else round(float(rates[i]) * 100, 4),
+        }
+        for i in order
+    ]}
+
+
+def posting_heatmap(page=None):
+    """Posts and average engagement per weekday and hour of publication
+
+    Hours are in the current time zone, at its present UTC offset.
+    """
+    posts = _post_columns(page)
+    offset = int(timezone.localtime().utcoffset().total_seconds())
+    local = posts['created'] + offset
+    # 1970-01-01 was a Thursday
+    slot = ((local // 86400 + 3) % 7) * 24 + (local // 3600) % 24
+
+    counts = numpy.bincount(slot, minlength=7 * 24)
+    totals = numpy.bincount(slot, weights=posts['engagement'], minlength=7 * 24)
+    average = numpy.divide(totals, counts, out=numpy.zeros(7 * 24), where=counts > 0)
+
+    best = [int(i) for i in numpy.argsort(-average, kind='stable')[:5] if counts[i]]
+    return {
+        'weekdays': WEEKDAYS,
+        'posts': counts.reshape(7, 24).tolist(),
+        'average_engagement': numpy.round(average, 2).reshape(7, 24).tolist(),
+        'best_slots': [
+            {'weekday': WEEKDAYS[i // 24], 'hour': i % 24, 'posts': int(counts[i]),
+             'average_engagement': round(float(average[i]), 2)}
+            for i in best
+        ],
+    }
+
+
+def response_times(page=None):
+    """How long the page takes to answer messages: percentiles and a histogram in seconds
+
+    A response is the page's first message after one or more customer
+    messages in the same conversation, timed from the first of those.
+    Messages synced before conversations were recorded on them are left out.
+    """
+    threads, senders, page_ids, created = _columns(
+        _filtered(FacebookMessage.objects.exclude(thread_id='').annotate(created=Epoch('created_time')), page),
+        'thread_id', 'from_id', 'page__page_id', 'created',
+    )
+    times = numpy.array(created, dtype=numpy.int64)
+    _, thread = numpy.unique(numpy.array(threads, dtype=str), return_inverse=True)
+    from_page = numpy.array(senders, dtype=str) == numpy.array(page_ids, dtype=str)
+
+    order = numpy.lexsort((times, thread))
+    thread, from_page, times = thread[order], from_page[order], times[order]
+    same_thread = numpy.r_[False, thread[1:] == thread[:-1]]
+    previous_from_page = numpy.r_[True, from_page[:-1]]
+    # A customer message opens a run when it starts the conversation or follows a page message
+    opens = ~from_page & (~same_thread | previous_from_page)
+    answers = from_page & same_thread & ~previous_from_page
+    opened_at = numpy.maximum.accumulate(numpy.where(opens, numpy.arange(len(times)), -1))
+    waits = (times - times[numpy.maximum(opened_at, 0)])[answers]
+
+    edges = RESPONSE_TIME_BUCKETS
+    histogram = numpy.bincount(numpy.searchsorted(edges, waits, side='left'), minlength=len(edges) + 1)
+    labels = [f"<= {edge // 60} min" for edge in edges] + [f"> {edges[-1] // 60} min"]
+    return {
+        'responses': int(len(waits)),
+        'unanswered': int(numpy.count_nonzero(opens)) - int(len(waits)),
+        'mean_seconds': round(float(waits.mean()), 1) if len(waits) else None,
+        'percentiles': {
+            f"p{q}": round(float(value), 1)
+            for q, value in zip(RESPONSE_TIME_PERCENTILES,
+                                numpy.percentile(waits, RESPONSE_TIME_PERCENTILES) if len(waits) else [])
+        },
+        'histogram': [{'bucket': label, 'responses': int(count)} for label, count in zip(labels, histogram)],
+    }
+
+
+def top_commenters(page=None, limit=20):
+    """Commenters with the most comments, with the number of posts they commented on"""
+    from_ids, post_pks = _columns(
+        _filtered(FacebookComment.objects.exclude(from_id=''), page, 'post__page'), 'from_id', 'post_id'
+    )
+    users, user_index = numpy.unique(numpy.array(from_ids, dtype=str), return_inverse=True)
+    counts = numpy.bincount(user_index, minlength=len(users))
+    posts = counts
+    if len(from_ids):
+        # Distinct (user, post) pairs per user, packed into one int64 so unique() sorts plain integers
+        post_pks = numpy.array(post_pks, dtype=numpy.int64)
+        pairs = numpy.unique(user_index.astype(numpy.int64) * (int(post_pks.max()) + 1) + post_pks)
+        posts = numpy.bincount(pairs // (int(post_pks.max()) + 1), minlength=len(users))
+
+    top = numpy.argsort(-counts, kind='stable')[:limit]
+    top_ids = [str(users[i]) for i in top]
+    names = dict(FacebookUser.objects.filter(user_id__in=top_ids).exclude(name='').values_list('user_id', 'name'))
+    total = int(counts.sum())
+    return {'total_comments': total, 'commenters': [
+        {'user_id': user_id, 'name': names.get(user_id, ''), 'comments': int(counts[i]),
+         'posts': int(posts[i]), 'share': round(int(counts[i]) / total * 100, 2)}
+        for user_id, i in zip(top_ids, top)
+    ]}
+
+
+def post_percentiles(page=None, limit=50):
+    """The newest posts with the percentile rank of their engagement among their page's posts and all posts"""
+    posts = _post_columns(page)
+    n = len(posts['pk'])
+    if not n:
+        return {'posts': []}
+
+    # Rank within the whole set: ties share the lowest rank
+    engagement = posts['engagement']
+    ordered = numpy.sort(engagement)
+    overall = numpy.searchsorted(ordered, engagement, side='left') / max(n - 1, 1) * 100
+
+    # Rank within the page: sort by (page, engagement); a rank is where its run of ties starts in its page
+    by_page = numpy.lexsort((engagement, posts['page']))
+    sorted_pages, sorted_engagement = posts['page'][by_page], engagement[by_page]
+    page_starts = numpy.r_[True, sorted_pages[1:] != sorted_pages[:-1]]
+    tie_starts = page_starts | numpy.r_[True, sorted_engagement[1:] != sorted_engagement[:-1]]
+    positions = numpy.arange(n)
+    first_in_page = numpy.maximum.accumulate(numpy.where(page_starts, positions, 0))
+    first_tie = numpy.maximum.accumulate(numpy.where(tie_starts, positions, 0))
+    page_sizes = numpy.diff(numpy.r_[numpy.flatnonzero(page_starts), n])[numpy.cumsum(page_starts) - 1]
+    within_page = numpy.empty(n)
+    within_page[by_page] = (first_tie - first_in_page) / numpy.maximum(page_sizes - 1, 1) * 100
+
+    newest = numpy.argsort(-posts['created'], kind='stable')[:limit]
+    post_ids = dict(FacebookPost.objects.filter(pk__in=posts['pk'][newest].tolist()).values_list('pk', 'post_id'))
+    return {'posts': [
+        {'post_id': post_ids[int(posts['pk'][i])], 'engagement': int(engagement[i]),
+         'page_percentile': round(float(within_page[i]), 1), 'overall_percentile': round(float(overall[i]), 1)}
+        for i in newest
+    ]}
+
+
+REPORTS = {
+    'engagement': engagement_rates,
+    'posting-hours': posting_heatmap,
+    'response-times': response_times,
+    'top-commenters': top_commenters,
+    'post-percentiles': post_percentiles,
+}
+
+
+def get_report(report, page=None):
+    """A report by name, cached for FACEBOOK_ANALYTICS_CACHE_TTL seconds (0 disables caching)"""
+    compute = REPORTS[report]
+    ttl = getattr(settings, 'FACEBOOK_ANALYTICS_CACHE_TTL', 300)
+    if not ttl:
+        return compute(page)
+    key = ANALYTICS_CACHE_KEY.format(report=report, page=page.page_id if page is not None else 'all')
+    return cache.get_or_set(key, lambda: compute(page), ttl)
@@ -0,0 +1,217 @@
+"""
+Raw Graph API response archive.
+
+When FACEBOOK_ARCHIVE_ENABLED is set, every successful Graph response the
+client receives (batch sub-responses included) is appended to a local
+archive, so the database can be rebuilt with `manage.py reingest` after the
+field mapping changes, without crawling Facebook again.
+
+The archive is a directory of append-only segment files. Each segment is a
+series of independently compressed frames (gzip members, or zstd frames when
+the optional `zstandard` package is installed) of JSON lines, one response
+per line. Every frame gets a line in the segment's `.idx` sidecar with its
+byte range, time span and the endpoints it holds, so readers can skip
+straight to the frames they need. Each process writes its own segments, and
+index lines are written after their frame, so readers never see partial data.
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = ('gzip', 'zstd')
+SEGMENT_SUFFIXES = {'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+# Responses that carry credentials or say nothing about page content
+SKIPPED_ENDPOINTS = {'me/accounts', 'debug_token', 'me/permissions'}
+
+
+def _compress(data, compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("The zstandard package is needed to read .zst archive segments")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _segment_compression(path):
+    return 'zstd' if path.name.endswith(SEGMENT_SUFFIXES['zstd']) else 'gzip'
+
+
+class ResponseArchive:
+    """Buffers responses and appends them to the current segment one compressed frame at a time"""
+
+    def __init__(self, directory, compression='gzip', segment_bytes=64 * 1024 * 1024, frame_records=500):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown archive compression {compression!r}, expected one of {COMPRESSIONS}")
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("zstandard is not installed, archiving with gzip instead")
+            compression = 'gzip'
+        self.directory = Path(directory)
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.frame_records = frame_records
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._segment = None
+        self._sequence = 0
+
+    def record(self, endpoint, key, params, body, method='GET'):
+        """Queue one response (key is the endpoint with IDs collapsed); it reaches disk with the next frame"""
+        if key in SKIPPED_ENDPOINTS:
+            return
+        entry = {
+            't': time.time(),
+            'endpoint': endpoint,
+            'key': key,
+            'method': method,
+            'params': {name: value for name, value in (params or {}).items() if name != 'access_token'},
+            'body': body,
+        }
+        with self._lock:
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.frame_records:
+                self._write_frame()
+
+    def flush(self):
+        """Write whatever is buffered as a frame"""
+        with self._lock:
+            self._write_frame()
+
+    def _write_frame(self):
+        # Called with self._lock held
+        if not self._buffer:
+            return
+        entries, self._buffer = self._buffer, []
+        data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode()
+        frame = _compress(data, self.compression)
+
+        segment = self._current_segment()
+        with open(segment, 'ab') as fh:
+            offset = fh.tell()
+            fh.write(frame)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+        endpoints = {}
+        for entry in entries:
+            endpoints[entry['key']] = endpoints.get(entry['key'], 0) + 1
+        index_line = {
+            'offset': offset, 'length': len(frame), 'records': len(entries),
+            'start': min(entry['t'] for entry in entries), 'end': max(entry['t'] for entry in entries),
+            'endpoints': endpoints,
+        }
+        with open(segment.with_name(segment.name + '.idx'), 'a') as fh:
+            fh.write(json.dumps(index_line) + '\n')
+
+    def _current_segment(self):
+        if self._segment is None or self._segment.stat().st_size >= self.segment_bytes:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._sequence += 1
+            stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+            name = f"{stamp}-{os.getpid()}-{self._sequence:04d}{SEGMENT_SUFFIXES[self.compression]}"
+            self._segment = self.directory / name
+            self._segment.touch()
+        return self._segment
+
+
+_archive = None
+_archive_key = None
+_archive_lock = threading.Lock()
+
+
+def _archive_settings():
+    return (
+        str(getattr(settings, 'FACEBOOK_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'facebook_archive')),
+        getattr(settings, 'FACEBOOK_ARCHIVE_COMPRESSION', 'gzip'),
+        getattr(settings, 'FACEBOOK_ARCHIVE_SEGMENT_BYTES', 64 * 1024 * 1024),
+    )
+
+
+def get_archive():
+    """The process-wide archive, or None unless FACEBOOK_ARCHIVE_ENABLED"""
+    global _archive, _archive_key
+    if not getattr(settings, 'FACEBOOK_ARCHIVE_ENABLED', False):
+        return None
+    key = _archive_settings()
+    with _archive_lock:
+        # Settings can change under tests; start a new archive rather than write to the old place
+        if _archive is None or _archive_key != key:
+            if _archive is not None:
+                _archive.flush()
+            _archive, _archive_key = ResponseArchive(*key), key
+        return _archive
+
+
+def flush_archive():
+    """Write out buffered responses, e.g. at the end of a sync"""
+    if _archive is not None:
+        _archive.flush()
+
+
+def iter_segments(directory=None):
+    """Segment files oldest first (names start with their creation time)"""
+    directory = Path(directory or _archive_settings()[0])
+    if not directory.is_dir():
+        return []
+    return sorted(
+        path for path in directory.iterdir()
+        if any(path.name.endswith(suffix) for suffix in SEGMENT_SUFFIXES.values())
+    )
+
+
+def find_frames(directory=None, endpoints=None, since=None, until=None):
+    """Index entries (with their segment) of frames that may hold matching records, oldest first"""
+    endpoints = set(endpoints) if endpoints else None
+    frames = []
+    for segment in iter_segments(directory):
+        index = segment.with_name(segment.name + '.idx')
+        if not index.exists():
+            continue
+        with open(index) as fh:
+            for line in fh:
+                frame = json.loads(line)
+                if endpoints and not endpoints.intersection(frame['endpoints']):
+                    continue
+                if (since and frame['end'] < since) or (until and frame['start'] > until):
+                    continue
+                frame['segment'] = segment
+                frames.append(frame)
+    # Several processes may have been writing segments at the same time
+    return sorted(frames, key=lambda frame: frame['start'])
+
+
+def iter_records(directory=None, endpoints=None, since=None, until=None):
+    """Archived responses oldest frame first, filtered by endpoint key and unix time"""
+    endpoints = set(endpoints) if endpoints else None
+    for frame in find_frames(directory, endpoints, since, until):
+        with open(frame['segment'], 'rb') as fh:
+            fh.seek(frame['offset'])
+            data = _decompress(fh.read(frame['length']), _segment_compression(frame['segment']))
+        for line in data.splitlines():
+            entry = json.loads(line)
+            if endpoints and entry['key'] not in endpoints:
+                continue
+            if (since and entry['t'] < since) or (until and entry['t'] > until):
+                continue
+            yield entry
@@ -1,57 +1,809 @@
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
 from datetime import datetime
+from urllib.parse import urlencode, urlparse, parse_qsl
 import json
+import logging
+import random
+import re
+import threading
+import time
+
+from .archive import get_archive
+from .memo import LookupMemo
+from .metrics import metrics
+from .models import FacebookLookupMemo
+from .tokens import get_page_token, token_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+# Shared HTTP transport: one pooled, keep-alive session per process so every
+# FacebookGraphAPI instance (views, sync runs, debug views) reuses connections
+# to graph.facebook.com instead of paying a TCP+TLS handshake per call.
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _build_http_session():
+    """Create a requests session with a connection pool sized from settings"""
+    pool_connections = getattr(settings, 'FACEBOOK_API_POOL_CONNECTIONS', 10)
+    pool_maxsize = getattr(settings, 'FACEBOOK_API_POOL_MAXSIZE', 20)
+    keep_alive = getattr(settings, 'FACEBOOK_API_KEEP_ALIVE', True)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive' if keep_alive else 'close',
+    })
+    return session
+
+
+def get_http_session():
+    """Return the process-wide pooled session used for all Graph API calls"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = _build_http_session()
+    return _http_session
+
+
+def set_http_session(session):
+    """Swap the shared session (e.g. for a stub server) and return the old one"""
+    global _http_session
+    with _http_session_lock:
+        previous = _http_session
+        _http_session = session
+    return previous
+
+
+def get_request_timeout():
+    """(connect, read) timeout in seconds for Graph API calls"""
+    timeout = getattr(settings, 'FACEBOOK_API_TIMEOUT', (5, 30))
+    if isinstance(timeout, list):
+        timeout = tuple(timeout)
+    return timeout
+
+
+def endpoint_key(endpoint):
+    """Collapse object IDs in an endpoint path so stats group by edge, e.g. {id}/comments"""
+    key = '/'.join(
+        '{id}' if re.search(r'\d', segment) else segment
+        for segment in endpoint.split('?')[0].strip('/').split('/')
+    )
+    # Batch POSTs and ?ids= lookups go to the version root
+    return key or '(root)'
+
+
+class RequestStats:
+    """Thread-safe per-endpoint call, latency and payload size counters for Graph API requests
+
+    Calls are also broken down by the field profile the client used, so the
+    cost of each profile can be compared endpoint by endpoint.
+    """
 
-class FacebookGraphAPI:
     def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def record(self, endpoint, elapsed, ok=True, size=0, profile=None):
+        key = (profile, endpoint_key(endpoint))
+        with self._lock:
+            entry = self._endpoints.get(key)
+            if entry is None:
+                entry = self._endpoints[key] = {
+                    'calls': 0, 'errors': 0, 'total_time': 0.0,
+                    'min_time': None, 'max_time': 0.0, 'bytes': 0,
+                }
+            entry['calls'] += 1
+            if not ok:
+                entry['errors'] += 1
+            entry['total_time'] += elapsed
+            entry['max_time'] = max(entry['max_time'], elapsed)
+            if entry['min_time'] is None or elapsed < entry['min_time']:
+                entry['min_time'] = elapsed
+            entry['bytes'] += size
+
+    @staticmethod
+    def _merge(entries):
+        merged = {'calls': 0, 'errors': 0, 'total_time': 0.0, 'min_time': None, 'max_time': 0.0, 'bytes': 0}
+        for entry in entries:
+            for field in ('calls', 'errors', 'total_time', 'bytes'):
+                merged[field] += entry[field]
+            merged['max_time'] = max(merged['max_time'], entry['max_time'])
+            if entry['min_time'] is not None and (merged['min_time'] is None or entry['min_time'] < merged['min_time']):
+                merged['min_time'] = entry['min_time']
+        merged['avg_time'] = merged['total_time'] / merged['calls'] if merged['calls'] else 0.0
+        merged['avg_bytes'] = merged['bytes'] / merged['calls'] if merged['calls'] else 0.0
+        return merged
+
+    def snapshot(self):
+        """Return totals, a per-endpoint breakdown and a per-profile, per-endpoint breakdown"""
+        with self._lock:
+            entries = {key: dict(entry) for key, entry in self._endpoints.items()}
+
+        by_endpoint = {}
+        by_profile = {}
+        for (profile, key), entry in entries.items():
+            by_endpoint.setdefault(key, []).append(entry)
+            if profile:
+                by_profile.setdefault(profile, {})[key] = self._merge([entry])
+
+        totals = self._merge(entries.values())
+        return {
+            'calls': totals['calls'],
+            'errors': totals['errors'],
+            'total_time': totals['total_time'],
+            'avg_time': totals['avg_time'],
+            'bytes': totals['bytes'],
+            'endpoints': {key: self._merge(group) for key, group in by_endpoint.items()},
+            'profiles': by_profile,
+        }
+
+
+request_stats = RequestStats()
+
+# Graph API error codes meaning "slow down": app limit, user limit, page limit,
+# and per-hour limit on a specific API call
+THROTTLE_ERROR_CODES = {4, 17, 32, 613}
+# Which bucket each throttle code pauses; anything else pauses the token's bucket
+THROTTLE_SCOPES = {4: 'app', 32: 'page'}
+
+
+def is_throttle_error(error):
+    """True if a Graph API error object means we are being rate limited"""
+    return isinstance(error, dict) and error.get('code') in THROTTLE_ERROR_CODES
+
+
+def usage_percent(usage):
+    """Highest of the call_count/total_cputime/total_time percentages in a usage header entry"""
+    return max(
+        (usage.get(key) or 0 for key in ('call_count', 'total_cputime', 'total_time')),
+        default=0,
+    )
+
+
+class TokenBucket:
+    """Token bucket whose refill rate can be turned down and paused
+
+    acquire() blocks until the cost can be paid. A cost larger than the burst
+    capacity (a 50-request batch, say) is let through once the bucket is
+    full and leaves it in debt, so it still has to be paid for.
+    """
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.usage = None
+        self.throttled = 0
+        self.backoff_level = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, cost):
+        """Take cost tokens and return 0, or return how long to wait before trying again"""
+        now = self.clock()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0
+        return (needed - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def snapshot(self):
+        return {
+            'usage': self.usage,
+            'rate': round(self.rate, 3),
+            'base_rate': self.base_rate,
+            'tokens': round(self.tokens, 2),
+            'paused_for': round(max(0.0, self.paused_until - self.clock()), 2),
+            'throttled': self.throttled,
+        }
+
+
+class RateGovernor:
+    """Client-side Graph API rate limiting per app, page and access token
+
+    Every request takes a token from the app bucket, from its page's bucket
+    when it is made with a page token, and from its access token's bucket.
+    Usage headers (X-App-Usage, X-Page-Usage, X-Business-Use-Case-Usage) turn
+    a bucket's rate down once usage passes FACEBOOK_RATE_LIMIT_SLOWDOWN_AT
+    percent, and throttling errors pause the bucket with capped exponential
+    backoff and full jitter.
+    """
+
+    def __init__(self, sleep=time.sleep, clock=time.monotonic):
+        self.sleep = sleep
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+
+    def _limits(self, scope):
+        defaults = {'app': (20, 40), 'page': (10, 20), 'token': (10, 20)}
+        return getattr(settings, f'FACEBOOK_RATE_LIMIT_{scope.upper()}', defaults[scope])
+
+    def _bucket(self, scope, key):
+        # Called with self._lock held
+        bucket = self._buckets.get((scope, key))
+        if bucket is None:
+            rate, capacity = self._limits(scope)
+            bucket = self._buckets[(scope, key)] = TokenBucket(rate, capacity, self.clock)
+        return bucket
+
+    def _keys(self, token, page_id):
+        keys = [('app', 'app')]
+        if page_id:
+            keys.append(('page', page_id))
+        keys.append(('token', token_fingerprint(token)[:12]))
+        return keys
+
+    def acquire(self, token, page_id=None, cost=1):
+        """Block until the app, page and token buckets all allow a request of this cost"""
+        if not getattr(settings, 'FACEBOOK_RATE_LIMIT_ENABLED', True):
+            return
+        for scope, key in self._keys(token, page_id):
+            while True:
+                with self._lock:
+                    wait = self._bucket(scope, key).try_acquire(cost)
+                if not wait:
+                    break
+                self.sleep(wait)
+
+    def _set_usage(self, bucket, percent, regain_minutes=0):
+        slowdown_at = getattr(settings, 'FACEBOOK_RATE_LIMIT_SLOWDOWN_AT', 50)
+        min_factor = getattr(settings, 'FACEBOOK_RATE_LIMIT_MIN_FACTOR', 0.05)
+        bucket.usage = percent
+        if percent <= slowdown_at:
+            factor = 1.0
+        else:
+            factor = max(min_factor, (100 - percent) / (100 - slowdown_at))
+        bucket.rate = bucket.base_rate * factor
+        if regain_minutes:
+            bucket.pause(regain_minutes * 60)
+
+    def observe(self, headers, token, page_id=None):
+        """Adjust bucket rates from the usage headers of a Graph API response"""
+        app_usage = _parse_usage_header(headers.get('X-App-Usage'))
+        page_usage = _parse_usage_header(headers.get('X-Page-Usage'))
+        business_usage = _parse_usage_header(headers.get('X-Business-Use-Case-Usage'))
+        if not (app_usage or page_usage or business_usage):
+            return
+
+        keys = dict(self._keys(token, page_id))
+        page_scope = ('page', keys['page']) if page_id else ('token', keys['token'])
+        with self._lock:
+            if app_usage:
+                self._set_usage(self._bucket('app', 'app'), usage_percent(app_usage))
+            if page_usage:
+                self._set_usage(self._bucket(*page_scope), usage_percent(page_usage))
+            if business_usage:
+                entries = [entry for values in business_usage.values() for entry in values]
+                if entries:
+                    self._set_usage(
+                        self._bucket(*page_scope),
+                        max(usage_percent(entry) for entry in entries),
+                        max(entry.get('estimated_time_to_regain_access') or 0 for entry in entries),
+                    )
+
+    def throttled(self, error, token, page_id=None):
+        """Pause the bucket a throttling error applies to and return the backoff in seconds"""
+        base, cap = getattr(settings, 'FACEBOOK_RATE_LIMIT_BACKOFF', (1.0, 60.0))
+        scope = THROTTLE_SCOPES.get(error.get('code'), 'token')
+        keys = dict(self._keys(token, page_id))
+        if scope == 'page' and not page_id:
+            scope = 'token'
+        with self._lock:
+            bucket = self._bucket(scope, keys[scope])
+            bucket.throttled += 1
+            bucket.backoff_level += 1
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            delay = random.uniform(0, min(cap, base * 2 ** bucket.backoff_level))
+            bucket.pause(delay)
+        return delay
+
+    def succeeded(self, token, page_id=None):
+        """Reset the backoff of every bucket a successful request went through"""
+        with self._lock:
+            for scope, key in self._keys(token, page_id):
+                bucket = self._buckets.get((scope, key))
+                if bucket is not None:
+                    bucket.backoff_level = 0
+
+    def snapshot(self):
+        """Current usage, effective rate and throttle counts per app, page and token"""
+        with self._lock:
+            buckets = {(scope, key): bucket.snapshot() for (scope, key), bucket in self._buckets.items()}
+        return {
+            'app': buckets.get(('app', 'app')),
+            'pages': {key: entry for (scope, key), entry in buckets.items() if scope == 'page'},
+            'tokens': {key: entry for (scope, key), entry in buckets.items() if scope == 'token'},
+        }
+
+
+def _parse_usage_header(value):
+    """Decode a JSON usage header, ignoring missing or malformed values"""
+    if not value:
+        return None
+    try:
+        usage = json.loads(value)
+    except ValueError:
+        return None
+    return usage if isinstance(usage, dict) else None
+
+
+rate_governor = RateGovernor()
+
+class GraphAPIError(Exception):
+    """A Graph API request that failed
+
+    transient errors (timeouts, dropped connections, 5xx responses, errors
+    flagged is_transient, throttling, an open circuit) may succeed later;
+    anything else, such as a missing permission or an unsupported field,
+    will fail the same way if repeated.
+    """
+
+    def __init__(self, endpoint, message, status=None, error=None, transient=False):
+        super().__init__(f"{endpoint}: {message}")
+        self.endpoint = endpoint
+        self.status = status
+        self.error = error or {}
+        self.code = self.error.get('code')
+        self.transient = transient
+
+    @property
+    def throttled(self):
+        return is_throttle_error(self.error)
+
+
+# Graph API codes for temporary failures ("unknown error" and "service unavailable")
+TRANSIENT_ERROR_CODES = {1, 2}
+
+
+def is_transient_error(status, error):
+    """True if a failed response is worth retrying"""
+    return (
+        status >= 500
+        or bool(error.get('is_transient'))
+        or error.get('code') in TRANSIENT_ERROR_CODES
+        or is_throttle_error(error)
+    )
+
+
+def backoff_delay(attempt):
+    """Capped exponential backoff with full jitter for the given retry attempt (1-based)"""
+    base, cap = getattr(settings, 'FACEBOOK_API_BACKOFF', (0.5, 30.0))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Fail fast on an endpoint after repeated transient failures
+
+    After FACEBOOK_API_CIRCUIT_FAILURES consecutive transient failures the
+    circuit opens and requests fail immediately. Once
+    FACEBOOK_API_CIRCUIT_RESET_SECONDS have passed, one trial request is let
+    through: success closes the circuit, another failure re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+
+    def allow(self):
+        """Whether a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                # Let exactly one trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+    def snapshot(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures, 'opens': self.opens}
+
+
+class CircuitBreakers:
+    """One circuit breaker per endpoint (IDs collapsed, as in request_stats)"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def reset(self):
+        with self._lock:
+            self._breakers = {}
+
+    def get(self, endpoint):
+        key = endpoint_key(endpoint)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(
+                    getattr(settings, 'FACEBOOK_API_CIRCUIT_FAILURES', 5),
+                    getattr(settings, 'FACEBOOK_API_CIRCUIT_RESET_SECONDS', 30),
+                    self.clock,
+                )
+            return breaker
+
+    def snapshot(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {key: breaker.snapshot() for key, breaker in breakers.items()}
+
+
+circuit_breakers = CircuitBreakers()
+
+# Graph API accepts at most 50 sub-requests per batch call (and 50 IDs per ?ids= lookup)
+BATCH_SIZE_LIMIT = 50
+
+
+def to_unix_time(value):
+    """Convert a datetime watermark into the unix timestamp Graph `since` expects"""
+    return int(value.timestamp())
+
+
+FIELD_PROFILE_NAMES = ('minimal', 'standard', 'full')
+
+
+class FacebookGraphAPI:
+    POST_FIELDS = "id,message,created_time,story,reactions.summary(total_count),comments.summary(total_count),shares,likes.summary(total_count)"
+    POST_BASIC_FIELDS = "id,message,created_time,story,reactions.summary(total_count)"
+    COMMENT_FIELDS = "id,message,from{id,name,picture.type(large)},created_time,like_count,comment_count,parent,reactions{id,name,type}"
+    MESSAGE_FIELDS = "id,message,from{id,name,email,picture},to{data{id,name}},created_time,attachments{name,mime_type,file_url}"
+    CONVERSATION_FIELDS = "id,snippet,updated_time,message_count,unread_count,participants{id,name,email},can_reply"
+
+    # Fields requested per endpoint by each field profile. minimal asks for exactly
+    # what the sync stores (edge summaries with .limit(0) so no edge items come back),
+    # standard adds cheap context fields, full is everything we used to request.
+    FIELD_PROFILES = {
+        'posts': {
+            'minimal': "id,message,created_time,story,reactions.limit(0).summary(total_count),comments.limit(0).summary(total_count),shares,likes.limit(0).summary(total_count)",
+            'standard': "id,message,created_time,story,permalink_url,reactions.limit(0).summary(total_count),comments.limit(0).summary(total_count),shares,likes.limit(0).summary(total_count)",
+            'full': POST_FIELDS,
+        },
+        'comments': {
+            'minimal': "id,message,from{id,name},created_time",
+            'standard': "id,message,from{id,name},created_time,like_count,comment_count,parent{id}",
+            'full': COMMENT_FIELDS,
+        },
+        'conversations': {
+            'minimal': "id,updated_time",
+            'standard': "id,updated_time,message_count,participants{id,name}",
+            'full': CONVERSATION_FIELDS,
+        },
+        'messages': {
+            'minimal': "id,message,from{id,name},created_time,attachments{name}",
+            'standard': "id,message,from{id,name},to{data{id,name}},created_time,attachments{name,mime_type}",
+            'full': MESSAGE_FIELDS,
+        },
+    }
+
+    def __init__(self, session=None, field_profile=None):
         self.user_access_token = settings.FACEBOOK_ACCESS_TOKEN
         self.base_url = "https://graph.facebook.com/v19.0"
         self.page_tokens = {}  # Store page access tokens
+        self.session = session  # None means the shared pooled session
+        self.field_profile = field_profile or getattr(settings, 'FACEBOOK_SYNC_FIELD_PROFILE', 'minimal')
+        if self.field_profile not in FIELD_PROFILE_NAMES:
+            raise ValueError(f"Unknown field profile {self.field_profile!r}, expected one of {FIELD_PROFILE_NAMES}")
+        self.memo = LookupMemo()  # which fallback lookups work; the sync engine loads and saves it
+
+    def get_session(self):
+        """Session used for this client's requests"""
+        return self.session or get_http_session()
     
-    def make_request(self, endpoint, params=None, access_token=None):
-        """Make a request to Facebook Graph API with better error handling"""
+    def fields_for(self, endpoint):
+        """Fields to request from an endpoint ('posts', 'comments', ...) under this client's field profile"""
+        return self.FIELD_PROFILES[endpoint][self.field_profile]
+    
+    def make_request(self, endpoint, params=None, access_token=None, method='GET', cost=1):
+        """Make a request to Facebook Graph API, returning None if it fails (see request())"""
+        try:
+            return self.request(endpoint, params, access_token, method, cost)
+        except GraphAPIError:
+            return None
+    
+    def request(self, endpoint, params=None, access_token=None, method='GET', cost=1):
+        """Make a request to Facebook Graph API, raising GraphAPIError if it fails
+
+        Requests wait for the rate governor first. Throttled requests are
+        retried once the governor's backoff has passed, and other transient
+        failures are retried with capped exponential backoff; permanent errors
+        raise straight away. Endpoints that keep failing transiently trip a
+        circuit breaker and fail fast until it lets a trial request through.
+        cost is the number of Graph calls the request counts as (sub-requests
+        of a batch).
+        """
         if params is None:
             params = {}
         
         # Use provided access token or default user token
         token = access_token or self.user_access_token
         params['access_token'] = token
+        page_id = self.page_for_token(token)
+        breaker = circuit_breakers.get(endpoint)
+        max_throttle_retries = getattr(settings, 'FACEBOOK_RATE_LIMIT_MAX_RETRIES', 3)
+        max_retries = getattr(settings, 'FACEBOOK_API_MAX_RETRIES', 3)
+        throttled = failed = 0
         
+        while True:
+            if not breaker.allow():
+                raise GraphAPIError(endpoint, "circuit open after repeated failures", transient=True)
+            rate_governor.acquire(token, page_id, cost)
+            try:
+                data = self._send(endpoint, params, token, page_id, method)
+            except GraphAPIError as e:
+                if e.throttled:
+                    delay = rate_governor.throttled(e.error, token, page_id)
+                    throttled += 1
+                    if throttled > max_throttle_retries:
+                        logger.error("Still rate limited on %s after %d attempts", endpoint, throttled)
+                        raise
+                    logger.warning("Rate limited on %s (code %s), retrying in %.1fs", endpoint, e.code, delay)
+                    metrics.inc('facebook_graph_retries_total', endpoint=endpoint_key(endpoint), reason='throttled')
+                elif e.transient:
+                    breaker.record_failure()
+                    failed += 1
+                    if failed > max_retries or breaker.state == breaker.OPEN:
+                        raise
+                    delay = backoff_delay(failed)
+                    logger.warning("Transient error on %s, retry %d in %.1fs", endpoint, failed, delay)
+                    metrics.inc('facebook_graph_retries_total', endpoint=endpoint_key(endpoint), reason='transient')
+                    time.sleep(delay)
+                else:
+                    # The endpoint answered; the request itself is what's wrong
+                    breaker.record_success()
+                    raise
+            else:
+                breaker.record_success()
+                rate_governor.succeeded(token, page_id)
+                archive = get_archive()
+                if archive is not None and method == 'GET':
+                    # Batch POSTs are archived per sub-response by make_batch_request
+                    archive.record(endpoint, endpoint_key(endpoint), params, data)
+                return data
+    
+    def _send(self, endpoint, params, token, page_id, method):
+        """Send one HTTP request and return the parsed body, raising GraphAPIError on failure"""
+        start = time.perf_counter()
+        ok = False
+        size = 0
         try:
-            response = requests.get(f"{self.base_url}/{endpoint}", params=params)
+            url = f"{self.base_url}/{endpoint}"
+            if method == 'POST':
+                response = self.get_session().post(url, data=params, timeout=get_request_timeout())
+            else:
+                response = self.get_session().get(url, params=params, timeout=get_request_timeout())
+            metrics.observe('facebook_graph_request_seconds', time.perf_counter() - start, endpoint=endpoint_key(endpoint))
+            rate_governor.observe(response.headers, token, page_id)
+            size = len(response.content or b'')
             
-            if response.status_code == 400:
-                error_data = response.json()
-                print(f"API Error for {endpoint}: {error_data}")
-                return None
-            elif response.status_code == 403:
-                print(f"Permission denied for {endpoint}. Check your access token permissions.")
-                return None
+            if response.status_code >= 400:
+                try:
+                    error_data = response.json()
+                except ValueError:
+                    error_data = {}
+                error = error_data.get('error', {}) if isinstance(error_data, dict) else {}
+                transient = is_transient_error(response.status_code, error)
+                if response.status_code == 403 and not transient:
+                    logger.warning("Permission denied for %s. Check your access token permissions.", endpoint)
+                elif not is_throttle_error(error):
+                    logger.warning("API Error for %s: %s", endpoint, error_data or response.status_code)
+                raise GraphAPIError(
+                    endpoint, error.get('message') or f"HTTP {response.status_code}",
+                    status=response.status_code, error=error, transient=transient,
+                )
             
-            response.raise_for_status()
-            return response.json()
+            try:
+                with metrics.timer('facebook_graph_decode_seconds', endpoint=endpoint_key(endpoint)):
+                    data = response.json()
+            except ValueError:
+                # A truncated body is a network problem, not a bad request
+                raise GraphAPIError(endpoint, "invalid JSON response", status=response.status_code, transient=True)
+            ok = True
+            return data
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            logger.warning("Error making request to %s: %s", endpoint, e)
+            raise GraphAPIError(endpoint, str(e), transient=True)
         except requests.exceptions.RequestException as e:
-            print(f"Error making request to {endpoint}: {e}")
-            return None
+            logger.warning("Error making request to %s: %s", endpoint, e)
+            raise GraphAPIError(endpoint, str(e))
+        finally:
+            request_stats.record(endpoint, time.perf_counter() - start, ok, size, self.field_profile)
     
+    def page_for_token(self, token):
+        """Page ID a page access token belongs to, or None for the user token"""
+        for page_id, page_token in self.page_tokens.items():
+            if page_token == token:
+                return page_id
+        return None
+    
+    def make_batch_request(self, batch_requests, access_token=None, max_retries=2):
+        """Run GET sub-requests through Graph `batch` calls of up to 50 each
+
+        batch_requests is a list of (endpoint, params) tuples. Returns a list of
+        parsed response bodies in the same order, with None for sub-requests that
+        failed. Only sub-requests that failed transiently (timed out, 5xx, or
+        flagged is_transient) are retried; permission errors are not.
+        """
+        results = [None] * len(batch_requests)
+        pending = list(range(len(batch_requests)))
+
+        for attempt in range(max_retries + 1):
+            retry = []
+            for start in range(0, len(pending), BATCH_SIZE_LIMIT):
+                chunk = pending[start:start + BATCH_SIZE_LIMIT]
+                batch = []
+                for index in chunk:
+                    endpoint, params = batch_requests[index]
+                    relative_url = endpoint
+                    if params:
+                        relative_url = f"{endpoint}?{urlencode(params)}"
+                    batch.append({"method": "GET", "relative_url": relative_url})
+
+                try:
+                    responses = self.request("", {
+                        "batch": json.dumps(batch),
+                        "include_headers": "false",
+                    }, access_token, method='POST', cost=len(batch))
+                except GraphAPIError as e:
+                    if e.transient:
+                        # The whole HTTP call failed, so every sub-request in it is retryable
+                        retry.extend(chunk)
+                    continue
+
+                if not isinstance(responses, list):
+                    continue
+
+                throttle_error = None
+                archive = get_archive()
+                for index, sub_response in zip(chunk, responses):
+                    body, retryable = self._parse_batch_response(sub_response)
+                    if body is not None:
+                        results[index] = body
+                        if archive is not None:
+                            endpoint, params = batch_requests[index]
+                            archive.record(endpoint, endpoint_key(endpoint), params, body)
+                    elif retryable:
+                        retry.append(index)
+                        if isinstance(retryable, dict):
+                            throttle_error = retryable
+
+                if throttle_error:
+                    # Sub-requests were throttled: back off before the retry round
+                    token = access_token or self.user_access_token
+                    rate_governor.throttled(throttle_error, token, self.page_for_token(token))
+
+            if not retry:
+                break
+            pending = retry
+            if attempt < max_retries:
+                logger.info("Retrying %d failed batch sub-requests (attempt %d)", len(retry), attempt + 2)
+                for index in retry:
+                    metrics.inc('facebook_graph_retries_total', endpoint=endpoint_key(batch_requests[index][0]), reason='batch')
+
+        return results
+
+    def _parse_batch_response(self, sub_response):
+        """Return (body, retryable) for one entry of a batch response
+
+        retryable is the Graph error object itself when the sub-request was throttled.
+        """
+        if sub_response is None:
+            # Facebook returns null for sub-requests that did not complete in time
+            return None, True
+
+        code = sub_response.get('code', 500)
+        try:
+            body = json.loads(sub_response.get('body') or 'null')
+        except ValueError:
+            body = None
+
+        if code == 200 and body is not None:
+            return body, False
+
+        error = body.get('error', {}) if isinstance(body, dict) else {}
+        logger.warning("Batch sub-request failed with code %s: %s", code, error.get('message', ''))
+        if is_throttle_error(error):
+            # Retryable after backing off; the error tells the caller which bucket to pause
+            return None, error
+        return None, code >= 500 or bool(error.get('is_transient'))
+
+    def iter_collection(self, endpoint, params=None, access_token=None, first_page=None):
+        """Yield items from a paged Graph API edge, following paging.next cursor by cursor
+
+        first_page continues from a response the caller already has (e.g. from
+        a batch call). Only one page of results is held in memory at a time,
+        so callers can stop consuming as soon as they have what they need.
+        A page that can't be fetched raises GraphAPIError rather than ending
+        the stream, so callers never mistake a truncated edge for a complete one.
+        """
+        response = first_page
+        if response is None:
+            response = self.request(endpoint, dict(params or {}), access_token)
+
+        while response and 'data' in response:
+            yield from response['data']
+
+            next_url = response.get('paging', {}).get('next')
+            if not next_url or not response['data']:
+                return
+            endpoint, params = self._split_paging_url(next_url)
+            response = self.request(endpoint, params, access_token)
+
+    def _split_paging_url(self, url):
+        """Turn an absolute paging.next URL back into (endpoint, params) for make_request"""
+        parsed = urlparse(url)
+        endpoint = re.sub(r'^v\d+\.\d+/', '', parsed.path.lstrip('/'))
+        params = dict(parse_qsl(parsed.query))
+        params.pop('access_token', None)
+        return endpoint, params
+
     def get_page_access_token(self, page_id):
         """Get page access token for a specific page"""
         if page_id in self.page_tokens:
             return self.page_tokens[page_id]
         
-        # Get all pages with their access tokens
-        pages_data = self.make_request("me/accounts")
-        if pages_data and 'data' in pages_data:
-            for page in pages_data['data']:
-                if page['id'] == page_id:
-                    page_token = page.get('access_token')
-                    if page_token:
-                        self.page_tokens[page_id] = page_token
-                        print(f"Got page access token for {page_id}")
-                        return page_token
+        # Shared store first; a miss refreshes every page's token with one me/accounts call
+        page_token = get_page_token(self, page_id)
+        if page_token:
+            self.page_tokens[page_id] = page_token
+            logger.debug("Got page access token for %s", page_id)
+            return page_token
         
-        print(f"Could not get page access token for {page_id}")
+        logger.warning("Could not get page access token for %s", page_id)
         return None
     
     def get_pages(self):
@@ -64,111 +816,153 @@ class FacebookGraphAPI:
         page_token = self.get_page_access_token(page_id)
         return self.make_request(f"{page_id}", {"fields": fields}, page_token)
     
-    def get_page_posts_with_all_engagement(self, page_id, limit=25):
-        """Get posts with maximum available engagement data"""
-        fields = "id,message,created_time,story,reactions.summary(total_count),comments.summary(total_count),shares,likes.summary(total_count)"
+    def get_page_posts_with_all_engagement(self, page_id, limit=25, since=None):
+        """Get posts with maximum available engagement data, optionally only those newer than since"""
+        fields = self.fields_for('posts')
         params = {
             "fields": fields,
             "limit": limit
         }
+        if since:
+            params["since"] = to_unix_time(since)
         page_token = self.get_page_access_token(page_id)
         if not page_token:
             return None
         
-        print(f"Fetching posts with maximum engagement data for page {page_id}")
+        logger.debug("Fetching posts with maximum engagement data for page %s", page_id)
         result = self.make_request(f"{page_id}/posts", params, page_token)
         
         # If that fails, try with basic fields
         if not result:
-            print("Trying with basic engagement fields...")
-            fields = "id,message,created_time,story,reactions.summary(total_count)"
-            params = {"fields": fields, "limit": limit}
+            logger.info("Trying with basic engagement fields...")
+            params["fields"] = self.POST_BASIC_FIELDS
             result = self.make_request(f"{page_id}/posts", params, page_token)
         
         return result
     
-    def get_post_comments_with_enhanced_user_info(self, post_id, page_id, limit=100):
-        """Get comments with enhanced user information using multiple methods"""
+    def get_post_comments_with_enhanced_user_info(self, post_id, page_id, limit=100, since=None):
+        """Get comments with enhanced user information using multiple methods
+
+        Fallback methods only run when the previous one failed permanently
+        (e.g. a field needing a missing permission); a transient failure ends
+        the attempt rather than repeating it against a struggling endpoint.
+        """
         page_token = self.get_page_access_token(page_id)
         if not page_token:
             return None
     
-        print(f"Fetching comments with enhanced user info for post {post_id}")
-    
-        # Method 1: Try to get comments with reactions to extract user IDs
-        fields = "id,message,from{id,name,picture.type(large)},created_time,like_count,comment_count,parent,reactions{id,name,type}"
-        params = {
-            "fields": fields,
-            "limit": limit,
-            "order": "chronological"
-        }
-    
-        comments_data = self.make_request(f"{post_id}/comments", params, page_token)
-    
-        if comments_data and 'data' in comments_data:
-            print(f"Method 1 successful: Found {len(comments_data['data'])} comments")
-            return comments_data
+        try:
+            return self._fetch_comments_with_fallbacks(post_id, page_id, page_token, limit, since)
+        except GraphAPIError as e:
+            logger.warning("Comments for post %s failed transiently, not trying fallback methods: %s", post_id, e)
+            return None
     
-        # Method 2: Try with basic fields but include reactions
-        print("Method 1 failed, trying Method 2 with reactions...")
-        fields = "id,message,from,created_time,reactions.limit(1){id,name}"
-        params = {
-            "fields": fields,
-            "limit": limit
-        }
+    def _fetch_comments(self, post_id, params, access_token):
+        """One comment-fetch method: the response, or None if it failed permanently"""
+        try:
+            return self.request(f"{post_id}/comments", params, access_token)
+        except GraphAPIError as e:
+            if e.transient:
+                raise
+            return None
     
-        comments_data = self.make_request(f"{post_id}/comments", params, page_token)
+    # Comment fetch methods, most detailed first: (fields, extra params, use user token).
+    # Method 1 asks for the client's field profile.
+    COMMENT_METHODS = {
+        1: ('comments', {"order": "chronological"}, False),
+        2: ("id,message,from,created_time,reactions.limit(1){id,name}", {}, False),
+        3: (None, {}, False),
+        4: ("id,message,from{id,name},created_time", {}, True),
+    }
     
-        if comments_data and 'data' in comments_data:
-            print(f"Method 2 successful: Found {len(comments_data['data'])} comments")
-            return comments_data
+    def comment_memo_key(self, page_id, token):
+        return f"{page_id}:{token_fingerprint(token)[:12]}"
     
-        # Method 3: Try to get comment IDs and fetch individual comments
-        print("Method 2 failed, trying Method 3 with individual comment fetching...")
-        params = {"limit": limit}
+    def comment_method_for_page(self, page_id, page_token):
+        """Comment fetch method known to work for this page and token, or None"""
+        method = self.memo.get(FacebookLookupMemo.COMMENT_METHOD, self.comment_memo_key(page_id, page_token))
+        return int(method) if method else None
     
-        comments_data = self.make_request(f"{post_id}/comments", params, page_token)
+    def comment_method_params(self, method, limit):
+        fields, extra, _ = self.COMMENT_METHODS[method]
+        if method == 1:
+            fields = self.fields_for(fields)
+        params = {"limit": limit, **extra}
+        if fields:
+            params["fields"] = fields
+        return params
     
-        if comments_data and 'data' in comments_data:
-            print(f"Method 3 successful: Found {len(comments_data['data'])} comments")
+    def _fetch_comments_with_fallbacks(self, post_id, page_id, page_token, limit, since):
+        """Try each comment-fetch method in turn; raises GraphAPIError on a transient failure
+
+        The method remembered as working for this page and token goes first,
+        and whichever method succeeds is remembered for next time.
+        """
+        logger.debug("Fetching comments with enhanced user info for post %s", post_id)
+        # Every method only asks for comments newer than the post's watermark
+        since_params = {"since": to_unix_time(since)} if since else {}
         
-            # Try to enhance each comment individually
-            for comment in comments_data['data']:
-                if not comment.get('from') or not comment.get('from', {}).get('name'):
-                    comment_id = comment['id']
-                    print(f"Trying to get individual comment data for {comment_id}")
-                
-                    # Try to get individual comment with user info
-                    individual_comment = self.make_request(f"{comment_id}", {
-                        "fields": "id,message,from{id,name},created_time"
-                    }, page_token)
-                
-                    if individual_comment and individual_comment.get('from'):
-                        comment['from'] = individual_comment['from']
-                        print(f"✅ Enhanced comment {comment_id} with user info")
+        known = self.comment_method_for_page(page_id, page_token)
+        methods = sorted(self.COMMENT_METHODS)
+        if known:
+            methods.remove(known)
+            methods.insert(0, known)
         
+        for method in methods:
+            use_user_token = self.COMMENT_METHODS[method][2]
+            token = self.user_access_token if use_user_token else page_token
+            params = {**self.comment_method_params(method, limit), **since_params}
+            
+            comments_data = self._fetch_comments(post_id, params, token)
+            if not comments_data or 'data' not in comments_data:
+                logger.info("Comment method %d failed for post %s, trying the next method", method, post_id)
+                continue
+            
+            logger.debug("Comment method %d found %d comments on post %s", method, len(comments_data['data']), post_id)
+            if method == 3:
+                # Try to enhance each comment individually
+                for comment in comments_data['data']:
+                    if not comment.get('from') or not comment.get('from', {}).get('name'):
+                        comment_id = comment['id']
+                        logger.debug("Trying to get individual comment data for %s", comment_id)
+                    
+                        # Try to get individual comment with user info
+                        individual_comment = self.make_request(f"{comment_id}", {
+                            "fields": "id,message,from{id,name},created_time"
+                        }, page_token)
+                    
+                        if individual_comment and individual_comment.get('from'):
+                            comment['from'] = individual_comment['from']
+                            logger.debug("Enhanced comment %s with user info", comment_id)
+            
+            self.memo.remember(
+                FacebookLookupMemo.COMMENT_METHOD, self.comment_memo_key(page_id, page_token), str(method)
+            )
             return comments_data
     
-        # Method 4: Try with user access token
-        print("Method 3 failed, trying Method 4 with user token...")
-        fields = "id,message,from{id,name},created_time"
-        params = {
-            "fields": fields,
-            "limit": limit
-        }
-    
-        comments_data = self.make_request(f"{post_id}/comments", params, self.user_access_token)
-    
-        if comments_data and 'data' in comments_data:
-            print(f"Method 4 successful: Found {len(comments_data['data'])} comments")
-            return comments_data
-    
-        print("All methods failed to get comments")
+        logger.warning("All methods failed to get comments for post %s", post_id)
         return None
 
+    # Field sets tried for user profile lookups, most detailed first
+    PROFILE_FIELD_SETS = [
+        "id,name,picture.type(large)",
+        "id,name,picture",
+        "id,name",
+        "name",
+    ]
     
     def get_user_profile_info(self, user_id, page_id):
-        """Get detailed user profile information"""
+        """Get detailed user profile information
+
+        Users that no token/field combination could resolve are remembered
+        and skipped until the memo entry expires, and the combination that
+        last worked for the page is tried first.
+        """
+        user_key = f"{page_id}:{user_id}"
+        if self.memo.has(FacebookLookupMemo.UNRESOLVABLE_USER, user_key):
+            logger.debug("Skipping user %s, known to be unresolvable", user_id)
+            return None
+        
         page_token = self.get_page_access_token(page_id)
         
         # Try multiple methods to get user info
@@ -176,36 +970,70 @@ class FacebookGraphAPI:
             {"token": page_token, "name": "page token"},
             {"token": self.user_access_token, "name": "user token"}
         ]
+        attempts = [
+            (method, fields)
+            for method in methods if method["token"]
+            for fields in self.PROFILE_FIELD_SETS
+        ]
+        known = self.memo.get(FacebookLookupMemo.PROFILE_METHOD, page_id)
+        attempts.sort(key=lambda attempt: f"{attempt[0]['name']}|{attempt[1]}" != known)
         
-        for method in methods:
-            if not method["token"]:
+        for method, fields in attempts:
+            logger.debug("Trying to get user %s info with %s (%s)", user_id, method['name'], fields)
+            try:
+                user_info = self.request(f"{user_id}", {"fields": fields}, method["token"])
+            except GraphAPIError as e:
+                if e.transient:
+                    # Not the user's fault: don't remember them as unresolvable
+                    logger.warning("Could not get user info for %s right now: %s", user_id, e)
+                    return None
                 continue
-                
-            print(f"Trying to get user {user_id} info with {method['name']}")
-            
-            # Try different field combinations
-            field_combinations = [
-                "id,name,picture.type(large)",
-                "id,name,picture",
-                "id,name",
-                "name"
-            ]
-            
-            for fields in field_combinations:
-                try:
-                    user_info = self.make_request(f"{user_id}", {"fields": fields}, method["token"])
-                    if user_info and user_info.get('name'):
-                        print(f"✅ Got user info for {user_id}: {user_info.get('name')}")
-                        return user_info
-                except:
-                    continue
+            if user_info and user_info.get('name'):
+                logger.debug("Got user info for %s", user_id)
+                self.memo.remember(FacebookLookupMemo.PROFILE_METHOD, page_id, f"{method['name']}|{fields}")
+                return user_info
         
-        print(f"❌ Could not get user info for {user_id}")
+        logger.info("Could not get user info for %s, remembering it as unresolvable", user_id)
+        self.memo.remember(FacebookLookupMemo.UNRESOLVABLE_USER, user_key)
         return None
     
+    def get_user_profiles(self, user_ids, page_id, fields="id,name"):
+        """Resolve many users with ?ids= lookups (50 per call), returns {user_id: profile}
+
+        Users already known to be unresolvable are skipped. Graph fails a whole
+        ?ids= call when any one ID in it is inaccessible, so a chunk that fails
+        permanently is resolved user by user instead, which remembers the dead
+        IDs so the next bulk lookup leaves them out.
+        """
+        user_ids = [
+            user_id for user_id in user_ids
+            if not self.memo.has(FacebookLookupMemo.UNRESOLVABLE_USER, f"{page_id}:{user_id}")
+        ]
+        page_token = self.get_page_access_token(page_id)
+        profiles = {}
+        for start in range(0, len(user_ids), BATCH_SIZE_LIMIT):
+            chunk = user_ids[start:start + BATCH_SIZE_LIMIT]
+            logger.debug("Resolving %d users in one lookup", len(chunk))
+            try:
+                result = self.request("", {"ids": ",".join(chunk), "fields": fields}, page_token)
+            except GraphAPIError as e:
+                if e.transient:
+                    # Leave them unresolved; the next sync will try again
+                    continue
+                result = {}
+                for user_id in chunk:
+                    user_info = self.get_user_profile_info(user_id, page_id)
+                    if user_info:
+                        result[user_id] = user_info
+            profiles.update(
+                (user_id, profile) for user_id, profile in (result or {}).items()
+                if isinstance(profile, dict) and profile.get('name')
+            )
+        return profiles
+    
     def get_page_conversations_with_details(self, page_id, limit=25):
         """Get conversations with detailed participant information"""
-        fields = "id,snippet,updated_time,message_count,unread_count,participants{id,name,email},can_reply"
+        fields = self.fields_for('conversations')
         params = {
             "fields": fields,
             "limit": limit
@@ -214,12 +1042,12 @@ class FacebookGraphAPI:
         if not page_token:
             return None
         
-        print(f"Fetching detailed conversations for page {page_id}")
+        logger.debug("Fetching detailed conversations for page %s", page_id)
         return self.make_request(f"{page_id}/conversations", params, page_token)
     
     def get_conversation_messages_with_full_details(self, conversation_id, page_id, limit=50):
         """Get messages with complete sender information"""
-        fields = "id,message,from{id,name,email,picture},to{data{id,name}},created_time,attachments{name,mime_type,file_url}"
+        fields = self.fields_for('messages')
         params = {
             "fields": fields,
             "limit": limit
@@ -228,9 +1056,108 @@ class FacebookGraphAPI:
         if not page_token:
             return None
         
-        print(f"Fetching detailed messages for conversation {conversation_id}")
+        logger.debug("Fetching detailed messages for conversation %s", conversation_id)
         return self.make_request(f"{conversation_id}/messages", params, page_token)
     
+    def get_post_comments_batch(self, post_ids, page_id, limit=100, since=None):
+        """Get comments for many posts in batch calls, returns {post_id: comments_data}
+
+        since optionally maps post_id to a watermark datetime; only newer
+        comments are requested for those posts.
+        """
+        page_token = self.get_page_access_token(page_id)
+        if not page_token or not post_ids:
+            return {}
+        since = since or {}
+
+        # Batch with the page's known-good method; methods needing a different
+        # token or follow-up requests go through the one-by-one fetch instead
+        method = self.comment_method_for_page(page_id, page_token) or 1
+        if method not in (1, 2):
+            return {
+                post_id: self.get_post_comments_with_enhanced_user_info(
+                    post_id, page_id, limit, since=since.get(post_id)
+                )
+                for post_id in post_ids
+            }
+
+        logger.debug("Batch fetching comments for %d posts", len(post_ids))
+        batch_requests = []
+        for post_id in post_ids:
+            params = self.comment_method_params(method, limit)
+            if since.get(post_id):
+                params["since"] = to_unix_time(since[post_id])
+            batch_requests.append((f"{post_id}/comments", params))
+        results = self.make_batch_request(batch_requests, page_token)
+
+        comments = {}
+        for post_id, comments_data in zip(post_ids, results):
+            if comments_data and 'data' in comments_data:
+                comments[post_id] = comments_data
+            else:
+                # Fall back to the multi-method fetch for posts the batch could not serve
+                comments[post_id] = self.get_post_comments_with_enhanced_user_info(
+                    post_id, page_id, limit, since=since.get(post_id)
+                )
+        return comments
+
+    def get_conversation_messages_batch(self, conversation_ids, page_id, limit=50):
+        """Get messages for many conversations in batch calls, returns {conversation_id: messages_data}"""
+        page_token = self.get_page_access_token(page_id)
+        if not page_token or not conversation_ids:
+            return {}
+
+        logger.debug("Batch fetching messages for %d conversations", len(conversation_ids))
+        params = {"fields": self.fields_for('messages'), "limit": limit}
+        results = self.make_batch_request(
+            [(f"{conversation_id}/messages", params) for conversation_id in conversation_ids], page_token
+        )
+        return dict(zip(conversation_ids, results))
+
+    def iter_page_posts(self, page_id, limit=100, since=None):
+        """Stream a page's posts (newest first) with engagement, across all result pages"""
+        first_page = self.get_page_posts_with_all_engagement(page_id, limit, since=since)
+        if not first_page:
+            return
+        page_token = self.get_page_access_token(page_id)
+        yield from self.iter_collection(f"{page_id}/posts", access_token=page_token, first_page=first_page)
+
+    def iter_post_comments(self, post_id, page_id, limit=100, first_page=None, since=None):
+        """Stream all comments on a post, optionally continuing from an already fetched first page"""
+        if first_page is None:
+            first_page = self.get_post_comments_with_enhanced_user_info(post_id, page_id, limit, since=since)
+        if not first_page:
+            return
+        page_token = self.get_page_access_token(page_id)
+        yield from self.iter_collection(f"{post_id}/comments", access_token=page_token, first_page=first_page)
+
+    def iter_page_conversations(self, page_id, limit=25):
+        """Stream a page's conversations, most recently updated first"""
+        first_page = self.get_page_conversations_with_details(page_id, limit)
+        if not first_page:
+            return
+        page_token = self.get_page_access_token(page_id)
+        yield from self.iter_collection(f"{page_id}/conversations", access_token=page_token, first_page=first_page)
+
+    def iter_conversation_messages(self, conversation_id, page_id, limit=50, first_page=None):
+        """Stream a conversation's messages (newest first), optionally from an already fetched first page"""
+        if first_page is None:
+            first_page = self.get_conversation_messages_with_full_details(conversation_id, page_id, limit)
+        if not first_page:
+            return
+        page_token = self.get_page_access_token(page_id)
+        yield from self.iter_collection(f"{conversation_id}/messages", access_token=page_token, first_page=first_page)
+
+    def get_objects_by_ids(self, ids, fields, access_token=None):
+        """Look up many objects with ?ids=a,b,c (50 per call), returns {id: object}"""
+        objects = {}
+        for start in range(0, len(ids), BATCH_SIZE_LIMIT):
+            chunk = ids[start:start + BATCH_SIZE_LIMIT]
+            result = self.make_request("", {"ids": ",".join(chunk), "fields": fields}, access_token)
+            if result:
+                objects.update(result)
+        return objects
+
     def get_missing_permissions_info(self):
         """Get information about what permissions are missing"""
         current_permissions = self.get_my_permissions()
@@ -0,0 +1,326 @@
+"""
+Offline stand-in for the Graph API.
+
+FakeGraph is a drop-in for the requests session the Graph client uses: install
+it with `set_http_session(FakeGraph(...))` (or pass it as a client's session)
+and every GET, `?ids=` lookup and batch POST is answered from deterministic
+synthetic data instead of graph.facebook.com. Volume, page size, latency,
+error rate and throttling are configurable, so `manage.py benchsync` and the
+tests can exercise the full sync engine without a Facebook token.
+"""
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+import requests
+
+
+# Every page, post, comment and user ID starts with this, so synthetic rows can be told apart
+FAKE_ID_PREFIX = '990000'
+
+GRAPH_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S+0000'
+
+
+def requested_fields(fields):
+    """Top-level field names of a Graph `fields` parameter, e.g. 'id,from{id,name},comments.limit(0)'"""
+    names = set()
+    depth = 0
+    current = ''
+    for char in fields or '':
+        if char in '{(':
+            depth += 1
+        elif char in '})':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            names.add(current)
+            current = ''
+            continue
+        if depth == 0 and char not in '})':
+            current += char
+    names.add(current)
+    return {name.split('.')[0].strip() for name in names if name.strip()}
+
+
+class FakeGraphResponse:
+    """The parts of requests.Response the Graph client reads"""
+
+    def __init__(self, status_code, body, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = json.dumps(body).encode()
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error from fake Graph API", response=self)
+
+
+class FakeGraph:
+    """Synthetic Graph API with pages of posts, comments, conversations and messages
+
+    Each page has `posts` posts with `comments` comments each and
+    `conversations` conversations with `messages` messages each. A
+    `nameless_ratio` share of commenters come without a name, as when Facebook
+    hides it, and are resolvable through an `?ids=` lookup. Every HTTP request
+    sleeps `latency` seconds; `error_rate` and `throttle_rate` are the chances
+    that a request (or batch sub-request) fails transiently or is rate limited.
+    `usage` adds an X-App-Usage header reporting that percentage of the app
+    limit to successful responses.
+    """
+
+    def __init__(self, pages=2, posts=50, comments=20, conversations=20, messages=20, nameless_ratio=0.1,
+                 users=500, latency=0.0, error_rate=0.0, throttle_rate=0.0, usage=None, seed=0, now=None,
+                 sleep=time.sleep):
+        self.pages = pages
+        self.posts = posts
+        self.comments = comments
+        self.conversations = conversations
+        self.messages = messages
+        self.nameless_ratio = nameless_ratio
+        self.users = max(users, 1)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.usage = usage
+        self.now = int(now if now is not None else time.time())
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.sub_requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    # -- IDs and volume -------------------------------------------------------
+
+    def page_ids(self):
+        return [f"{FAKE_ID_PREFIX}1{i:05d}" for i in range(self.pages)]
+
+    def user_id(self, n):
+        return f"{FAKE_ID_PREFIX}2{n % self.users:05d}"
+
+    def expected_counts(self):
+        """Rows a complete sync of this data set stores"""
+        return {
+            'pages': self.pages,
+            'posts': self.pages * self.posts,
+            'comments': self.pages * self.posts * self.comments,
+            'messages': self.pages * self.conversations * self.messages,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests, 'sub_requests': self.sub_requests,
+                'errors': self.errors, 'throttled': self.throttled,
+            }
+
+    # -- session interface ----------------------------------------------------
+
+    def get(self, url, params=None, timeout=None):
+        return self._handle(lambda: self._serve(self._path(url), dict(params or {})))
+
+    def post(self, url, data=None, timeout=None):
+        data = dict(data or {})
+        if 'batch' not in data:
+            return self._handle(lambda: self._error(400, 100, "Unsupported post request"))
+        return self._handle(lambda: (200, self._serve_batch(json.loads(data['batch']))))
+
+    def _handle(self, serve):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            self.sleep(self.latency)
+        status, body = self._injected_failure() or serve()
+        headers = {}
+        if self.usage is not None and status == 200:
+            headers['X-App-Usage'] = json.dumps({'call_count': self.usage, 'total_cputime': 0, 'total_time': 0})
+        return FakeGraphResponse(status, body, headers)
+
+    def _injected_failure(self):
+        with self._lock:
+            roll = self._random.random()
+            if roll < self.throttle_rate:
+                self.throttled += 1
+                return self._error(400, 4, "Application request limit reached")
+            if roll < self.throttle_rate + self.error_rate:
+                self.errors += 1
+                return self._error(500, 2, "Service temporarily unavailable", transient=True)
+        return None
+
+    def _serve_batch(self, batch):
+        responses = []
+        for sub_request in batch:
+            with self._lock:
+                self.sub_requests += 1
+            parsed = urlparse(sub_request['relative_url'])
+            status, body = self._injected_failure() or self._serve(parsed.path, dict(parse_qsl(parsed.query)))
+            responses.append({'code': status, 'headers': [], 'body': json.dumps(body)})
+        return responses
+
+    @staticmethod
+    def _path(url):
+        return re.sub(r'^v\d+\.\d+/', '', urlparse(url).path.lstrip('/'))
+
+    @staticmethod
+    def _error(status, code, message, transient=False):
+        return status, {'error': {'message': message, 'type': 'OAuthException', 'code': code,
+                                  'is_transient': transient}}
+
+    # -- routing --------------------------------------------------------------
+
+    def _serve(self, path, params):
+        path = path.strip('/')
+        fields = requested_fields(params.get('fields'))
+        if path == '' and params.get('ids'):
+            return 200, self._lookup(params['ids'].split(','), fields)
+        if path == 'me/accounts':
+            return 200, {'data': [
+                {'id': page_id, 'name': f"Fake page {i}", 'access_token': f"fake-page-token-{i}", 'category': 'Fake'}
+                for i, page_id in enumerate(self.page_ids())
+            ]}
+        if path == 'me/permissions':
+            return 200, {'data': [
+                {'permission': permission, 'status': 'granted'}
+                for permission in ('pages_read_engagement', 'pages_messaging', 'pages_read_user_content',
+                                   'read_insights', 'pages_show_list')
+            ]}
+        if path == 'debug_token':
+            return 200, {'data': {'is_valid': True, 'expires_at': 0}}
+
+        parts = path.split('/')
+        page_ids = self.page_ids()
+        if len(parts) == 1 and parts[0] in page_ids:
+            return 200, self._page(parts[0], page_ids.index(parts[0]))
+        if len(parts) == 2:
+            edge = {
+                'posts': self._posts, 'comments': self._comments,
+                'conversations': self._conversations, 'messages': self._messages,
+            }.get(parts[1])
+            items = edge(parts[0]) if edge else None
+            if items is not None:
+                return 200, self._collection(path, params, items, fields)
+        return self._error(400, 100, f"Unsupported get request: {path}")
+
+    def _collection(self, path, params, items, fields):
+        """One page of an edge, newest first, honouring since, limit and the after cursor"""
+        if params.get('since'):
+            since = int(params['since'])
+            items = [item for item in items if item['_timestamp'] >= since]
+        limit = int(params.get('limit') or 25)
+        offset = int(params.get('after') or 0)
+        body = {'data': [self._select(item, fields) for item in items[offset:offset + limit]]}
+        if offset + limit < len(items):
+            query = {key: value for key, value in params.items() if key != 'access_token'}
+            query['after'] = offset + limit
+            body['paging'] = {
+                'cursors': {'after': str(offset + limit)},
+                'next': f"https://graph.facebook.com/v19.0/{path}?{urlencode(query)}&access_token=fake",
+            }
+        return body
+
+    def _lookup(self, ids, fields):
+        objects = {}
+        for object_id in ids:
+            obj = self._object(object_id)
+            if obj is not None:
+                objects[object_id] = self._select(obj, fields)
+        return objects
+
+    @staticmethod
+    def _select(obj, fields):
+        return {key: value for key, value in obj.items()
+                if not key.startswith('_') and (not fields or key in fields or key == 'id')}
+
+    # -- synthetic objects ----------------------------------------------------
+
+    def _time(self, seconds_ago):
+        timestamp = self.now - seconds_ago
+        return timestamp, datetime.fromtimestamp(timestamp, tz=dt_timezone.utc).strftime(GRAPH_TIME_FORMAT)
+
+    def _page(self, page_id, index):
+        return {'id': page_id, 'name': f"Fake page {index}", 'category': 'Fake',
+                'followers_count': 1000 * (index + 1), 'fan_count': 1000 * (index + 1)}
+
+    def _user(self, user_id):
+        return {'id': user_id, 'name': f"Fake user {user_id[-5:]}"}
+
+    def _object(self, object_id):
+        if object_id.startswith(f"{FAKE_ID_PREFIX}2"):
+            return self._user(object_id)
+        page_id, _, post = object_id.partition('_')
+        if page_id in self.page_ids() and post.isdigit() and int(post) < self.posts:
+            return self._post(page_id, int(post))
+        return None
+
+    def _post(self, page_id, index):
+        timestamp, created_time = self._time(index * 3600 + 60)
+        return {
+            'id': f"{page_id}_{index}", '_timestamp': timestamp, 'created_time': created_time,
+            'message': f"Fake post {index} on page {page_id}",
+            'permalink_url': f"https://www.facebook.com/{page_id}/posts/{index}",
+            'reactions': {'data': [], 'summary': {'total_count': index % 97}},
+            'likes': {'data': [], 'summary': {'total_count': index % 89}},
+            'comments': {'data': [], 'summary': {'total_count': self.comments}},
+            'shares': {'count': index % 13},
+        }
+
+    def _posts(self, page_id):
+        if page_id not in self.page_ids():
+            return None
+        return [self._post(page_id, index) for index in range(self.posts)]
+
+    def _comments(self, post_id):
+        page_id, _, post = post_id.partition('_')
+        if page_id not in self.page_ids() or not post.isdigit():
+            return None
+        comments = []
+        for index in range(self.comments):
+            number = int(post) * self.comments + index
+            user = self._user(self.user_id(number))
+            if (number * 7919) % 1000 < self.nameless_ratio * 1000:
+                user = {'id': user['id']}
+            timestamp, created_time = self._time(index * 60)
+            comments.append({
+                'id': f"{post_id}_{index}", '_timestamp': timestamp, 'created_time': created_time,
+                'message': f"Fake comment {index}", 'from': user,
+                'like_count': index % 7, 'comment_count': 0,
+            })
+        return comments
+
+    def _conversations(self, page_id):
+        if page_id not in self.page_ids():
+            return None
+        conversations = []
+        for index in range(self.conversations):
+            user = self._user(self.user_id(index))
+            timestamp, updated_time = self._time(index * 3600)
+            conversations.append({
+                'id': f"t_{page_id}_{index}", '_timestamp': timestamp, 'updated_time': updated_time,
+                'message_count': self.messages,
+                'participants': {'data': [user, {'id': page_id, 'name': 'Fake page'}]},
+            })
+        return conversations
+
+    def _messages(self, conversation_id):
+        match = re.fullmatch(r't_(\d+)_(\d+)', conversation_id)
+        if not match or match.group(1) not in self.page_ids():
+            return None
+        page_id, conversation = match.group(1), int(match.group(2))
+        user = self._user(self.user_id(conversation))
+        page = {'id': page_id, 'name': 'Fake page'}
+        messages = []
+        for index in range(self.messages):
+            timestamp, created_time = self._time(conversation * 3600 + index * 60)
+            sender, recipient = (user, page) if index % 2 == 0 else (page, user)
+            messages.append({
+                'id': f"m_{page_id}_{conversation}_{index}", '_timestamp': timestamp, 'created_time': created_time,
+                'message': f"Fake message {index}", 'from': sender, 'to': {'data': [recipient]},
+            })
+        return messages
@@ -0,0 +1,80 @@
+"""
+Commenter and sender identities.
+
+Comments and messages point at a shared FacebookUser row, so a name that
+gets resolved once fixes every row that person wrote. Names are looked up
+in an in-process LRU first, then in the FacebookUser table, and whatever is
+still unknown is resolved from Facebook in bulk with `?ids=` lookups.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import FacebookUser
+
+
+# Keys per `IN (...)` lookup when reading stored identities
+LOOKUP_CHUNK = 500
+
+
+class IdentityCache:
+    """Thread-safe LRU of user_id -> resolved name"""
+
+    def __init__(self, maxsize=None):
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._names = OrderedDict()
+
+    @property
+    def maxsize(self):
+        return self._maxsize or getattr(settings, 'FACEBOOK_USER_CACHE_SIZE', 10000)
+
+    def get_many(self, user_ids):
+        """Cached names for whichever of the user IDs are known, as {user_id: name}"""
+        found = {}
+        with self._lock:
+            for user_id in user_ids:
+                name = self._names.get(user_id)
+                if name is not None:
+                    self._names.move_to_end(user_id)
+                    found[user_id] = name
+        return found
+
+    def put_many(self, names):
+        with self._lock:
+            for user_id, name in names.items():
+                self._names[user_id] = name
+                self._names.move_to_end(user_id)
+            while len(self._names) > self.maxsize:
+                self._names.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._names.clear()
+
+    def __len__(self):
+        return len(self._names)
+
+
+identity_cache = IdentityCache()
+
+
+def load_user_names(user_ids):
+    """Stored names of resolved users among user_ids, as {user_id: name}"""
+    user_ids = list(user_ids)
+    names = {}
+    for start in range(0, len(user_ids), LOOKUP_CHUNK):
+        names.update(
+            FacebookUser.objects
+            .filter(user_id__in=user_ids[start:start + LOOKUP_CHUNK], resolved=True)
+            .values_list('user_id', 'name')
+        )
+    return names
+
+
+def keep_resolved_name(user, stored):
+    """Upsert merge rule: an unresolved placeholder never replaces a name Facebook gave us"""
+    if stored['resolved'] and not user.resolved:
+        user.name = stored['name']
+        user.resolved = True
@@ -0,0 +1,103 @@
+"""
+Database-backed job queue for Facebook syncs.
+
+Views enqueue a SyncJob row and return immediately; `manage.py runsyncworker`
+claims queued jobs one at a time and runs the sync engine, reporting progress
+back onto the job row. No broker is needed, only the app database.
+"""
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .metrics import diff_snapshots, metrics
+from .models import SyncJob
+from .sync import FacebookSyncEngine
+
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    """Identify this worker process in SyncJob.worker"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_sync_job():
+    """Queue a sync unless one is already queued or running, returns (job, created)"""
+    with transaction.atomic():
+        active = SyncJob.objects.filter(status__in=[SyncJob.QUEUED, SyncJob.RUNNING]).order_by('created_at').first()
+        if active:
+            return active, False
+        return SyncJob.objects.create(), True
+
+
+def fail_stale_jobs():
+    """Mark running jobs whose worker stopped reporting as failed so they don't block the queue"""
+    stale_after = timedelta(minutes=getattr(settings, 'FACEBOOK_SYNC_JOB_STALE_MINUTES', 30))
+    cutoff = timezone.now() - stale_after
+    return SyncJob.objects.filter(status=SyncJob.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=SyncJob.FAILED, finished_at=timezone.now(), error="Worker stopped reporting progress"
+    )
+
+
+def claim_next_job(worker=None):
+    """Atomically move the oldest queued job to running, returns it or None"""
+    job = SyncJob.objects.filter(status=SyncJob.QUEUED).order_by('created_at').first()
+    if job is None:
+        return None
+
+    now = timezone.now()
+    # The status guard makes the claim safe when several workers poll at once
+    claimed = SyncJob.objects.filter(pk=job.pk, status=SyncJob.QUEUED).update(
+        status=SyncJob.RUNNING, started_at=now, heartbeat_at=now, worker=worker or worker_name()
+    )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def report_progress(job, counts):
+    """Copy engine counters onto the job row (runs on the sync writer thread)"""
+    SyncJob.objects.filter(pk=job.pk).update(
+        pages_processed=counts['pages'],
+        posts_processed=counts['posts'],
+        comments_processed=counts['comments'],
+        messages_processed=counts['messages'],
+        heartbeat_at=timezone.now(),
+    )
+
+
+def run_sync_job(job, engine=None):
+    """Run the sync for a claimed job and record the outcome"""
+    engine = engine or FacebookSyncEngine()
+    engine.progress = lambda counts: report_progress(job, counts)
+    # The worker runs one job at a time, so everything recorded meanwhile is this job's
+    metrics_before = metrics.snapshot()
+
+    try:
+        result = engine.run()
+    except Exception as e:
+        logger.exception("Sync job %s failed", job.pk)
+        job.status = SyncJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = SyncJob.SUCCEEDED
+        job.result = {
+            'writes': result['writes'],
+            'errors': result['errors'],
+            'rate_limits': result['rate_limits'],
+            'circuits': result['circuits'],
+            'missing_permissions': [p['permission'] for p in result['permission_info']['missing']],
+        }
+
+    job.refresh_from_db(fields=['pages_processed', 'posts_processed', 'comments_processed', 'messages_processed'])
+    job.finished_at = timezone.now()
+    job.metrics = diff_snapshots(metrics.snapshot(), metrics_before)
+    job.save(update_fields=['status', 'error', 'result', 'metrics', 'finished_at'])
+    return job
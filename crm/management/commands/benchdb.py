@@ -0,0 +1,152 @@
+import multiprocessing
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from crm.db import STOCK_SQLITE_PRAGMAS, current_sqlite_pragmas, sqlite_pragmas
+from crm.models import FacebookComment, FacebookPage, FacebookPost
+from crm.stats import compute_dashboard_totals, get_dashboard_activity
+from crm.sync import bulk_upsert
+
+
+PROFILES = {
+    'stock': STOCK_SQLITE_PRAGMAS,
+    'tuned': None,  # sqlite_pragmas(): the defaults plus FACEBOOK_SQLITE_PRAGMAS
+}
+
+
+class Command(BaseCommand):
+    help = ("Measure dashboard query latency while a sync-like writer bulk upserts comments, once per "
+            "SQLite pragma profile. Synthetic rows are deleted afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES),
+                            help="stock: SQLite defaults (rollback journal); tuned: the configured pragmas")
+        parser.add_argument('--rows', type=int, default=50000, help="Comments the writer upserts per profile")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows per write transaction")
+        parser.add_argument('--readers', type=int, default=4, help="Concurrent dashboard reader threads")
+        parser.add_argument('--posts', type=int, default=200, help="Synthetic posts the comments belong to")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write("Default database is not SQLite; nothing to compare")
+            return
+
+        stamp = int(time.time())
+        page = FacebookPage.objects.create(page_id=f'benchdb_{stamp}', name='Bench page')
+        try:
+            now = timezone.now()
+            FacebookPost.objects.bulk_create([
+                FacebookPost(post_id=f'benchdb_{stamp}_post_{i}', page=page, created_time=now - timedelta(minutes=i))
+                for i in range(options['posts'])
+            ])
+            post_ids = list(FacebookPost.objects.filter(page=page).values_list('pk', flat=True))
+            for profile in options['profiles']:
+                pragmas = PROFILES[profile] or sqlite_pragmas()
+                with override_settings(FACEBOOK_SQLITE_PRAGMAS=pragmas):
+                    # New connections pick the profile up through the connection_created hook
+                    connections.close_all()
+                    self.run_profile(profile, pragmas, post_ids, f'benchdb_{stamp}_{profile}', options)
+        finally:
+            connections.close_all()
+            deleted, _ = FacebookPage.objects.filter(pk=page.pk).delete()
+            self.stdout.write(f"Deleted {deleted} synthetic rows")
+
+    def run_profile(self, profile, pragmas, post_ids, prefix, options):
+        active = current_sqlite_pragmas(connection, ['journal_mode', 'synchronous', 'mmap_size', 'cache_size'])
+        self.stdout.write(f"{profile}: " + ", ".join(f"{name}={value}" for name, value in active.items()))
+        # SQLite connections must not cross a fork
+        connections.close_all()
+
+        # Separate processes, like the sync worker and web server, so the GIL doesn't hide lock waits
+        context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+        done = context.Event()
+        results = context.Queue()
+        processes = [
+            context.Process(target=run_reader, args=(pragmas, done, results), name=f'bench-reader-{i}')
+            for i in range(options['readers'])
+        ]
+        processes.append(context.Process(
+            target=run_writer, args=(pragmas, done, results, post_ids, prefix, options['rows'], options['chunk_size']),
+            name='bench-writer',
+        ))
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        latencies = sorted(latency for kind, values, _ in outcomes if kind == 'reader' for latency in values)
+        read_failures = sum(failed for kind, _, failed in outcomes if kind == 'reader')
+        elapsed, write_failures = next((values, failed) for kind, values, failed in outcomes if kind == 'writer')
+        self.stdout.write(
+            f"  writer   {options['rows'] / elapsed if elapsed else 0:>10,.0f} rows/s "
+            f"({elapsed:.1f}s, {write_failures} failed chunks)"
+        )
+        if latencies:
+            self.stdout.write(
+                f"  readers  {len(latencies) / elapsed if elapsed else 0:>10,.1f} dashboards/s  "
+                f"median {statistics.median(latencies):.1f}ms  "
+                f"p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.1f}ms  "
+                f"max {latencies[-1]:.1f}ms  ({read_failures} failed)"
+            )
+        else:
+            self.stdout.write(f"  readers  no dashboard completed ({read_failures} failed)")
+
+
+def _start_child(pragmas):
+    """Django setup in a benchmark process; with fork it is inherited already"""
+    import django
+    django.setup()
+    return override_settings(FACEBOOK_SQLITE_PRAGMAS=pragmas)
+
+
+def run_reader(pragmas, done, results):
+    """Load the dashboard data over and over until the writer finishes"""
+    latencies = []
+    failed = 0
+    with _start_child(pragmas):
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                get_dashboard_activity()
+                compute_dashboard_totals()
+            except OperationalError:
+                failed += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+        connections.close_all()
+    results.put(('reader', latencies, failed))
+
+
+def run_writer(pragmas, done, results, post_ids, prefix, rows, chunk_size):
+    """Bulk upsert synthetic comments in chunked transactions, as the sync writer does"""
+    failed = 0
+    with _start_child(pragmas):
+        started = time.perf_counter()
+        now = timezone.now()
+        try:
+            for start in range(0, rows, chunk_size):
+                objs = [
+                    FacebookComment(
+                        comment_id=f'{prefix}_comment_{i}', post_id=post_ids[i % len(post_ids)],
+                        message='Bench comment', from_name='Bench user', from_id=str(i % 1000),
+                        created_time=now - timedelta(seconds=i),
+                    )
+                    for i in range(start, min(start + chunk_size, rows))
+                ]
+                try:
+                    with transaction.atomic():
+                        bulk_upsert(FacebookComment, objs, 'comment_id', ['message', 'from_name'])
+                except OperationalError:
+                    failed += 1
+            elapsed = time.perf_counter() - started
+        finally:
+            done.set()
+            connections.close_all()
+    results.put(('writer', elapsed, failed))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.facebook_api import FIELD_PROFILE_NAMES, FacebookGraphAPI, request_stats
+
+
+class Command(BaseCommand):
+    help = ("Fetch the same posts, comments, conversations and messages with each field profile "
+            "and compare payload size and time per call")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', choices=FIELD_PROFILE_NAMES, default=list(FIELD_PROFILE_NAMES))
+        parser.add_argument('--pages', type=int, default=1, help="Pages to sample")
+        parser.add_argument('--posts', type=int, default=5, help="Posts per page whose comments are fetched")
+        parser.add_argument('--conversations', type=int, default=5,
+                            help="Conversations per page whose messages are fetched")
+        parser.add_argument('--repeat', type=int, default=3, help="Times to fetch each sample")
+
+    def handle(self, *args, **options):
+        pages_data = FacebookGraphAPI().get_pages()
+        if not pages_data or 'data' not in pages_data:
+            raise CommandError("Failed to fetch pages from Facebook API.")
+        pages = pages_data['data'][:options['pages']]
+        page_tokens = {page['id']: page.get('access_token') for page in pages}
+
+        results = {}
+        for profile in options['profiles']:
+            api = FacebookGraphAPI(field_profile=profile)
+            api.page_tokens.update(page_tokens)
+            request_stats.reset()
+            for _ in range(options['repeat']):
+                for page in pages:
+                    self.fetch_sample(api, page['id'], options)
+            results[profile] = request_stats.snapshot()['profiles'].get(profile, {})
+
+        endpoints = sorted({key for stats in results.values() for key in stats})
+        self.stdout.write(f"{'endpoint':<20} {'profile':<9} {'calls':>6} {'avg KB':>9} {'avg ms':>9}")
+        for key in endpoints:
+            for profile, stats in results.items():
+                entry = stats.get(key)
+                if entry:
+                    self.stdout.write(
+                        f"{key:<20} {profile:<9} {entry['calls']:>6} "
+                        f"{entry['avg_bytes'] / 1024:>9.1f} {entry['avg_time'] * 1000:>9.1f}"
+                    )
+
+    def fetch_sample(self, api, page_id, options):
+        """One pass over a page's newest posts, their comments, conversations and their messages"""
+        posts = api.get_page_posts_with_all_engagement(page_id, limit=25) or {}
+        for post in posts.get('data', [])[:options['posts']]:
+            api.get_post_comments_with_enhanced_user_info(post['id'], page_id)
+
+        conversations = api.get_page_conversations_with_details(page_id) or {}
+        for conversation in conversations.get('data', [])[:options['conversations']]:
+            api.get_conversation_messages_with_full_details(conversation['id'], page_id)
@@ -0,0 +1,100 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from crm.models import FacebookPage, FacebookPost, FacebookComment, FacebookMessage
+from crm.stats import get_dashboard_activity
+
+
+class Command(BaseCommand):
+    help = ("Time the dashboard and admin top-N queries against synthetic rows. "
+            "The rows are inserted inside a transaction that is rolled back unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help="Synthetic posts, comments and messages to insert (each)")
+        parser.add_argument('--pages', type=int, default=10, help="Pages to spread the rows over")
+        parser.add_argument('--repeat', type=int, default=20, help="Runs per query")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT")
+        parser.add_argument('--keep', action='store_true', help="Commit the synthetic rows instead of rolling back")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            page, post = self.populate(options)
+            self.run_benchmarks(page, post, options['repeat'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write("Synthetic rows rolled back")
+
+    def populate(self, options):
+        """Insert synthetic pages, posts, comments and messages; return a sample page and post"""
+        rows, batch_size = options['rows'], options['batch_size']
+        now = timezone.now()
+        stamp = int(time.time())
+
+        started = time.perf_counter()
+        pages = FacebookPage.objects.bulk_create([
+            FacebookPage(page_id=f'bench_{stamp}_{i}', name=f'Bench page {i}')
+            for i in range(options['pages'])
+        ])
+
+        for start in range(0, rows, batch_size):
+            FacebookPost.objects.bulk_create([
+                FacebookPost(
+                    post_id=f'bench_{stamp}_post_{i}', page=pages[i % len(pages)], message='Bench post',
+                    created_time=now - timedelta(seconds=i), likes_count=i % 100,
+                )
+                for i in range(start, min(start + batch_size, rows))
+            ])
+        posts = list(FacebookPost.objects.filter(post_id__startswith=f'bench_{stamp}_').values_list('pk', flat=True))
+
+        for start in range(0, rows, batch_size):
+            FacebookComment.objects.bulk_create([
+                FacebookComment(
+                    comment_id=f'bench_{stamp}_comment_{i}', post_id=posts[i % len(posts)], message='Bench comment',
+                    from_name='Bench user', from_id=str(i % 1000), created_time=now - timedelta(seconds=i),
+                )
+                for i in range(start, min(start + batch_size, rows))
+            ])
+            FacebookMessage.objects.bulk_create([
+                FacebookMessage(
+                    message_id=f'bench_{stamp}_message_{i}', page=pages[i % len(pages)], message='Bench message',
+                    from_name='Bench user', from_id=str(i % 1000), created_time=now - timedelta(seconds=i),
+                )
+                for i in range(start, min(start + batch_size, rows))
+            ])
+
+        self.stdout.write(f"Inserted {rows} posts, comments and messages in {time.perf_counter() - started:.1f}s")
+        return pages[0], FacebookPost.objects.get(pk=posts[0])
+
+    def run_benchmarks(self, page, post, repeat):
+        """Time each query and show the plan the database picked for it"""
+        since = timezone.now() - timedelta(days=1)
+        queries = [
+            ("dashboard lists", None, get_dashboard_activity),
+            ("newest posts", FacebookPost.objects.order_by('-created_time')[:20], None),
+            ("page posts", FacebookPost.objects.filter(page=page).order_by('-created_time')[:25], None),
+            ("page posts since", FacebookPost.objects.filter(page=page, created_time__gte=since)
+                .order_by('-created_time')[:25], None),
+            ("post comments", FacebookComment.objects.filter(post=post).order_by('-created_time')[:50], None),
+            ("newest comments", FacebookComment.objects.order_by('-created_time')[:50], None),
+            ("page messages", FacebookMessage.objects.filter(page=page).order_by('-created_time')[:50], None),
+            ("newest messages", FacebookMessage.objects.order_by('-created_time')[:50], None),
+        ]
+
+        for label, queryset, func in queries:
+            run = func or (lambda qs=queryset: list(qs.all()))
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label:<18} median {statistics.median(timings):8.2f}ms  max {max(timings):8.2f}ms"
+            )
+            if queryset is not None:
+                self.stdout.write(f"{'':<18} plan: {' | '.join(queryset.explain().splitlines())}")
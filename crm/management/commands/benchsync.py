@@ -0,0 +1,173 @@
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from crm import facebook_api
+from crm.facebook_api import FIELD_PROFILE_NAMES, FacebookGraphAPI, request_stats, set_http_session
+from crm.fakegraph import FAKE_ID_PREFIX, FakeGraph
+from crm.identities import identity_cache
+from crm.metrics import diff_snapshots, metrics
+from crm.models import FacebookLookupMemo, FacebookPage, FacebookPageToken, FacebookPermissionStatus, FacebookUser
+from crm.sync import FacebookSyncEngine
+from crm.tokens import token_fingerprint
+
+
+# User token the benchmark syncs with, so its permission status never replaces the real one
+BENCH_USER_TOKEN = 'benchsync-user-token'
+
+
+class QueryCounter:
+    """execute_wrapper counting queries on every connection it is installed on"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = ("Run the sync engine end to end against an offline fake Graph API and report rows/sec, "
+            "API calls and database queries. Synthetic rows are deleted afterwards unless --keep is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=2)
+        parser.add_argument('--posts', type=int, default=100, help="Posts per page")
+        parser.add_argument('--comments', type=int, default=20, help="Comments per post")
+        parser.add_argument('--conversations', type=int, default=50, help="Conversations per page")
+        parser.add_argument('--messages', type=int, default=20, help="Messages per conversation")
+        parser.add_argument('--nameless-ratio', type=float, default=0.1,
+                            help="Share of commenters returned without a name")
+        parser.add_argument('--latency', type=float, default=50.0, help="Milliseconds per fake HTTP request")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Chance that a request or batch sub-request fails transiently")
+        parser.add_argument('--throttle-rate', type=float, default=0.0,
+                            help="Chance that a request or batch sub-request is rate limited")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, help="Sync worker threads (default: FACEBOOK_SYNC_MAX_WORKERS)")
+        parser.add_argument('--field-profile', choices=FIELD_PROFILE_NAMES,
+                            help="Graph API fields to request (default: FACEBOOK_SYNC_FIELD_PROFILE)")
+        parser.add_argument('--runs', type=int, default=2,
+                            help="Syncs to run; the first is a full sync, later ones are incremental")
+        parser.add_argument('--no-rate-limit', action='store_true',
+                            help="Switch the client-side rate governor off to measure the engine alone")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the synthetic rows and their engagement history instead of deleting them")
+
+    def handle(self, *args, **options):
+        fake = FakeGraph(
+            pages=options['pages'], posts=options['posts'], comments=options['comments'],
+            conversations=options['conversations'], messages=options['messages'],
+            nameless_ratio=options['nameless_ratio'], latency=options['latency'] / 1000,
+            error_rate=options['error_rate'], throttle_rate=options['throttle_rate'], seed=options['seed'],
+        )
+        expected = fake.expected_counts()
+        self.stdout.write(
+            f"Fake Graph API: {expected['pages']} pages, {expected['posts']} posts, {expected['comments']} comments, "
+            f"{expected['messages']} messages, {options['latency']:.0f}ms latency"
+        )
+
+        # Per-page sync logging would drown the report; -v 2 keeps it
+        crm_logger = logging.getLogger('crm')
+        log_level = crm_logger.level
+        if options['verbosity'] < 2:
+            crm_logger.setLevel(logging.WARNING)
+
+        previous_session = set_http_session(fake)
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        counter.install(connection=connection)
+        # Fake responses must never reach the real response archive: cleanup can't take them back out
+        # and a later reingest would restore the synthetic rows
+        bench_settings = {'FACEBOOK_ARCHIVE_ENABLED': False}
+        if options['no_rate_limit']:
+            bench_settings['FACEBOOK_RATE_LIMIT_ENABLED'] = False
+        if not options['keep']:
+            # History chunks don't reference posts, so cleanup couldn't find the synthetic observations
+            bench_settings['FACEBOOK_HISTORY_ENABLED'] = False
+        try:
+            with override_settings(**bench_settings):
+                # Start cold: no learned rate limits, open circuits or cached names from earlier calls
+                facebook_api.rate_governor.reset()
+                facebook_api.circuit_breakers.reset()
+                identity_cache.clear()
+                for run in range(1, options['runs'] + 1):
+                    self.run_sync(run, fake, counter, options)
+        finally:
+            connection_created.disconnect(counter.install)
+            connection.execute_wrappers.remove(counter)
+            set_http_session(previous_session)
+            if not options['keep']:
+                self.cleanup()
+            crm_logger.setLevel(log_level)
+
+    def run_sync(self, run, fake, counter, options):
+        """One sync against the fake, reporting throughput and call and query counts"""
+        api = FacebookGraphAPI(field_profile=options['field_profile'])
+        api.user_access_token = BENCH_USER_TOKEN
+        engine = FacebookSyncEngine(api=api, max_workers=options['workers'])
+
+        requests_before = request_stats.snapshot()
+        metrics_before = metrics.snapshot()
+        fake_before = fake.stats()
+        queries_before = counter.queries
+        started = time.perf_counter()
+        result = engine.run()
+        elapsed = time.perf_counter() - started
+
+        requests_after = request_stats.snapshot()
+        fake_after = fake.stats()
+        run_metrics = diff_snapshots(metrics.snapshot(), metrics_before)
+        flush_time = sum(series['sum'] for series in run_metrics.get('facebook_sync_flush_seconds', []))
+        retries = sum(series['value'] for series in run_metrics.get('facebook_graph_retries_total', []))
+        rows = result['posts'] + result['comments'] + result['messages']
+        calls = requests_after['calls'] - requests_before['calls']
+
+        label = "full" if run == 1 else "incremental"
+        self.stdout.write(f"Run {run} ({label}): {elapsed:.2f}s")
+        self.stdout.write(
+            f"  rows       {rows:>8}  ({result['posts']} posts, {result['comments']} comments, "
+            f"{result['messages']} messages)  {rows / elapsed if elapsed else 0:,.0f} rows/s"
+        )
+        self.stdout.write(
+            f"  API calls  {calls:>8}  ({fake_after['sub_requests'] - fake_before['sub_requests']} batched "
+            f"sub-requests, {requests_after['errors'] - requests_before['errors']} failed, {retries:.0f} retried, "
+            f"{(requests_after['bytes'] - requests_before['bytes']) // 1024} KB)"
+        )
+        self.stdout.write(
+            f"  DB queries {counter.queries - queries_before:>8}  ({flush_time * 1000:.0f}ms in bulk writes)"
+        )
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(f"  {len(result['errors'])} sync task errors: {result['errors'][:3]}"))
+
+        if run == 1:
+            missing = {
+                key: count - result[key] for key, count in fake.expected_counts().items() if result[key] < count
+            }
+            if missing:
+                self.stdout.write(self.style.WARNING(f"  Incomplete sync, rows missing: {missing}"))
+
+    def cleanup(self):
+        """Delete every row the fake data set produced"""
+        deleted, _ = FacebookPage.objects.filter(page_id__startswith=FAKE_ID_PREFIX).delete()
+        deleted += FacebookUser.objects.filter(user_id__startswith=FAKE_ID_PREFIX).delete()[0]
+        deleted += FacebookPageToken.objects.filter(page_id__startswith=FAKE_ID_PREFIX).delete()[0]
+        deleted += FacebookLookupMemo.objects.filter(key__startswith=FAKE_ID_PREFIX).delete()[0]
+        deleted += FacebookPermissionStatus.objects.filter(
+            token_fingerprint=token_fingerprint(BENCH_USER_TOKEN)
+        ).delete()[0]
+        identity_cache.clear()
+        self.stdout.write(f"Deleted {deleted} synthetic rows")
+
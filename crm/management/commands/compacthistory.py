@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from crm.history import RECORD_BYTES, compact_history
+from crm.models import EngagementHistoryChunk
+
+
+class Command(BaseCommand):
+    help = ("Merge the small engagement history chunks incremental syncs write into chunks of "
+            "FACEBOOK_HISTORY_CHUNK_ROWS observations, so history queries read fewer rows")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-rows', type=int, help="Observations per chunk (default: FACEBOOK_HISTORY_CHUNK_ROWS)")
+
+    def handle(self, *args, **options):
+        before, after = compact_history(options['chunk_rows'])
+        observations = sum(EngagementHistoryChunk.objects.values_list('records', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted {before} chunks into {after}: {observations} observations, "
+            f"{observations * RECORD_BYTES / 1024 / 1024:.1f} MB"
+        ))
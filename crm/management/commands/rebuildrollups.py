@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.models import FacebookPage
+from crm.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = ("Recompute the per-day page rollups (PageDailyStats) from the stored posts, comments and messages. "
+            "Sync keeps them current; this is for rows changed outside of it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', action='append', dest='pages', metavar='PAGE_ID',
+                            help="Only this page (repeatable)")
+
+    def handle(self, *args, **options):
+        pages = None
+        if options['pages']:
+            pages = list(FacebookPage.objects.filter(page_id__in=options['pages']))
+            unknown = set(options['pages']) - {page.page_id for page in pages}
+            if unknown:
+                raise CommandError(f"Unknown page IDs: {', '.join(sorted(unknown))}")
+        written = rebuild_daily_stats(pages)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} page days"))
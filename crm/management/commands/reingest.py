@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.archive import find_frames
+from crm.reingest import ArchiveIngest
+
+
+def parse_when(value):
+    """Unix time for an ISO date or datetime given on the command line (local time if naive)"""
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD or an ISO datetime")
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when.timestamp()
+
+
+class Command(BaseCommand):
+    help = ("Rebuild pages, posts, comments and messages from the raw Graph API response archive "
+            "(FACEBOOK_ARCHIVE_DIR) without calling Facebook")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="Archive directory (default: FACEBOOK_ARCHIVE_DIR)")
+        parser.add_argument('--since', help="Only responses archived at or after this date/datetime")
+        parser.add_argument('--until', help="Only responses archived at or before this date/datetime")
+        parser.add_argument('--page', action='append', dest='pages', metavar='PAGE_ID',
+                            help="Only this page (repeatable)")
+
+    def handle(self, *args, **options):
+        since = parse_when(options['since']) if options['since'] else None
+        until = None
+        if options['until']:
+            until = parse_when(options['until'])
+            if len(options['until']) == 10:
+                # A bare date includes the whole day
+                until += 24 * 3600
+        frames = find_frames(options['dir'], since=since, until=until)
+        if not frames:
+            raise CommandError("No archived responses found")
+        self.stdout.write(f"Reading {sum(frame['records'] for frame in frames)} archived responses "
+                          f"from {len({frame['segment'] for frame in frames})} segments")
+
+        try:
+            counts = ArchiveIngest(options['dir'], since, until, options['pages']).run()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        rows = counts['posts'] + counts['comments'] + counts['messages']
+        self.stdout.write(self.style.SUCCESS(
+            f"Reingested {counts['pages']} pages, {counts['posts']} posts, {counts['comments']} comments and "
+            f"{counts['messages']} messages from {counts['records']} responses in {counts['elapsed']:.1f}s "
+            f"({rows / counts['elapsed'] if counts['elapsed'] else 0:,.0f} rows/s)"
+        ))
+        if counts['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {counts['skipped']} comments/messages whose post or conversation is not stored or archived"
+            ))
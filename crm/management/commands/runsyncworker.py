@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crm.facebook_api import FIELD_PROFILE_NAMES
+from crm.jobs import claim_next_job, fail_stale_jobs, run_sync_job, worker_name
+from crm.permissions import refresh_permission_status_if_stale
+from crm.sync import FacebookSyncEngine
+
+
+class Command(BaseCommand):
+    help = "Process queued Facebook sync jobs from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run at most one job, then exit")
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help="Seconds to wait between checks for new jobs")
+        parser.add_argument('--field-profile', choices=FIELD_PROFILE_NAMES,
+                            help="Graph API fields to request (default: FACEBOOK_SYNC_FIELD_PROFILE)")
+
+    def handle(self, *args, **options):
+        name = worker_name()
+        self.stdout.write(f"Sync worker {name} started")
+
+        try:
+            while True:
+                stale = fail_stale_jobs()
+                if stale:
+                    self.stdout.write(self.style.WARNING(f"Marked {stale} stale job(s) as failed"))
+
+                job = claim_next_job(name)
+                if job:
+                    self.stdout.write(f"Running sync job {job.pk}")
+                    job = run_sync_job(job, FacebookSyncEngine(field_profile=options['field_profile']))
+                    style = self.style.SUCCESS if job.status == job.SUCCEEDED else self.style.ERROR
+                    self.stdout.write(style(f"Sync job {job.pk} {job.status}: {job.progress()}"))
+
+                if options['once']:
+                    break
+                if not job:
+                    # Keep the dashboard's cached permission status fresh while idle
+                    try:
+                        refresh_permission_status_if_stale()
+                    except Exception as e:
+                        self.stdout.write(self.style.WARNING(f"Permission status refresh failed: {e}"))
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            self.stdout.write("Sync worker stopped")
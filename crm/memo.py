@@ -0,0 +1,94 @@
+"""
+Memo of Graph API fallback lookups.
+
+Comments and user profiles are fetched by trying several field sets and
+tokens in turn, and for privacy-restricted users every attempt fails the
+same way on every sync. The memo remembers which method worked for a
+page/token and which users could not be resolved, for a limited time, so
+later syncs go straight to the working method and skip known-dead lookups.
+
+Sync workers only use the in-memory LookupMemo; it is loaded before a run
+and written back by the sync writer at the end, keeping DB access on the
+writer thread.
+"""
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import FacebookLookupMemo
+
+
+def memo_ttl(kind):
+    """How long an entry of this kind is trusted before the lookup is tried again"""
+    if kind == FacebookLookupMemo.UNRESOLVABLE_USER:
+        seconds = getattr(settings, 'FACEBOOK_LOOKUP_MEMO_UNRESOLVABLE_TTL', 3 * 86400)
+    else:
+        seconds = getattr(settings, 'FACEBOOK_LOOKUP_MEMO_METHOD_TTL', 7 * 86400)
+    return timedelta(seconds=seconds)
+
+
+class LookupMemo:
+    """Thread-safe in-memory memo entries, saved back to the database in one go"""
+
+    def __init__(self, entries=None):
+        self._lock = threading.Lock()
+        self._entries = dict(entries or {})  # (kind, key) -> (value, expires_at)
+        self._changed = set()
+        self._forgotten = set()
+
+    @classmethod
+    def load(cls):
+        """Memo with every unexpired stored entry"""
+        rows = FacebookLookupMemo.objects.filter(expires_at__gt=timezone.now())
+        return cls({(row.kind, row.key): (row.value, row.expires_at) for row in rows})
+
+    def get(self, kind, key):
+        """Stored value, or None if there is no unexpired entry"""
+        with self._lock:
+            entry = self._entries.get((kind, key))
+        if entry is None or entry[1] <= timezone.now():
+            return None
+        return entry[0]
+
+    def has(self, kind, key):
+        return self.get(kind, key) is not None
+
+    def remember(self, kind, key, value=''):
+        with self._lock:
+            current = self._entries.get((kind, key))
+            if current is not None and current[0] == value and current[1] > timezone.now():
+                return
+            self._entries[(kind, key)] = (value, timezone.now() + memo_ttl(kind))
+            self._changed.add((kind, key))
+            self._forgotten.discard((kind, key))
+
+    def forget(self, kind, key):
+        with self._lock:
+            if self._entries.pop((kind, key), None) is not None:
+                self._changed.discard((kind, key))
+                self._forgotten.add((kind, key))
+
+    def save(self):
+        """Write new and changed entries, drop forgotten and expired ones"""
+        with self._lock:
+            changed = [(kind, key, *self._entries[(kind, key)]) for kind, key in self._changed]
+            forgotten = list(self._forgotten)
+            self._changed = set()
+            self._forgotten = set()
+
+        if changed:
+            FacebookLookupMemo.objects.bulk_create(
+                [
+                    FacebookLookupMemo(kind=kind, key=key, value=value, expires_at=expires_at)
+                    for kind, key, value, expires_at in changed
+                ],
+                update_conflicts=True,
+                unique_fields=['kind', 'key'],
+                update_fields=['value', 'expires_at'],
+            )
+        for kind, key in forgotten:
+            FacebookLookupMemo.objects.filter(kind=kind, key=key).delete()
+        FacebookLookupMemo.objects.filter(expires_at__lte=timezone.now()).delete()
+        return len(changed)
@@ -0,0 +1,222 @@
+"""
+Sync instrumentation: counters and histograms in the Prometheus data model.
+
+The Graph client and the sync engine record into the process-wide `metrics`
+registry. Sync jobs store the difference between the registry before and after
+their run on SyncJob.metrics, so runs can be compared later and the /metrics
+endpoint can serve totals from the web process even though syncs run in the
+worker.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import SyncJob
+
+
+# Upper bounds in seconds for latency and duration histograms
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Upper bounds for write throughput histograms
+ROWS_PER_SECOND_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# name: (type, help, label names, buckets)
+METRICS = {
+    'facebook_graph_request_seconds': (
+        HISTOGRAM, "Graph API HTTP request latency, one observation per attempt", ('endpoint',), SECONDS_BUCKETS,
+    ),
+    'facebook_graph_decode_seconds': (
+        HISTOGRAM, "Time spent decoding Graph API JSON responses", ('endpoint',), SECONDS_BUCKETS,
+    ),
+    'facebook_graph_retries_total': (
+        COUNTER, "Graph API requests retried, by reason (throttled, transient, batch)", ('endpoint', 'reason'), None,
+    ),
+    'facebook_sync_stage_seconds': (
+        HISTOGRAM, "Wall time of each sync stage, one observation per task", ('stage',), SECONDS_BUCKETS,
+    ),
+    'facebook_sync_flush_seconds': (
+        HISTOGRAM, "Database write time per bulk flush", ('model',), SECONDS_BUCKETS,
+    ),
+    'facebook_sync_rows_per_second': (
+        HISTOGRAM, "Rows written per second of database time, one observation per flush", ('model',),
+        ROWS_PER_SECOND_BUCKETS,
+    ),
+    'facebook_sync_rows_total': (
+        COUNTER, "Rows written by the sync", ('model',), None,
+    ),
+    'facebook_sync_duration_seconds': (
+        HISTOGRAM, "Wall time of whole sync runs", (), SECONDS_BUCKETS + (120.0, 300.0, 600.0, 1800.0),
+    ),
+}
+
+
+def _empty_series(kind, buckets):
+    if kind == COUNTER:
+        return {'value': 0.0}
+    return {'count': 0, 'sum': 0.0, 'buckets': [0] * len(buckets)}
+
+
+class MetricsRegistry:
+    """Thread-safe store of the series defined in METRICS, keyed by label values"""
+
+    def __init__(self, definitions=None):
+        self.definitions = definitions or METRICS
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def _get(self, name, labels):
+        kind, _, label_names, buckets = self.definitions[name]
+        key = (name, tuple(str(labels.get(label, '')) for label in label_names))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _empty_series(kind, buckets)
+        return series, buckets
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            series, _ = self._get(name, labels)
+            series['value'] += amount
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series, buckets = self._get(name, labels)
+            series['count'] += 1
+            series['sum'] += value
+            # Buckets are stored non-cumulative and summed up when rendered
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the wall time of the with block, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """JSON-ready copy: {name: [{'labels': {...}, ...series values}]}"""
+        with self._lock:
+            items = [(key, dict(series, buckets=list(series['buckets'])) if 'buckets' in series else dict(series))
+                     for key, series in self._series.items()]
+
+        snapshot = {}
+        for (name, values), series in items:
+            label_names = self.definitions[name][2]
+            series['labels'] = dict(zip(label_names, values))
+            snapshot.setdefault(name, []).append(series)
+        return snapshot
+
+
+metrics = MetricsRegistry()
+
+
+def _series_key(series):
+    return tuple(sorted(series['labels'].items()))
+
+
+def _combine(a, b, sign):
+    combined = dict(a)
+    if 'value' in a:
+        combined['value'] = a['value'] + sign * b['value']
+    else:
+        combined['count'] = a['count'] + sign * b['count']
+        combined['sum'] = a['sum'] + sign * b['sum']
+        combined['buckets'] = [x + sign * y for x, y in zip(a['buckets'], b['buckets'])]
+    return combined
+
+
+def diff_snapshots(after, before):
+    """What was recorded between two snapshots of the same registry, series that didn't move dropped"""
+    diff = {}
+    for name, series_list in after.items():
+        earlier = {_series_key(series): series for series in before.get(name, [])}
+        for series in series_list:
+            previous = earlier.get(_series_key(series))
+            if previous is not None:
+                series = _combine(series, previous, -1)
+            if series.get('value') or series.get('count'):
+                diff.setdefault(name, []).append(series)
+    return diff
+
+
+def merge_snapshots(snapshots):
+    """Sum several snapshots (e.g. those stored on sync jobs) series by series"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, series_list in (snapshot or {}).items():
+            if name not in METRICS:
+                continue
+            by_key = merged.setdefault(name, {})
+            for series in series_list:
+                key = _series_key(series)
+                by_key[key] = _combine(by_key[key], series, 1) if key in by_key else dict(series)
+    return {name: list(by_key.values()) for name, by_key in merged.items()}
+
+
+SYNC_METRICS_CACHE_KEY = 'crm:sync_metrics'
+
+
+def compute_sync_metrics():
+    """Metrics of every finished sync job added together"""
+    jobs = SyncJob.objects.filter(finished_at__isnull=False).values_list('metrics', flat=True)
+    return merge_snapshots(jobs.iterator())
+
+
+def get_sync_metrics():
+    """Totals over finished sync jobs, cached for FACEBOOK_METRICS_CACHE_TTL seconds (0 disables caching)"""
+    ttl = getattr(settings, 'FACEBOOK_METRICS_CACHE_TTL', 15)
+    if not ttl:
+        return compute_sync_metrics()
+    return cache.get_or_set(SYNC_METRICS_CACHE_KEY, compute_sync_metrics, ttl)
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels.items()) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(snapshot):
+    """Prometheus text exposition format (version 0.0.4) for a snapshot"""
+    lines = []
+    for name, (kind, help_text, _, buckets) in METRICS.items():
+        series_list = snapshot.get(name)
+        if not series_list:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for series in sorted(series_list, key=_series_key):
+            labels = series['labels']
+            if kind == COUNTER:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(series['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, series['buckets']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': _format_value(float(bound))})} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {series['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(series['sum']))}")
+            lines.append(f"{name}_count{_format_labels(labels)} {series['count']}")
+    return '\n'.join(lines) + '\n'
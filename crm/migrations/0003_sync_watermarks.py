@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_instagramaccount_instagrammessage_instagrampost_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facebookpage',
+            name='posts_synced_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='facebookpage',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='facebookpost',
+            name='comments_synced_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='facebookpost',
+            name='last_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='FacebookConversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_id', models.CharField(max_length=100, unique=True)),
+                ('updated_time', models.DateTimeField(blank=True, null=True)),
+                ('messages_synced_until', models.DateTimeField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.facebookpage')),
+            ],
+        ),
+    ]
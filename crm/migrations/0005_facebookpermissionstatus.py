@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_syncjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacebookPermissionStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_fingerprint', models.CharField(max_length=64, unique=True)),
+                ('missing', models.JSONField(default=list)),
+                ('granted', models.JSONField(default=list)),
+                ('token_valid', models.BooleanField(null=True)),
+                ('token_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_facebookpermissionstatus'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facebookpost',
+            index=models.Index(fields=['page', '-created_time'], name='crm_post_page_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facebookpost',
+            index=models.Index(fields=['-created_time'], name='crm_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facebookcomment',
+            index=models.Index(fields=['post', '-created_time'], name='crm_comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facebookcomment',
+            index=models.Index(fields=['-created_time'], name='crm_comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facebookmessage',
+            index=models.Index(fields=['page', '-created_time'], name='crm_message_page_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facebookmessage',
+            index=models.Index(fields=['-created_time'], name='crm_message_created_idx'),
+        ),
+    ]
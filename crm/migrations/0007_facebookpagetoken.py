@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_created_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacebookPageToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_id', models.CharField(max_length=100, unique=True)),
+                ('user_token_fingerprint', models.CharField(max_length=64)),
+                ('access_token', models.TextField()),
+                ('fetched_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_facebookpagetoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacebookLookupMemo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('comment_method', 'Working comment fetch method'), ('profile_method', 'Working user profile lookup'), ('unresolvable_user', 'Unresolvable user')], max_length=32)),
+                ('key', models.CharField(max_length=255)),
+                ('value', models.CharField(blank=True, max_length=255)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='crm_lookup_memo_kind_key')],
+            },
+        ),
+    ]
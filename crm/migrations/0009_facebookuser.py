@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+PLACEHOLDER_NAMES = ['Anonymous User', 'Anonymous Commenter', 'Unknown User', '']
+
+
+def is_real_name(name):
+    return not (
+        name in PLACEHOLDER_NAMES
+        or name.startswith(('Anonymous_', 'Commenter_'))
+        or (name.startswith('User ') and name.endswith('...'))
+    )
+
+
+def link_existing_rows(apps, schema_editor):
+    """Create identities for senders already stored and point their rows at them"""
+    FacebookUser = apps.get_model('crm', 'FacebookUser')
+    names = {}
+    for model_name in ('FacebookComment', 'FacebookMessage'):
+        model = apps.get_model('crm', model_name)
+        for user_id, name in model.objects.exclude(from_id='').values_list('from_id', 'from_name').distinct():
+            if is_real_name(name) or user_id not in names:
+                names[user_id] = name if is_real_name(name) else ''
+
+    FacebookUser.objects.bulk_create(
+        [FacebookUser(user_id=user_id, name=name, resolved=bool(name)) for user_id, name in names.items()],
+        batch_size=500,
+    )
+    for model_name in ('FacebookComment', 'FacebookMessage'):
+        apps.get_model('crm', model_name).objects.exclude(from_id='').update(user_id=models.F('from_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0008_facebooklookupmemo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacebookUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(blank=True, max_length=200)),
+                ('resolved', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='facebookcomment',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='comments', to='crm.facebookuser', to_field='user_id'),
+        ),
+        migrations.AddField(
+            model_name='facebookmessage',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages', to='crm.facebookuser', to_field='user_id'),
+        ),
+        migrations.RunPython(link_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_facebookuser'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncjob',
+            name='metrics',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_rollups(apps, schema_editor):
+    """Daily counts for rows already stored, and one snapshot per post from its current counters"""
+    FacebookPost = apps.get_model('crm', 'FacebookPost')
+    FacebookComment = apps.get_model('crm', 'FacebookComment')
+    FacebookMessage = apps.get_model('crm', 'FacebookMessage')
+    PageDailyStats = apps.get_model('crm', 'PageDailyStats')
+    PostDailySnapshot = apps.get_model('crm', 'PostDailySnapshot')
+
+    days = {}
+    grouped = [
+        (FacebookPost, 'page_id', {'posts_count': models.Count('id'), 'reactions_count': models.Sum('likes_count'),
+                                   'shares_count': models.Sum('shares_count')}),
+        (FacebookComment, 'post__page_id', {'comments_count': models.Count('id')}),
+        (FacebookMessage, 'page_id', {'messages_count': models.Count('id')}),
+    ]
+    for model, page_field, aggregates in grouped:
+        rows = (
+            model.objects.order_by().annotate(day=TruncDate('created_time'))
+            .values(page_field, 'day').annotate(**aggregates)
+        )
+        for row in rows:
+            fields = days.setdefault((row[page_field], row['day']), {})
+            fields.update((name, row[name] or 0) for name in aggregates)
+    PageDailyStats.objects.bulk_create(
+        [PageDailyStats(page_id=page_id, date=day, **fields) for (page_id, day), fields in days.items()],
+        batch_size=500,
+    )
+
+    snapshots = []
+    for post in FacebookPost.objects.only('likes_count', 'comments_count', 'shares_count', 'created_time',
+                                          'last_synced_at').iterator():
+        read_at = post.last_synced_at or post.created_time
+        snapshots.append(PostDailySnapshot(
+            post_id=post.pk, date=timezone.localdate(read_at), likes_count=post.likes_count,
+            comments_count=post.comments_count, shares_count=post.shares_count, captured_at=read_at,
+        ))
+    PostDailySnapshot.objects.bulk_create(snapshots, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_syncjob_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('posts_count', models.IntegerField(default=0)),
+                ('comments_count', models.IntegerField(default=0)),
+                ('messages_count', models.IntegerField(default=0)),
+                ('reactions_count', models.IntegerField(default=0)),
+                ('shares_count', models.IntegerField(default=0)),
+                ('followers_count', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('page', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='crm.facebookpage')),
+            ],
+            options={
+                'verbose_name_plural': 'page daily stats',
+                'constraints': [models.UniqueConstraint(fields=('page', 'date'), name='crm_page_daily_stats_page_date')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostDailySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('likes_count', models.IntegerField(default=0)),
+                ('comments_count', models.IntegerField(default=0)),
+                ('shares_count', models.IntegerField(default=0)),
+                ('captured_at', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_snapshots', to='crm.facebookpost')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('post', 'date'), name='crm_post_daily_snapshot_post_date')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
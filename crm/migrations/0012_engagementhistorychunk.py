@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_pagedailystats_postdailysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementHistoryChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField(db_index=True)),
+                ('end_time', models.DateTimeField()),
+                ('records', models.IntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
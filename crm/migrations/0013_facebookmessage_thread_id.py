@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_engagementhistorychunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facebookmessage',
+            name='thread_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
@@ -8,6 +8,9 @@ class FacebookPage(models.Model):
     followers_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Incremental sync: newest post created_time already stored, and when the page last synced
+    posts_synced_until = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -21,28 +24,257 @@ class FacebookPost(models.Model):
     likes_count = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
     shares_count = models.IntegerField(default=0)
+    # Incremental sync: newest comment created_time stored, and when engagement was last refreshed
+    comments_synced_until = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['page', '-created_time'], name='crm_post_page_created_idx'),
+            models.Index(fields=['-created_time'], name='crm_post_created_idx'),
+        ]
     
     def __str__(self):
         return f"Post {self.post_id}"
 
+class FacebookUser(models.Model):
+    """A commenter or message sender; comments and messages share one name per person"""
+    user_id = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=200, blank=True)
+    resolved = models.BooleanField(default=False)  # name came from Facebook, not a placeholder
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.name or f"User {self.user_id}"
+
+
 class FacebookComment(models.Model):
     comment_id = models.CharField(max_length=100, unique=True)
     post = models.ForeignKey(FacebookPost, on_delete=models.CASCADE)
     message = models.TextField()
     from_name = models.CharField(max_length=200)
     from_id = models.CharField(max_length=100)
+    user = models.ForeignKey(
+        FacebookUser, to_field='user_id', null=True, blank=True, on_delete=models.SET_NULL, related_name='comments'
+    )
     created_time = models.DateTimeField()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', '-created_time'], name='crm_comment_post_created_idx'),
+            models.Index(fields=['-created_time'], name='crm_comment_created_idx'),
+        ]
+    
+    @property
+    def display_name(self):
+        """The commenter's shared identity name once Facebook has given us one"""
+        if self.user_id and self.user.name:
+            return self.user.name
+        return self.from_name
+    
     def __str__(self):
         return f"Comment by {self.from_name}"
 
+class FacebookConversation(models.Model):
+    conversation_id = models.CharField(max_length=100, unique=True)
+    page = models.ForeignKey(FacebookPage, on_delete=models.CASCADE)
+    # Graph updated_time as of the last sync; unchanged conversations are skipped
+    updated_time = models.DateTimeField(null=True, blank=True)
+    messages_synced_until = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Conversation {self.conversation_id}"
+
 class FacebookMessage(models.Model):
     message_id = models.CharField(max_length=100, unique=True)
     page = models.ForeignKey(FacebookPage, on_delete=models.CASCADE)
+    # Graph conversation ID (FacebookConversation.conversation_id); blank for messages synced before it was kept
+    thread_id = models.CharField(max_length=100, blank=True, db_index=True)
     from_name = models.CharField(max_length=200)
     from_id = models.CharField(max_length=100)
+    user = models.ForeignKey(
+        FacebookUser, to_field='user_id', null=True, blank=True, on_delete=models.SET_NULL, related_name='messages'
+    )
     message = models.TextField()
     created_time = models.DateTimeField()
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['page', '-created_time'], name='crm_message_page_created_idx'),
+            models.Index(fields=['-created_time'], name='crm_message_created_idx'),
+        ]
+    
+    @property
+    def display_name(self):
+        """The sender's shared identity name once Facebook has given us one"""
+        if self.user_id and self.user.name:
+            return self.user.name
+        return self.from_name
+    
     def __str__(self):
         return f"Message from {self.from_name}"
+
+
+class PageDailyStats(models.Model):
+    """Per page and day: posts, comments and messages created that day, kept up to date by sync
+
+    reactions_count and shares_count are the counters currently on the posts
+    published that day; followers_count is the follower count as last read
+    that day, or None when the page wasn't synced that day.
+    """
+    page = models.ForeignKey(FacebookPage, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    posts_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    messages_count = models.IntegerField(default=0)
+    reactions_count = models.IntegerField(default=0)
+    shares_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['page', 'date'], name='crm_page_daily_stats_page_date'),
+        ]
+        verbose_name_plural = 'page daily stats'
+
+    def __str__(self):
+        return f"{self.page_id} on {self.date}"
+
+
+class PostDailySnapshot(models.Model):
+    """A post's engagement counters as last read on a day, one row per post and day"""
+    post = models.ForeignKey(FacebookPost, on_delete=models.CASCADE, related_name='daily_snapshots')
+    date = models.DateField()
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+    shares_count = models.IntegerField(default=0)
+    captured_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'date'], name='crm_post_daily_snapshot_post_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} on {self.date}"
+
+
+class EngagementHistoryChunk(models.Model):
+    """A block of packed engagement observations (see crm.history), covering start_time..end_time"""
+    start_time = models.DateTimeField(db_index=True)
+    end_time = models.DateTimeField()
+    records = models.IntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.records} observations from {self.start_time}"
+
+
+class FacebookPermissionStatus(models.Model):
+    """Last known permission and token status for an access token, refreshed by sync"""
+    token_fingerprint = models.CharField(max_length=64, unique=True)
+    missing = models.JSONField(default=list)
+    granted = models.JSONField(default=list)
+    token_valid = models.BooleanField(null=True)
+    token_expires_at = models.DateTimeField(null=True, blank=True)
+    checked_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Permission status checked {self.checked_at}"
+
+
+class FacebookPageToken(models.Model):
+    """Page access token from `me/accounts`, shared by every process until it expires"""
+    page_id = models.CharField(max_length=100, unique=True)
+    user_token_fingerprint = models.CharField(max_length=64)
+    access_token = models.TextField()
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Token for page {self.page_id}"
+
+
+class FacebookLookupMemo(models.Model):
+    """Remembered outcome of a Graph API fallback lookup, so later syncs can skip the retries"""
+    COMMENT_METHOD = 'comment_method'
+    PROFILE_METHOD = 'profile_method'
+    UNRESOLVABLE_USER = 'unresolvable_user'
+    KIND_CHOICES = [
+        (COMMENT_METHOD, 'Working comment fetch method'),
+        (PROFILE_METHOD, 'Working user profile lookup'),
+        (UNRESOLVABLE_USER, 'Unresolvable user'),
+    ]
+    
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    key = models.CharField(max_length=255)
+    value = models.CharField(max_length=255, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'key'], name='crm_lookup_memo_kind_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} {self.key}"
+
+
+class SyncJob(models.Model):
+    """A queued Facebook sync, picked up by `manage.py runsyncworker`"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Bumped with every progress report; lets a new worker spot jobs whose worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=200, blank=True)
+    pages_processed = models.IntegerField(default=0)
+    posts_processed = models.IntegerField(default=0)
+    comments_processed = models.IntegerField(default=0)
+    messages_processed = models.IntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    # Counters and histograms recorded while the job ran (see crm.metrics)
+    metrics = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Sync job {self.pk} ({self.status})"
+
+    @property
+    def rows_processed(self):
+        return self.posts_processed + self.comments_processed + self.messages_processed
+
+    def progress(self):
+        """JSON-ready progress snapshot including throughput in rows per second"""
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'pages': self.pages_processed,
+            'posts': self.posts_processed,
+            'comments': self.comments_processed,
+            'messages': self.messages_processed,
+            'elapsed_seconds': round(elapsed, 1),
+            'rows_per_second': round(self.rows_processed / elapsed, 1) if elapsed else 0.0,
+            'error': self.error,
+        }
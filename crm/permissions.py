@@ -0,0 +1,83 @@
+"""
+Cached permission and token status.
+
+Checking `me/permissions` and `debug_token` means two blocking Graph API
+calls, so they only happen during sync or from the background worker. Views
+read the last stored result and never talk to Facebook themselves.
+"""
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .facebook_api import FacebookGraphAPI
+from .models import FacebookPermissionStatus
+from .tokens import token_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+def _status_ttl():
+    return timedelta(seconds=getattr(settings, 'FACEBOOK_PERMISSION_STATUS_TTL', 3600))
+
+
+def get_permission_status(token=None):
+    """Last stored permission info for the token; never calls the Graph API"""
+    token = token or settings.FACEBOOK_ACCESS_TOKEN
+    status = FacebookPermissionStatus.objects.filter(token_fingerprint=token_fingerprint(token)).first()
+    if status is None:
+        return {'missing': [], 'granted': [], 'token_valid': None, 'token_expires_at': None,
+                'checked_at': None, 'stale': True}
+
+    return {
+        'missing': status.missing,
+        'granted': status.granted,
+        'token_valid': status.token_valid,
+        'token_expires_at': status.token_expires_at,
+        'checked_at': status.checked_at,
+        'stale': timezone.now() - status.checked_at >= _status_ttl(),
+    }
+
+
+def refresh_permission_status(api=None):
+    """Fetch permissions and token validity from Facebook and store them
+
+    Returns the fresh permission info. If Facebook could not be reached the
+    stored status is left as it was.
+    """
+    api = api or FacebookGraphAPI()
+    permission_info = api.get_missing_permissions_info()
+    if not permission_info['current_permissions']:
+        logger.warning("Could not refresh permission status, keeping the cached one")
+        return permission_info
+
+    token_valid = None
+    token_expires_at = None
+    token_debug = api.debug_token()
+    if token_debug and 'data' in token_debug:
+        token_valid = token_debug['data'].get('is_valid')
+        # expires_at of 0 means the token never expires
+        if token_debug['data'].get('expires_at'):
+            token_expires_at = datetime.fromtimestamp(token_debug['data']['expires_at'], tz=dt_timezone.utc)
+
+    FacebookPermissionStatus.objects.update_or_create(
+        token_fingerprint=token_fingerprint(api.user_access_token),
+        defaults={
+            'missing': permission_info['missing'],
+            'granted': permission_info['granted'],
+            'token_valid': token_valid,
+            'token_expires_at': token_expires_at,
+            'checked_at': timezone.now(),
+        }
+    )
+    return permission_info
+
+
+def refresh_permission_status_if_stale(api=None):
+    """Refresh the stored status only when it is older than FACEBOOK_PERMISSION_STATUS_TTL"""
+    api = api or FacebookGraphAPI()
+    if get_permission_status(api.user_access_token)['stale']:
+        return refresh_permission_status(api)
+    return None
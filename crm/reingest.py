@@ -0,0 +1,213 @@
+"""
+Rebuild stored Facebook data from the raw response archive.
+
+Archived responses are fed through the same normalize_* functions and bulk
+writes the live sync uses, so a changed field mapping can be applied to
+everything ever fetched without a single Graph API call. Responses are read
+one kind at a time (pages, posts, names, conversations, comments, messages)
+so every row's parent exists before the row is written; within a kind, later
+responses overwrite earlier ones.
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+
+from .archive import iter_records
+from .facebook_api import FacebookGraphAPI
+from .identities import identity_cache
+from .models import FacebookConversation, FacebookPage, FacebookPost, FacebookUser
+from .sync import (
+    SyncStore, WRITE_CHUNK_SIZE, iter_chunks, latest, mark_page_synced, mark_post_comments_synced,
+    normalize_comment, normalize_message, normalize_post, parse_facebook_time, save_conversation, save_page,
+    user_identities,
+)
+
+
+def _fetched_at(record):
+    """When the archived response came back from Facebook"""
+    return datetime.fromtimestamp(record['t'], tz=dt_timezone.utc)
+
+
+def _edge_items(records):
+    """(object_id, item, fetched_at) for every item of the archived edge pages, e.g. (post_id, comment, ...)"""
+    for record in records:
+        body = record['body']
+        if isinstance(body, dict):
+            object_id = record['endpoint'].strip('/').split('/')[0]
+            for item in body.get('data', []):
+                yield object_id, item, _fetched_at(record)
+
+
+def _lookup_objects(records):
+    """(object, fetched_at) from archived ?ids= lookups"""
+    for record in records:
+        if isinstance(record['body'], dict):
+            yield from ((obj, _fetched_at(record)) for obj in record['body'].values()
+                        if isinstance(obj, dict) and obj.get('id'))
+
+
+class ArchiveIngest:
+    """One reingest run; page_ids optionally limits it to some pages"""
+
+    def __init__(self, directory=None, since=None, until=None, page_ids=None):
+        self.directory = directory
+        self.since = since
+        self.until = until
+        self.page_ids = set(page_ids) if page_ids else None
+        self.api = FacebookGraphAPI()  # only for placeholder names, never calls Facebook
+        self.store = SyncStore()
+        self.pages = {}
+        self.posts = {}
+        self.names = {}
+        self.conversations = {}
+        self.counts = {'records': 0, 'pages': 0, 'posts': 0, 'comments': 0, 'messages': 0, 'skipped': 0}
+
+    def records(self, *keys):
+        for record in iter_records(self.directory, keys, self.since, self.until):
+            self.counts['records'] += 1
+            yield record
+
+    def wanted(self, page_id):
+        return self.page_ids is None or page_id in self.page_ids
+
+    def run(self):
+        started = time.monotonic()
+        with transaction.atomic():
+            page_infos, user_bodies = self.read_objects()
+            self.ingest_posts(page_infos)
+            self.ingest_names(user_bodies)
+            self.ingest_conversations()
+            self.ingest_comments()
+            self.ingest_messages()
+        # Names in the LRU may be older than what was just written
+        identity_cache.clear()
+        self.counts['elapsed'] = time.monotonic() - started
+        return self.counts
+
+    def read_objects(self):
+        """Single-object responses: page infos by page ID, everything else as user profiles"""
+        bodies = {}
+        for record in self.records('{id}'):
+            if isinstance(record['body'], dict) and record['body'].get('id'):
+                bodies[record['body']['id']] = record['body']
+        page_infos = {}
+        for object_id, body in list(bodies.items()):
+            # Page info is the only single-object read that asks for a category
+            if 'category' in body or 'followers_count' in body or 'fan_count' in body:
+                page_infos[object_id] = bodies.pop(object_id)
+        return page_infos, bodies
+
+    def page(self, page_id, page_infos):
+        page = self.pages.get(page_id)
+        if page is None:
+            if page_id in page_infos:
+                page = save_page(page_id, page_infos[page_id])
+            else:
+                page, _ = FacebookPage.objects.get_or_create(page_id=page_id, defaults={'name': page_id})
+            self.pages[page_id] = page
+            self.counts['pages'] += 1
+        return page
+
+    def ingest_posts(self, page_infos):
+        """Posts from page feeds and from engagement refresh lookups"""
+        for page_id in page_infos:
+            if self.wanted(page_id):
+                self.page(page_id, page_infos)
+
+        newest = {}
+        # ?ids= lookups are engagement refreshes of posts or bulk name lookups of users
+        lookups = []
+        for obj, fetched_at in _lookup_objects(self.records('(root)')):
+            if '_' in obj['id'] and 'created_time' in obj:
+                lookups.append((obj['id'].split('_')[0], obj, fetched_at))
+            elif obj.get('name'):
+                self.names[obj['id']] = obj['name']
+
+        for source in (_edge_items(self.records('{id}/posts')), lookups):
+            for chunk in iter_chunks(source, WRITE_CHUNK_SIZE):
+                # Counters are snapshotted and go into the engagement history as of the archived response, not as of now
+                by_page = {}
+                for page_id, post_data, fetched_at in chunk:
+                    if self.wanted(page_id):
+                        by_page.setdefault((page_id, fetched_at), []).append(normalize_post(post_data))
+                for (page_id, fetched_at), rows in by_page.items():
+                    page = self.page(page_id, page_infos)
+                    self.posts.update(self.store.save_posts(page, rows, read_at=fetched_at))
+                    self.counts['posts'] += len(rows)
+                    newest[page_id] = latest(newest.get(page_id), *[row['created_time'] for row in rows])
+
+        for page_id, created_time in newest.items():
+            mark_page_synced(self.pages[page_id], created_time)
+
+    def ingest_names(self, user_bodies):
+        """Names from profile lookups, single and bulk, for commenters Facebook sent without one"""
+        for body in user_bodies.values():
+            if body.get('name'):
+                self.names[body['id']] = body['name']
+        self.store.users.add([FacebookUser(user_id=user_id, name=name, resolved=True)
+                              for user_id, name in self.names.items()])
+
+    def ingest_conversations(self):
+        for page_id, conversation, _ in _edge_items(self.records('{id}/conversations')):
+            if self.wanted(page_id) and conversation.get('id'):
+                self.conversations[conversation['id']] = (page_id, parse_facebook_time(conversation.get('updated_time')))
+
+    def post(self, post_id):
+        if post_id not in self.posts:
+            self.posts[post_id] = FacebookPost.objects.filter(post_id=post_id).first()
+        return self.posts[post_id]
+
+    def ingest_comments(self):
+        newest = {}
+        for chunk in iter_chunks(_edge_items(self.records('{id}/comments')), WRITE_CHUNK_SIZE):
+            by_post = {}
+            for post_id, comment_data, _ in chunk:
+                by_post.setdefault(post_id, []).append(comment_data)
+            for post_id, payloads in by_post.items():
+                # Graph post IDs are {page_id}_{post_number}
+                post = self.post(post_id) if self.wanted(post_id.split('_')[0]) else None
+                if post is None:
+                    self.counts['skipped'] += len(payloads)
+                    continue
+                rows = [normalize_comment(self.api, comment_data, self.names) for comment_data in payloads]
+                self.store.save_comments(post, rows, user_identities(payloads, rows, self.names))
+                self.counts['comments'] += len(rows)
+                newest[post_id] = latest(newest.get(post_id), *[row['created_time'] for row in rows])
+
+        self.store.flush()
+        for post_id, created_time in newest.items():
+            mark_post_comments_synced(self.posts[post_id], created_time)
+
+    def conversation_page(self, conversation_id):
+        if conversation_id not in self.conversations:
+            stored = FacebookConversation.objects.filter(conversation_id=conversation_id).select_related('page').first()
+            self.conversations[conversation_id] = (stored.page.page_id, stored.updated_time) if stored else None
+        known = self.conversations[conversation_id]
+        if known is None:
+            return None, None
+        page_id, updated_time = known
+        if page_id not in self.pages:
+            self.pages[page_id] = FacebookPage.objects.filter(page_id=page_id).first()
+        return self.pages[page_id], updated_time
+
+    def ingest_messages(self):
+        newest = {}
+        for chunk in iter_chunks(_edge_items(self.records('{id}/messages')), WRITE_CHUNK_SIZE):
+            by_conversation = {}
+            for conversation_id, message_data, _ in chunk:
+                by_conversation.setdefault(conversation_id, []).append(message_data)
+            for conversation_id, payloads in by_conversation.items():
+                page, _ = self.conversation_page(conversation_id)
+                if page is None or not self.wanted(page.page_id):
+                    self.counts['skipped'] += len(payloads)
+                    continue
+                rows = [normalize_message(message_data) for message_data in payloads]
+                self.store.save_messages(page, rows, user_identities(payloads, rows), conversation_id)
+                self.counts['messages'] += len(rows)
+                newest[conversation_id] = latest(newest.get(conversation_id), *[row['created_time'] for row in rows])
+
+        self.store.flush()
+        for conversation_id, created_time in newest.items():
+            page, updated_time = self.conversation_page(conversation_id)
+            save_conversation(page, conversation_id, updated_time, created_time)
@@ -0,0 +1,175 @@
+"""
+Daily engagement rollups for trend charts.
+
+PageDailyStats counts, per page and day, the posts, comments and messages
+created that day and the reactions and shares on that day's posts.
+PostDailySnapshot keeps each post's counters as last read on every day the
+sync refreshed them. The sync writer maintains both incrementally, in the same
+transactions as the rows they count: newly inserted comments and messages are
+added to their day, and re-read posts add the change in their counters. A
+growth curve is then a few hundred rollup rows instead of a scan over every
+post and comment.
+
+`manage.py rebuildrollups` recomputes the daily counts from the stored rows,
+e.g. after rows were deleted or restored outside the sync.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FacebookComment, FacebookMessage, FacebookPost, PageDailyStats, PostDailySnapshot
+
+
+COUNT_FIELDS = ['posts_count', 'comments_count', 'messages_count', 'reactions_count', 'shares_count']
+
+
+def day_of(value):
+    """Rollup day of a datetime, in the project time zone"""
+    return timezone.localdate(value)
+
+
+class DailyCounts:
+    """Additions to PageDailyStats collected in memory and written with one UPDATE per page and day"""
+
+    def __init__(self):
+        self.amounts = {}
+
+    def add(self, page_id, when, field, amount=1):
+        if amount:
+            fields = self.amounts.setdefault((page_id, day_of(when)), {})
+            fields[field] = fields.get(field, 0) + amount
+
+    def save(self):
+        if not self.amounts:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            PageDailyStats.objects.bulk_create(
+                [PageDailyStats(page_id=page_id, date=day) for page_id, day in self.amounts], ignore_conflicts=True
+            )
+            for (page_id, day), fields in self.amounts.items():
+                PageDailyStats.objects.filter(page_id=page_id, date=day).update(
+                    updated_at=now, **{field: F(field) + amount for field, amount in fields.items()}
+                )
+        self.amounts = {}
+
+
+# ---------------------------------------------------------------------------
+# Sync hooks: called on the writer thread inside the write transaction
+# ---------------------------------------------------------------------------
+
+def record_posts(posts, previous):
+    """Count saved posts on their publication day; previous maps post_id to stored counters"""
+    counts = DailyCounts()
+    for post in posts:
+        before = previous.get(post.post_id)
+        if before is None:
+            counts.add(post.page_id, post.created_time, 'posts_count')
+            before = {'likes_count': 0, 'shares_count': 0}
+        counts.add(post.page_id, post.created_time, 'reactions_count', post.likes_count - before['likes_count'])
+        counts.add(post.page_id, post.created_time, 'shares_count', post.shares_count - before['shares_count'])
+    counts.save()
+
+
+def snapshot_posts(posts, now=None):
+    """Store the posts' engagement counters as read at now (default: now) on that day
+
+    A reading replaces an earlier one from the same day but never a later
+    one, so reingesting old responses leaves newer snapshots alone.
+    """
+    now = now or timezone.now()
+    day = day_of(now)
+    posts = list(posts)
+    newer = set(
+        PostDailySnapshot.objects.filter(post__in=[post.pk for post in posts], date=day, captured_at__gt=now)
+        .values_list('post_id', flat=True)
+    )
+    PostDailySnapshot.objects.bulk_create(
+        [
+            PostDailySnapshot(post_id=post.pk, date=day, likes_count=post.likes_count,
+                              comments_count=post.comments_count, shares_count=post.shares_count, captured_at=now)
+            for post in posts if post.pk not in newer
+        ],
+        update_conflicts=True, unique_fields=['post', 'date'],
+        update_fields=['likes_count', 'comments_count', 'shares_count', 'captured_at'],
+    )
+
+
+def record_comments(comments):
+    """on_insert hook of the comment buffer: count new comments on their page and day"""
+    counts = DailyCounts()
+    for comment in comments:
+        counts.add(comment.post.page_id, comment.created_time, 'comments_count')
+    counts.save()
+
+
+def record_messages(messages):
+    """on_insert hook of the message buffer: count new messages on their page and day"""
+    counts = DailyCounts()
+    for message in messages:
+        counts.add(message.page_id, message.created_time, 'messages_count')
+    counts.save()
+
+
+def record_followers(page, now=None):
+    """Remember the page's follower count for today"""
+    stats, _ = PageDailyStats.objects.get_or_create(page=page, date=day_of(now or timezone.now()))
+    stats.followers_count = page.followers_count
+    stats.save(update_fields=['followers_count', 'updated_at'])
+
+
+# ---------------------------------------------------------------------------
+# Rebuild and reads
+# ---------------------------------------------------------------------------
+
+def rebuild_daily_stats(pages=None):
+    """Recompute the daily counts from stored rows, returns the number of page days written
+
+    Follower counts can't be recomputed and are kept; rows left without any
+    count or follower reading are deleted.
+    """
+    posts = FacebookPost.objects.all()
+    comments = FacebookComment.objects.all()
+    messages = FacebookMessage.objects.all()
+    stats = PageDailyStats.objects.all()
+    if pages is not None:
+        posts = posts.filter(page__in=pages)
+        comments = comments.filter(post__page__in=pages)
+        messages = messages.filter(page__in=pages)
+        stats = stats.filter(page__in=pages)
+
+    counts = DailyCounts()
+    grouped = [
+        (posts, 'page_id', {'posts_count': Count('id'), 'reactions_count': Sum('likes_count'),
+                            'shares_count': Sum('shares_count')}),
+        (comments, 'post__page_id', {'comments_count': Count('id')}),
+        (messages, 'page_id', {'messages_count': Count('id')}),
+    ]
+    for queryset, page_field, aggregates in grouped:
+        rows = queryset.order_by().annotate(day=TruncDate('created_time')).values(page_field, 'day').annotate(**aggregates)
+        for row in rows:
+            fields = counts.amounts.setdefault((row[page_field], row['day']), {})
+            fields.update((name, row[name]) for name in aggregates if row[name])
+
+    with transaction.atomic():
+        stats.update(**{field: 0 for field in COUNT_FIELDS})
+        written = len(counts.amounts)
+        counts.save()
+        stats.filter(followers_count__isnull=True, **{field: 0 for field in COUNT_FIELDS}).delete()
+    return written
+
+
+def page_daily_series(page, since=None):
+    """The page's daily rows oldest first, as dicts ready for JSON"""
+    rows = PageDailyStats.objects.filter(page=page)
+    if since:
+        rows = rows.filter(date__gte=since)
+    return list(rows.order_by('date').values('date', 'followers_count', *COUNT_FIELDS))
+
+
+def post_growth(post):
+    """The post's engagement readings oldest first, as dicts ready for JSON"""
+    return list(
+        post.daily_snapshots.order_by('date').values('date', 'likes_count', 'comments_count', 'shares_count')
+    )
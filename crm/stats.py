@@ -0,0 +1,79 @@
+"""
+Dashboard statistics and data.
+
+Totals are computed by the database (row counts in one query, post sums in
+one aggregate) rather than by loading model instances, and cached for a
+short TTL so page views don't rescan the tables every time. Listings are fetched once each, joined to the
+related rows the templates display and narrowed to the columns they use.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import FacebookPage, FacebookPost, FacebookComment, FacebookMessage
+
+
+DASHBOARD_TOTALS_CACHE_KEY = 'crm:dashboard_totals'
+
+
+def count_rows(*models):
+    """COUNT(*) of each model's table, in one query"""
+    counts = ', '.join(f"(SELECT COUNT(*) FROM {connection.ops.quote_name(model._meta.db_table)})" for model in models)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {counts}")
+        return cursor.fetchone()
+
+
+def compute_dashboard_totals():
+    """Post, like, comment, share and message totals: one query for the row counts, one for the post sums"""
+    total_posts, total_comments, total_messages = count_rows(FacebookPost, FacebookComment, FacebookMessage)
+    totals = FacebookPost.objects.aggregate(
+        total_likes=Coalesce(Sum('likes_count'), 0),
+        total_shares=Coalesce(Sum('shares_count'), 0),
+    )
+    totals.update(total_posts=total_posts, total_comments=total_comments, total_messages=total_messages)
+    return totals
+
+
+def get_dashboard_totals():
+    """Dashboard totals, cached for FACEBOOK_DASHBOARD_STATS_TTL seconds (0 disables caching)"""
+    ttl = getattr(settings, 'FACEBOOK_DASHBOARD_STATS_TTL', 30)
+    if not ttl:
+        return compute_dashboard_totals()
+    return cache.get_or_set(DASHBOARD_TOTALS_CACHE_KEY, compute_dashboard_totals, ttl)
+
+
+def get_dashboard_activity(posts_limit=20, comments_limit=50, messages_limit=50):
+    """Pages plus the newest posts, comments and messages, one query per list
+
+    Each list is evaluated here so callers can slice the "recent" subsets out
+    of it without another query.
+    """
+    pages = FacebookPage.objects.only('page_id', 'name', 'category', 'followers_count')
+    posts = (
+        FacebookPost.objects
+        .select_related('page')
+        .only('post_id', 'message', 'created_time', 'likes_count', 'comments_count', 'shares_count', 'page__name')
+        .order_by('-created_time')[:posts_limit]
+    )
+    comments = (
+        FacebookComment.objects
+        .select_related('post__page', 'user')
+        .only('comment_id', 'message', 'from_name', 'from_id', 'created_time', 'post__post_id', 'post__page__name',
+              'user__name')
+        .order_by('-created_time')[:comments_limit]
+    )
+    messages = (
+        FacebookMessage.objects
+        .select_related('page', 'user')
+        .only('message_id', 'message', 'from_name', 'from_id', 'created_time', 'page__name', 'user__name')
+        .order_by('-created_time')[:messages_limit]
+    )
+    return {
+        'pages': list(pages),
+        'posts': list(posts),
+        'comments': list(comments),
+        'messages': list(messages),
+    }
@@ -0,0 +1,892 @@
+"""
+Facebook data sync engine.
+
+Graph API fetches for independent pages, comment batches and conversation
+batches run concurrently on a bounded thread pool. Every database write is
+funnelled through a single writer thread, so SQLite only ever sees one writer
+no matter how many fetches are in flight.
+"""
+import logging
+import queue
+import threading
+import time
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .facebook_api import FacebookGraphAPI, GraphAPIError, BATCH_SIZE_LIMIT, circuit_breakers, rate_governor, request_stats
+from .permissions import refresh_permission_status
+from .archive import flush_archive
+from .memo import LookupMemo
+from .history import EngagementHistory
+from .metrics import metrics
+from .rollups import record_comments, record_followers, record_messages, record_posts, snapshot_posts
+from .tokens import save_page_tokens
+from .identities import identity_cache, keep_resolved_name, load_user_names
+from .models import FacebookPage, FacebookPost, FacebookComment, FacebookConversation, FacebookMessage, FacebookUser
+
+
+logger = logging.getLogger(__name__)
+
+
+# Names we generated ourselves and are happy to overwrite with a real one
+PLACEHOLDER_NAMES = ['Anonymous User', 'Anonymous Commenter', 'Unknown User', '']
+
+# Rows handed to the writer per call while streaming paged results
+WRITE_CHUNK_SIZE = 100
+
+# Keys per `IN (...)` lookup when checking which rows already exist
+UPSERT_LOOKUP_CHUNK = 500
+
+# Minimum seconds between progress callbacks
+PROGRESS_INTERVAL = 1.0
+
+
+class SyncError(Exception):
+    """Raised when a sync cannot run at all, e.g. the page list is unavailable"""
+
+
+def parse_facebook_time(value):
+    """Parse a Graph API timestamp, falling back to now for missing or bad values"""
+    if value:
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            pass
+    return timezone.now()
+
+
+def latest(*values):
+    """Newest of the given datetimes, ignoring None"""
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def engagement_refresh_interval(age):
+    """How long a post's engagement counters stay fresh, doubling with each day of age
+
+    A post published today is re-read every FACEBOOK_SYNC_REFRESH_BASE_MINUTES,
+    a week-old post roughly daily (capped by FACEBOOK_SYNC_REFRESH_MAX_HOURS).
+    """
+    base = timedelta(minutes=getattr(settings, 'FACEBOOK_SYNC_REFRESH_BASE_MINUTES', 15))
+    cap = timedelta(hours=getattr(settings, 'FACEBOOK_SYNC_REFRESH_MAX_HOURS', 24))
+    age_days = min(max(age.days, 0), 30)
+    return min(base * (2 ** age_days), cap)
+
+
+def iter_chunks(iterable, size):
+    """Lazily group any iterable into lists of at most size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ---------------------------------------------------------------------------
+# Normalisation: Graph API payloads -> model field dicts (worker threads)
+# ---------------------------------------------------------------------------
+
+def normalize_post(post_data):
+    """Extract the stored fields and engagement counts from a post payload"""
+    post_id = post_data['id']
+
+    reactions_count = 0
+    likes_count = 0
+    comments_count = 0
+    shares_count = 0
+
+    # Get reactions count
+    if 'reactions' in post_data and 'summary' in post_data['reactions']:
+        reactions_count = post_data['reactions']['summary'].get('total_count', 0)
+
+    # Get likes count (separate from reactions)
+    if 'likes' in post_data and 'summary' in post_data['likes']:
+        likes_count = post_data['likes']['summary'].get('total_count', 0)
+
+    # Get comments count
+    if 'comments' in post_data and 'summary' in post_data['comments']:
+        comments_count = post_data['comments']['summary'].get('total_count', 0)
+
+    # Get shares count
+    if 'shares' in post_data:
+        shares_count = post_data['shares'].get('count', 0)
+
+    return {
+        'post_id': post_id,
+        'message': post_data.get('message', '') or post_data.get('story', ''),
+        'created_time': parse_facebook_time(post_data.get('created_time', '')),
+        # Use the higher of reactions or likes
+        'likes_count': max(reactions_count, likes_count),
+        'comments_count': comments_count,
+        'shares_count': shares_count,
+    }
+
+
+def normalize_comment(api, comment_data, names):
+    """Extract comment fields, using a bulk-resolved name or inventing one when Facebook hides it
+
+    names maps user IDs to names resolved ahead of time for the whole chunk.
+    """
+    comment_id = comment_data['id']
+    from_info = comment_data.get('from', {})
+    from_name = from_info.get('name', '')
+    from_id = from_info.get('id', '')
+    comment_message = comment_data.get('message', '')
+
+    if logger.isEnabledFor(logging.DEBUG) and getattr(settings, 'FACEBOOK_LOG_PAYLOADS', False):
+        logger.debug("Raw comment data: %s", comment_data)
+
+    # Handle Facebook API limitation where 'from' field is completely missing
+    if not from_info or (not from_name and not from_id):
+        logger.debug("No user data available for comment %s", comment_id)
+        from_name, from_id = api.generate_smart_placeholder_name(comment_id, comment_message)
+        logger.debug("Generated smart placeholder: %s (ID: %s)", from_name, from_id)
+
+    elif not from_name and from_id:
+        # We have ID but no name - use the name resolved for this user, if any
+        if names.get(from_id):
+            from_name = names[from_id]
+        else:
+            from_name = f"User {from_id[:8]}..."
+            logger.debug("Using ID-based placeholder for user %s", from_id)
+
+    elif not from_name:
+        # No name available at all
+        from_name, _ = api.generate_smart_placeholder_name(comment_id, comment_message)
+        logger.debug("Using smart placeholder name: %s", from_name)
+
+    return {
+        'comment_id': comment_id,
+        'message': comment_message,
+        'from_name': from_name,
+        'from_id': from_id,
+        # Only IDs Facebook gave us, never ones guessed from the comment ID
+        'user_id': from_info.get('id') or None,
+        'created_time': parse_facebook_time(comment_data.get('created_time', '')),
+    }
+
+
+def normalize_message(message_data):
+    """Extract sender and content fields from a conversation message payload"""
+    from_info = message_data.get('from', {})
+    message_content = message_data.get('message', '')
+
+    # Handle attachments
+    attachments = message_data.get('attachments', {}).get('data', [])
+    if attachments and not message_content:
+        attachment_names = [att.get('name', 'Attachment') for att in attachments]
+        message_content = f"[Attachments: {', '.join(attachment_names)}]"
+
+    return {
+        'message_id': message_data['id'],
+        'message': message_content,
+        'from_name': from_info.get('name', 'Anonymous User'),
+        'from_id': from_info.get('id', ''),
+        'user_id': from_info.get('id') or None,
+        'created_time': parse_facebook_time(message_data.get('created_time', '')),
+    }
+
+
+def user_identities(payloads, rows, names=()):
+    """FacebookUser rows for the senders of normalised comments or messages
+
+    Only senders with a real Facebook ID get one; a sender whose name neither
+    came with the payload nor was resolved is stored without a name.
+    """
+    users = {}
+    for data, row in zip(payloads, rows):
+        user_id = row['user_id']
+        if not user_id:
+            continue
+        resolved = bool(data.get('from', {}).get('name')) or user_id in names
+        if resolved or user_id not in users:
+            users[user_id] = FacebookUser(user_id=user_id, name=row['from_name'] if resolved else '', resolved=resolved)
+    return list(users.values())
+
+
+# ---------------------------------------------------------------------------
+# Persistence: only ever called on the writer thread
+# ---------------------------------------------------------------------------
+
+def existing_ids(model, field, ids):
+    """Return which of the given external IDs are already stored"""
+    return set(model.objects.filter(**{f'{field}__in': ids}).values_list(field, flat=True))
+
+
+def posts_due_for_refresh(page, now=None):
+    """Recent posts whose engagement counters are older than their refresh interval"""
+    now = now or timezone.now()
+    window = timedelta(days=getattr(settings, 'FACEBOOK_SYNC_REFRESH_WINDOW_DAYS', 30))
+    candidates = FacebookPost.objects.filter(page=page, created_time__gte=now - window)
+
+    due = []
+    for post in candidates:
+        interval = engagement_refresh_interval(now - post.created_time)
+        if post.last_synced_at is None or now - post.last_synced_at >= interval:
+            due.append(post)
+    return due
+
+
+def mark_page_synced(page, posts_synced_until):
+    """Advance the page's post watermark after its new posts have been stored"""
+    page.posts_synced_until = latest(page.posts_synced_until, posts_synced_until)
+    page.last_synced_at = timezone.now()
+    page.save(update_fields=['posts_synced_until', 'last_synced_at'])
+
+
+def mark_post_comments_synced(post, comments_synced_until):
+    """Advance the post's comment watermark after its new comments have been stored"""
+    post.comments_synced_until = latest(post.comments_synced_until, comments_synced_until)
+    post.save(update_fields=['comments_synced_until'])
+
+
+def load_conversations(conversation_ids):
+    """Stored conversations for the given IDs, as {conversation_id: FacebookConversation}"""
+    return FacebookConversation.objects.in_bulk(conversation_ids, field_name='conversation_id')
+
+
+def save_conversation(page, conversation_id, updated_time, messages_synced_until):
+    """Record how far a conversation has been synced"""
+    conversation, _ = FacebookConversation.objects.get_or_create(
+        conversation_id=conversation_id, defaults={'page': page}
+    )
+    conversation.updated_time = updated_time
+    conversation.messages_synced_until = latest(conversation.messages_synced_until, messages_synced_until)
+    conversation.last_synced_at = timezone.now()
+    conversation.save()
+
+
+def save_page(page_id, page_info):
+    """Create or update a page from its Graph API info"""
+    followers_count = page_info.get('followers_count', 0) or page_info.get('fan_count', 0)
+    page, created = FacebookPage.objects.get_or_create(
+        page_id=page_id,
+        defaults={
+            'name': page_info.get('name', ''),
+            'category': page_info.get('category', ''),
+            'followers_count': followers_count,
+        }
+    )
+
+    if not created:
+        page.name = page_info.get('name', page.name)
+        page.category = page_info.get('category', page.category)
+        page.followers_count = followers_count
+        page.save()
+
+    record_followers(page)
+    logger.info("Page saved: %s", page.name)
+    return page
+
+
+def is_placeholder_name(name):
+    """True for names we generated ourselves and are happy to overwrite with a real one"""
+    return name in PLACEHOLDER_NAMES or 'Anonymous_' in name
+
+
+def keep_real_comment_name(comment, stored):
+    """Upsert merge rule: only placeholder names on stored comments get replaced"""
+    if not is_placeholder_name(stored['from_name']):
+        comment.from_name = stored['from_name']
+        comment.from_id = stored['from_id']
+
+
+def record_write(model, rows, elapsed):
+    """Write time and throughput of one bulk write, for the sync metrics"""
+    model_name = model._meta.model_name
+    metrics.observe('facebook_sync_flush_seconds', elapsed, model=model_name)
+    metrics.inc('facebook_sync_rows_total', rows, model=model_name)
+    if elapsed > 0:
+        metrics.observe('facebook_sync_rows_per_second', rows / elapsed, model=model_name)
+
+
+def bulk_upsert(model, objs, unique_field, update_fields=None, merge=None, on_insert=None):
+    """Insert or update objs in one transaction, returns (inserted, updated)
+
+    Existing keys are read in the same transaction so the counts are exact and
+    merge(obj, stored_values) can adjust an incoming object before it
+    overwrites update_fields. on_insert(new_objs) is called in the transaction
+    with the objects that weren't stored yet. Without update_fields,
+    conflicting rows are left untouched.
+    """
+    # Last one wins when the same key shows up twice in a chunk
+    objs = list({getattr(obj, unique_field): obj for obj in objs}.values())
+    if not objs:
+        return 0, 0
+
+    with transaction.atomic():
+        keys = [getattr(obj, unique_field) for obj in objs]
+        stored = {}
+        for start in range(0, len(keys), UPSERT_LOOKUP_CHUNK):
+            rows = model.objects.filter(**{f'{unique_field}__in': keys[start:start + UPSERT_LOOKUP_CHUNK]})
+            stored.update((row[unique_field], row) for row in rows.values(unique_field, *(update_fields or [])))
+
+        if merge:
+            for obj in objs:
+                if getattr(obj, unique_field) in stored:
+                    merge(obj, stored[getattr(obj, unique_field)])
+
+        if on_insert:
+            on_insert([obj for obj in objs if getattr(obj, unique_field) not in stored])
+
+        if update_fields:
+            model.objects.bulk_create(
+                objs, update_conflicts=True, unique_fields=[unique_field], update_fields=update_fields
+            )
+            return len(objs) - len(stored), len(stored)
+
+        model.objects.bulk_create(objs, ignore_conflicts=True)
+        return len(objs) - len(stored), 0
+
+
+class UpsertBuffer:
+    """Collects model instances on the writer thread and bulk upserts them in chunks
+
+    Callbacks registered with defer() run inside the transaction of the next
+    flush, so watermarks never get ahead of the rows they describe.
+    """
+
+    def __init__(self, model, unique_field, update_fields=None, merge=None, chunk_size=None, flush_first=(),
+                 on_insert=None):
+        self.model = model
+        self.unique_field = unique_field
+        self.update_fields = update_fields
+        self.merge = merge
+        self.on_insert = on_insert
+        self.chunk_size = chunk_size or getattr(settings, 'FACEBOOK_SYNC_WRITE_CHUNK_SIZE', 1000)
+        # Buffers holding rows ours reference, written before ours
+        self.flush_first = flush_first
+        self.pending = []
+        self.deferred = []
+        self.inserted = 0
+        self.updated = 0
+
+    def add(self, objs):
+        self.pending.extend(objs)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def defer(self, fn, *args):
+        self.deferred.append((fn, args))
+
+    def flush(self):
+        """Write everything buffered in one transaction, returns (inserted, updated)"""
+        for buffer in self.flush_first:
+            buffer.flush()
+        if not self.pending and not self.deferred:
+            return 0, 0
+
+        objs, self.pending = self.pending, []
+        deferred, self.deferred = self.deferred, []
+        start = time.perf_counter()
+        with transaction.atomic():
+            inserted, updated = bulk_upsert(
+                self.model, objs, self.unique_field, self.update_fields, self.merge, self.on_insert
+            )
+            for fn, args in deferred:
+                fn(*args)
+        record_write(self.model, len(objs), time.perf_counter() - start)
+
+        self.inserted += inserted
+        self.updated += updated
+        logger.info("Flushed %d %s: %d new, %d updated", len(objs), self.model._meta.verbose_name_plural, inserted, updated)
+        return inserted, updated
+
+
+class SyncStore:
+    """Writer-thread side of a sync: bulk writes plus insert/update counts per model
+
+    Daily rollups (see crm.rollups) are updated in the same transactions;
+    engagement observations (see crm.history) are written with each flush.
+    """
+
+    def __init__(self):
+        self.posts_inserted = 0
+        self.posts_updated = 0
+        self.users = UpsertBuffer(FacebookUser, 'user_id', ['name', 'resolved', 'updated_at'], merge=keep_resolved_name)
+        self.comments = UpsertBuffer(
+            FacebookComment, 'comment_id', ['from_name', 'from_id', 'user'], merge=keep_real_comment_name,
+            flush_first=[self.users], on_insert=record_comments,
+        )
+        # Messages never change; thread_id is only filled in on messages stored before it was kept
+        self.messages = UpsertBuffer(
+            FacebookMessage, 'message_id', ['thread_id'], flush_first=[self.users], on_insert=record_messages,
+        )
+        self.history = EngagementHistory()
+
+    def save_posts(self, page, rows, read_at=None):
+        """Upsert a chunk of posts right away (comments need their keys), returns {post_id: FacebookPost}
+
+        read_at is when Facebook returned these counters, for the snapshots and
+        engagement history; reingest passes the archived response's time.
+        """
+        now = timezone.now()
+        read_at = read_at or now
+        objs = [FacebookPost(page=page, last_synced_at=now, **row) for row in rows]
+        # Counters as stored before this write, for the rollup deltas
+        previous = {}
+
+        def remember(obj, stored):
+            previous[obj.post_id] = stored
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            inserted, updated = bulk_upsert(
+                FacebookPost, objs, 'post_id',
+                ['message', 'likes_count', 'comments_count', 'shares_count', 'last_synced_at'],
+                merge=remember,
+            )
+            posts = FacebookPost.objects.in_bulk([row['post_id'] for row in rows], field_name='post_id')
+            record_posts(posts.values(), previous)
+            snapshot_posts(posts.values(), read_at)
+            self.history.observe(posts.values(), previous, read_at)
+        record_write(FacebookPost, len(objs), time.perf_counter() - start)
+        self.posts_inserted += inserted
+        self.posts_updated += updated
+        logger.info("Saved %d posts: %d new, %d updated", len(objs), inserted, updated)
+        return posts
+
+    def save_comments(self, post, rows, users=()):
+        self.users.add(users)
+        self.comments.add([FacebookComment(post=post, **row) for row in rows])
+
+    def save_messages(self, page, rows, users=(), thread_id=''):
+        self.users.add(users)
+        self.messages.add([FacebookMessage(page=page, thread_id=thread_id, **row) for row in rows])
+
+    def flush(self):
+        self.users.flush()
+        self.comments.flush()
+        self.messages.flush()
+        self.history.flush()
+
+    def counts(self):
+        return {
+            'posts': {'inserted': self.posts_inserted, 'updated': self.posts_updated},
+            'comments': {'inserted': self.comments.inserted, 'updated': self.comments.updated},
+            'messages': {'inserted': self.messages.inserted, 'updated': self.messages.updated},
+            'users': {'inserted': self.users.inserted, 'updated': self.users.updated},
+        }
+
+
+# ---------------------------------------------------------------------------
+# Engine
+# ---------------------------------------------------------------------------
+
+class SyncWriter:
+    """Single database writer thread; callers submit callables and get Futures back"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='facebook-sync-writer', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn on the writer thread and wait for its result"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def close(self):
+        """Finish queued writes and stop the thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            # The writer owns its own DB connection; release it with the thread
+            connections.close_all()
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight Graph API work per page and per access token"""
+
+    def __init__(self, per_page, per_token):
+        self.per_page = per_page
+        self.per_token = per_token
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def _semaphore(self, kind, key, size):
+        with self._lock:
+            semaphore = self._semaphores.get((kind, key))
+            if semaphore is None:
+                semaphore = self._semaphores[(kind, key)] = threading.BoundedSemaphore(size)
+            return semaphore
+
+    @contextmanager
+    def slot(self, page_id, token):
+        # Always acquire page before token so two tasks can never deadlock
+        with self._semaphore('page', page_id, self.per_page):
+            with self._semaphore('token', token, self.per_token):
+                yield
+
+
+class FacebookSyncEngine:
+    """Syncs pages, posts, comments and messages with concurrent fetching"""
+
+    def __init__(self, api=None, max_workers=None, per_page_limit=None, per_token_limit=None, progress=None,
+                 field_profile=None):
+        self.api = api or FacebookGraphAPI(field_profile=field_profile)
+        # progress(counts) is called on the writer thread, at most every PROGRESS_INTERVAL seconds
+        self.progress = progress
+        self._last_progress = 0.0
+        self.max_workers = max_workers or getattr(settings, 'FACEBOOK_SYNC_MAX_WORKERS', 8)
+        self.limiter = ConcurrencyLimiter(
+            per_page_limit or getattr(settings, 'FACEBOOK_SYNC_PER_PAGE_CONCURRENCY', 4),
+            per_token_limit or getattr(settings, 'FACEBOOK_SYNC_PER_TOKEN_CONCURRENCY', 4),
+        )
+        self.counts = {'pages': 0, 'posts': 0, 'comments': 0, 'messages': 0}
+        self.errors = []
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._outstanding = 0
+        self._pool = None
+        self.writer = None
+        self.store = SyncStore()
+
+    def run(self):
+        """Run a full sync and return the processed counts and permission info"""
+        logger.info("Starting Facebook data sync")
+        started = time.monotonic()
+        requests_before = request_stats.snapshot()
+
+        # Refresh the cached permission status the dashboard reads
+        with metrics.timer('facebook_sync_stage_seconds', stage='permissions'):
+            permission_info = refresh_permission_status(self.api)
+        logger.info("Missing permissions: %s", [p['permission'] for p in permission_info['missing']])
+        logger.info("Granted permissions: %s", [p['permission'] for p in permission_info['granted']])
+
+        # Get pages
+        with metrics.timer('facebook_sync_stage_seconds', stage='pages'):
+            pages_data = self.api.get_pages()
+        if not pages_data or 'data' not in pages_data:
+            raise SyncError("Failed to fetch pages from Facebook API.")
+
+        # me/accounts already returns every page token: store them for other processes
+        # and hand them to the client so workers never have to look them up
+        page_tokens = save_page_tokens(pages_data['data'], self.api.user_access_token)
+        for page_data in pages_data['data']:
+            # A page listed without a token is left to get_page_access_token and the shared store
+            if page_tokens.get(page_data['id']):
+                self.api.page_tokens.setdefault(page_data['id'], page_tokens[page_data['id']])
+
+        # Skip fallback lookups earlier syncs found dead, start with the ones that worked
+        self.api.memo = LookupMemo.load()
+
+        self.writer = SyncWriter()
+        self.writer.start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='facebook-sync') as pool:
+                self._pool = pool
+                for page_data in pages_data['data']:
+                    self._submit(self.sync_page, page_data['id'])
+                self._wait_until_idle()
+        finally:
+            # Whatever was fetched before a failure is still worth keeping
+            with metrics.timer('facebook_sync_stage_seconds', stage='final_flush'):
+                self.writer.call(self.store.flush)
+            self.writer.call(self.api.memo.save)
+            flush_archive()
+            if self.progress:
+                self.writer.call(self.progress, dict(self.counts))
+            self.writer.close()
+
+        metrics.observe('facebook_sync_duration_seconds', time.monotonic() - started)
+        requests_after = request_stats.snapshot()
+        calls = requests_after['calls'] - requests_before['calls']
+        logger.info(
+            "Sync completed in %.1fs: %d pages, %d posts, %d comments, %d messages, %d errors; "
+            "%d Graph API calls (%d failed), %.0f ms average, %d KB received",
+            time.monotonic() - started, self.counts['pages'], self.counts['posts'], self.counts['comments'],
+            self.counts['messages'], len(self.errors), calls,
+            requests_after['errors'] - requests_before['errors'],
+            (requests_after['total_time'] - requests_before['total_time']) / calls * 1000 if calls else 0,
+            (requests_after['bytes'] - requests_before['bytes']) // 1024,
+        )
+        return dict(
+            self.counts, writes=self.store.counts(), errors=list(self.errors), permission_info=permission_info,
+            rate_limits=rate_governor.snapshot(), circuits=circuit_breakers.snapshot(),
+        )
+
+    # -- task plumbing ------------------------------------------------------
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self._outstanding += 1
+        self._pool.submit(self._run_task, fn, *args)
+
+    def _run_task(self, fn, *args):
+        try:
+            # Tasks are the sync stages: sync_page, sync_comments, sync_conversations, sync_messages
+            with metrics.timer('facebook_sync_stage_seconds', stage=fn.__name__):
+                fn(*args)
+        except Exception as e:
+            logger.exception("Sync task %s%s failed", fn.__name__, args[:1])
+            with self._lock:
+                self.errors.append(str(e))
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                if self._outstanding == 0:
+                    self._idle.notify_all()
+
+    def _incomplete(self, what, error):
+        """A paged stream broke off part way: count it as an error; the caller keeps its watermark"""
+        logger.warning("%s incomplete, will resume next sync: %s", what, error)
+        with self._lock:
+            self.errors.append(f"{what} incomplete: {error}")
+
+    def _wait_until_idle(self):
+        # Tasks submit their follow-up work before finishing, so zero means done
+        with self._lock:
+            while self._outstanding:
+                self._idle.wait()
+
+    def _count(self, key, amount):
+        snapshot = None
+        with self._lock:
+            self.counts[key] += amount
+            if self.progress and time.monotonic() - self._last_progress >= PROGRESS_INTERVAL:
+                self._last_progress = time.monotonic()
+                snapshot = dict(self.counts)
+        if snapshot:
+            # Reported through the writer so only that thread touches the database
+            self.writer.submit(self.progress, snapshot)
+
+    def _limited(self, page_id, token, iterator):
+        """Advance a lazy Graph API iterator, holding the page/token slot for each fetch"""
+        iterator = iter(iterator)
+        while True:
+            with self.limiter.slot(page_id, token):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    # -- tasks ----------------------------------------------------------------
+
+    def sync_page(self, page_id):
+        """Save one page, fetch posts newer than its watermark and refresh due engagement"""
+        logger.info("Processing page %s", page_id)
+        token = self.api.get_page_access_token(page_id)
+
+        with self.limiter.slot(page_id, token):
+            page_info = self.api.get_page_info(page_id)
+        if not page_info:
+            return
+
+        page = self.writer.call(save_page, page_id, page_info)
+        self._count('pages', 1)
+
+        # Conversations are independent of posts, start them straight away
+        self._submit(self.sync_conversations, page)
+
+        # Only posts created since the page's watermark are requested
+        newest = None
+        posts_iter = self.api.iter_page_posts(page_id, since=page.posts_synced_until)
+        try:
+            for chunk in iter_chunks(self._limited(page_id, token, posts_iter), WRITE_CHUNK_SIZE):
+                rows = [normalize_post(post_data) for post_data in chunk]
+                posts = self.writer.call(self.store.save_posts, page, rows)
+                self._count('posts', len(posts))
+                self._queue_comments(page_id, [posts[row['post_id']] for row in rows if row['comments_count'] > 0])
+                newest = latest(newest, *[row['created_time'] for row in rows])
+        except GraphAPIError as e:
+            # Posts come newest first: advancing the watermark would skip the older ones for good
+            self._incomplete(f"Posts of page {page_id}", e)
+        else:
+            self.writer.call(mark_page_synced, page, newest)
+        with metrics.timer('facebook_sync_stage_seconds', stage='refresh_engagement'):
+            self.refresh_engagement(page, token)
+
+    def refresh_engagement(self, page, token):
+        """Re-read counters for recent posts on their decaying schedule, 50 posts per call"""
+        due = self.writer.call(posts_due_for_refresh, page)
+        if not due:
+            return
+
+        logger.info("Refreshing engagement for %d recent posts on page %s", len(due), page.page_id)
+        with self.limiter.slot(page.page_id, token):
+            objects = self.api.get_objects_by_ids([post.post_id for post in due], self.api.fields_for('posts'), token)
+
+        previous_comments = {post.post_id: post.comments_count for post in due}
+        rows = [normalize_post(objects[post.post_id]) for post in due if post.post_id in objects]
+        posts = self.writer.call(self.store.save_posts, page, rows)
+
+        # Only posts that gained comments need their comment edge re-read
+        self._queue_comments(page.page_id, [
+            posts[row['post_id']] for row in rows
+            if row['comments_count'] > previous_comments[row['post_id']]
+        ])
+
+    def _queue_comments(self, page_id, posts):
+        # Get detailed comments with enhanced user info, 50 posts per HTTP call
+        for batch in iter_chunks(posts, BATCH_SIZE_LIMIT):
+            self._submit(self.sync_comments, page_id, batch)
+
+    def sync_comments(self, page_id, posts):
+        """Fetch and save comments newer than each post's watermark for a batch of posts"""
+        token = self.api.get_page_access_token(page_id)
+        since = {post.post_id: post.comments_synced_until for post in posts}
+        with self.limiter.slot(page_id, token):
+            comments_by_post = self.api.get_post_comments_batch(list(since), page_id, since=since)
+
+        for post in posts:
+            first_page = comments_by_post.get(post.post_id)
+            if not first_page or 'data' not in first_page:
+                logger.warning("Could not fetch comments with user details for post %s", post.post_id)
+                continue
+
+            newest = None
+            comments_iter = self.api.iter_post_comments(post.post_id, page_id, first_page=first_page)
+            try:
+                for chunk in iter_chunks(self._limited(page_id, token, comments_iter), WRITE_CHUNK_SIZE):
+                    # Commenters without a name are resolved together, not one request each
+                    nameless = {
+                        comment['from']['id'] for comment in chunk
+                        if comment.get('from', {}).get('id') and not comment['from'].get('name')
+                    }
+                    with metrics.timer('facebook_sync_stage_seconds', stage='resolve_user_names'):
+                        names = self.resolve_user_names(page_id, token, nameless)
+                    # Placeholder names are worked out here for commenters still without one
+                    with metrics.timer('facebook_sync_stage_seconds', stage='normalize_comments'):
+                        rows = [normalize_comment(self.api, comment_data, names) for comment_data in chunk]
+                        users = user_identities(chunk, rows, names)
+                    identity_cache.put_many({user.user_id: user.name for user in users if user.resolved})
+                    self.writer.call(self.store.save_comments, post, rows, users)
+                    self._count('comments', len(rows))
+                    newest = latest(newest, *[row['created_time'] for row in rows])
+            except GraphAPIError as e:
+                self._incomplete(f"Comments of post {post.post_id}", e)
+                continue
+
+            # Committed together with the buffered comments it covers
+            self.writer.call(self.store.comments.defer, mark_post_comments_synced, post, newest)
+
+    def resolve_user_names(self, page_id, token, user_ids):
+        """Names for the given user IDs: LRU first, then stored identities, then one bulk Graph lookup"""
+        names = identity_cache.get_many(user_ids)
+        missing = [user_id for user_id in user_ids if user_id not in names]
+        if missing:
+            stored = self.writer.call(load_user_names, missing)
+            identity_cache.put_many(stored)
+            names.update(stored)
+            missing = [user_id for user_id in missing if user_id not in stored]
+        if missing:
+            with self.limiter.slot(page_id, token):
+                profiles = self.api.get_user_profiles(missing, page_id)
+            fetched = {user_id: profile['name'] for user_id, profile in profiles.items()}
+            identity_cache.put_many(fetched)
+            names.update(fetched)
+        return names
+
+    def sync_conversations(self, page):
+        """Stream a page's conversations and fetch messages for those updated since last sync"""
+        logger.debug("Fetching conversations for page %s", page.page_id)
+        token = self.api.get_page_access_token(page.page_id)
+        conversations_iter = self._limited(page.page_id, token, self.api.iter_page_conversations(page.page_id))
+
+        found = 0
+        for chunk in iter_chunks(conversations_iter, BATCH_SIZE_LIMIT):
+            found += len(chunk)
+            stored = self.writer.call(load_conversations, [conversation['id'] for conversation in chunk])
+
+            # Conversations come most recently updated first, so the first unchanged one ends the scan
+            changed = []
+            reached_synced = False
+            for conversation in chunk:
+                updated_time = parse_facebook_time(conversation.get('updated_time'))
+                known = stored.get(conversation['id'])
+                if known and known.updated_time and updated_time <= known.updated_time:
+                    reached_synced = True
+                    break
+
+                participants = conversation.get('participants', {}).get('data', [])
+                participant_names = [p.get('name', 'Unknown') for p in participants]
+                logger.debug("Conversation %s participants: %s", conversation['id'], participant_names)
+                changed.append((conversation['id'], updated_time, known.messages_synced_until if known else None))
+
+            if changed:
+                self._submit(self.sync_messages, page, changed)
+            if reached_synced:
+                logger.debug("Reached unchanged conversations for page %s, stopping", page.page_id)
+                break
+
+        if found:
+            logger.info("Found %d updated conversations for page %s", found, page.page_id)
+        else:
+            logger.warning("Could not access conversations for page %s", page.page_id)
+
+    def sync_messages(self, page, conversations):
+        """Fetch and save new messages for a batch of (conversation_id, updated_time, watermark)"""
+        token = self.api.get_page_access_token(page.page_id)
+        conversation_ids = [conversation_id for conversation_id, _, _ in conversations]
+        with self.limiter.slot(page.page_id, token):
+            messages_by_conversation = self.api.get_conversation_messages_batch(conversation_ids, page.page_id)
+
+        for conversation_id, updated_time, synced_until in conversations:
+            first_page = messages_by_conversation.get(conversation_id)
+            if first_page is None:
+                with self.limiter.slot(page.page_id, token):
+                    first_page = self.api.get_conversation_messages_with_full_details(conversation_id, page.page_id)
+            if not first_page or 'data' not in first_page:
+                # Leave the watermark alone so the conversation is retried next sync
+                logger.warning("Could not get messages for conversation %s", conversation_id)
+                continue
+
+            saved = 0
+            newest = None
+            messages_iter = self.api.iter_conversation_messages(conversation_id, page.page_id, first_page=first_page)
+            try:
+                for chunk in iter_chunks(self._limited(page.page_id, token, messages_iter), WRITE_CHUNK_SIZE):
+                    rows = [normalize_message(message_data) for message_data in chunk]
+                    # Messages arrive newest first and never change, so the watermark ends the stream
+                    fresh = [row for row in rows if not (synced_until and row['created_time'] <= synced_until)]
+                    known = self.writer.call(existing_ids, FacebookMessage, 'message_id', [row['message_id'] for row in fresh])
+                    # Messages above the watermark can already be stored when an earlier sync broke off part way
+                    new = [(data, row) for data, row in zip(chunk, fresh) if row['message_id'] not in known]
+                    new_rows = [row for _, row in new]
+
+                    users = user_identities([data for data, _ in new], new_rows)
+                    identity_cache.put_many({user.user_id: user.name for user in users if user.resolved})
+                    self.writer.call(self.store.save_messages, page, new_rows, users, conversation_id)
+                    saved += len(new_rows)
+                    newest = latest(newest, *[row['created_time'] for row in fresh])
+                    if len(fresh) < len(rows):
+                        break
+            except GraphAPIError as e:
+                # updated_time stays as it was, so the conversation counts as changed next sync
+                self._incomplete(f"Messages of conversation {conversation_id}", e)
+                self._count('messages', saved)
+                continue
+
+            # Committed together with the buffered messages it covers
+            self.writer.call(self.store.messages.defer, save_conversation, page, conversation_id, updated_time, newest)
+            logger.debug("Saved %d new messages in conversation %s", saved, conversation_id)
+            self._count('messages', saved)
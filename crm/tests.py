@@ -1,50 +1,1124 @@
-from django.db import models
+import io
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 
-class FacebookPage(models.Model):
-    page_id = models.CharField(max_length=100, unique=True)
-    name = models.CharField(max_length=200)
-    category = models.CharField(max_length=100, blank=True)
-    followers_count = models.IntegerField(default=0)
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
-
-    def __str__(self):
-        return self.name
-
-class FacebookPost(models.Model):
-    post_id = models.CharField(max_length=100, unique=True)
-    page = models.ForeignKey(FacebookPage, on_delete=models.CASCADE)
-    message = models.TextField(blank=True)
-    created_time = models.DateTimeField()
-    likes_count = models.IntegerField(default=0)
-    comments_count = models.IntegerField(default=0)
-    shares_count = models.IntegerField(default=0)
-    
-    def __str__(self):
-        return f"Post {self.post_id}"
-
-class FacebookComment(models.Model):
-    comment_id = models.CharField(max_length=100, unique=True)
-    post = models.ForeignKey(FacebookPost, on_delete=models.CASCADE)
-    message = models.TextField()
-    from_name = models.CharField(max_length=200)
-    from_id = models.CharField(max_length=100)
-    created_time = models.DateTimeField()
-    
-    def __str__(self):
-        return f"Comment by {self.from_name}"
-
-class FacebookMessage(models.Model):
-    message_id = models.CharField(max_length=100, unique=True)
-    page = models.ForeignKey(FacebookPage, on_delete=models.CASCADE)
-    from_name = models.CharField(max_length=200)
-    from_id = models.CharField(max_length=100)
-    message = models.TextField()
-    created_time = models.DateTimeField()
-    
-    def __str__(self):
-        return f"Message from {self.from_name}"
-    
-    
-    
+from .facebook_api import (
+    CircuitBreakers, FacebookGraphAPI, GraphAPIError, RateGovernor, TokenBucket, get_http_session, request_stats,
+    set_http_session,
+)
+from . import analytics
+from .archive import ResponseArchive, find_frames, iter_records
+from .db import DEFAULT_SQLITE_PRAGMAS, apply_sqlite_pragmas, current_sqlite_pragmas, sqlite_pragmas
+from .fakegraph import FAKE_ID_PREFIX, FakeGraph
+from .history import (
+    RECORD_BYTES, EngagementHistory, compact_history, engagement_decay, engagement_velocity, half_life,
+    iter_observations, load_history,
+)
+from .identities import IdentityCache, identity_cache
+from .jobs import claim_next_job, enqueue_sync_job, fail_stale_jobs
+from .memo import LookupMemo
+from .metrics import MetricsRegistry, diff_snapshots, merge_snapshots, render_prometheus
+from .reingest import ArchiveIngest
+from .rollups import rebuild_daily_stats
+from .sync import ConcurrencyLimiter, FacebookSyncEngine, SyncStore, bulk_upsert, normalize_comment
+from .models import (
+    FacebookPage, FacebookPost, FacebookComment, FacebookMessage, FacebookPageToken, FacebookPermissionStatus,
+    FacebookLookupMemo, FacebookUser, FacebookConversation, SyncJob, PageDailyStats, PostDailySnapshot,
+    EngagementHistoryChunk,
+)
+from .tokens import token_fingerprint
+
+
+@override_settings(FACEBOOK_DASHBOARD_STATS_TTL=0)
+class DashboardQueryTests(TestCase):
+    """The dashboard must issue the same number of queries however many rows it shows"""
+
+    def setUp(self):
+        cache.clear()
+
+    def create_activity(self, count):
+        now = timezone.now()
+        page = FacebookPage.objects.create(page_id=f'page{count}', name=f'Page {count}')
+        for i in range(count):
+            post = FacebookPost.objects.create(
+                post_id=f'{page.page_id}_{i}', page=page, message='Hello',
+                created_time=now - timedelta(minutes=i), likes_count=i, shares_count=1,
+            )
+            FacebookComment.objects.create(
+                comment_id=f'{post.post_id}_c', post=post, message='Nice',
+                from_name='Commenter', from_id='1', created_time=now - timedelta(minutes=i),
+            )
+            FacebookMessage.objects.create(
+                message_id=f'{post.post_id}_m', page=page, message='Hi',
+                from_name='Sender', from_id='2', created_time=now - timedelta(minutes=i),
+            )
+
+    def render_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('crm:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.create_activity(2)
+        _, few_rows = self.render_dashboard()
+
+        self.create_activity(60)
+        response, many_rows = self.render_dashboard()
+
+        self.assertEqual(few_rows, many_rows)
+        # pages, posts, comments, messages, row counts, post sums, permission status
+        self.assertEqual(many_rows, 7)
+        self.assertContains(response, 'Page 60')
+
+    def test_totals_are_aggregated_in_sql(self):
+        self.create_activity(3)
+        response, _ = self.render_dashboard()
+
+        self.assertEqual(response.context['total_posts'], 3)
+        self.assertEqual(response.context['total_likes'], 0 + 1 + 2)
+        self.assertEqual(response.context['total_shares'], 3)
+        self.assertEqual(response.context['total_comments'], 3)
+        self.assertEqual(response.context['total_messages'], 3)
+
+    @override_settings(FACEBOOK_ACCESS_TOKEN='user-token')
+    def test_permission_warning_says_when_permissions_were_checked(self):
+        FacebookPermissionStatus.objects.create(
+            token_fingerprint=token_fingerprint('user-token'), checked_at=timezone.now() - timedelta(hours=2),
+            missing=[{'permission': 'pages_messaging', 'description': 'Read messages'}],
+        )
+        response, _ = self.render_dashboard()
+        self.assertContains(response, 'pages_messaging')
+        self.assertContains(response, 'Permissions checked 2\xa0hours ago.')
+
+
+class CreatedTimeIndexTests(TestCase):
+    """Top-N listings should walk a created_time index instead of sorting the table"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_top_n_queries_use_created_time_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Query plan assertions are written against SQLite's EXPLAIN QUERY PLAN output")
+
+        page = FacebookPage.objects.create(page_id='page', name='Page')
+        post = FacebookPost.objects.create(post_id='post', page=page, created_time=timezone.now())
+
+        self.assertUsesIndex(FacebookPost.objects.order_by('-created_time')[:20], 'crm_post_created_idx')
+        self.assertUsesIndex(
+            FacebookPost.objects.filter(page=page).order_by('-created_time')[:25], 'crm_post_page_created_idx'
+        )
+        self.assertUsesIndex(
+            FacebookComment.objects.filter(post=post).order_by('-created_time')[:50], 'crm_comment_post_created_idx'
+        )
+        self.assertUsesIndex(FacebookComment.objects.order_by('-created_time')[:50], 'crm_comment_created_idx')
+        self.assertUsesIndex(
+            FacebookMessage.objects.filter(page=page).order_by('-created_time')[:50], 'crm_message_page_created_idx'
+        )
+        self.assertUsesIndex(FacebookMessage.objects.order_by('-created_time')[:50], 'crm_message_created_idx')
+
+
+class CountingGraphAPI(FacebookGraphAPI):
+    """Graph client whose me/accounts call is canned and counted"""
+    accounts_calls = 0
+
+    def get_pages(self):
+        CountingGraphAPI.accounts_calls += 1
+        return {'data': [
+            {'id': 'page1', 'access_token': 'token1'},
+            {'id': 'page2', 'access_token': 'token2'},
+        ]}
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_PAGE_TOKEN_TTL=3600)
+class PageTokenStoreTests(TestCase):
+    def setUp(self):
+        CountingGraphAPI.accounts_calls = 0
+
+    def test_one_accounts_call_serves_every_page_and_client(self):
+        self.assertEqual(CountingGraphAPI().get_page_access_token('page1'), 'token1')
+        self.assertEqual(CountingGraphAPI().get_page_access_token('page2'), 'token2')
+        self.assertEqual(CountingGraphAPI.accounts_calls, 1)
+
+    def test_expired_tokens_are_refetched(self):
+        CountingGraphAPI().get_page_access_token('page1')
+        FacebookPageToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(CountingGraphAPI().get_page_access_token('page1'), 'token1')
+        self.assertEqual(CountingGraphAPI.accounts_calls, 2)
+
+    def test_expiry_follows_user_token_expiry(self):
+        user_expires_at = timezone.now() + timedelta(minutes=5)
+        FacebookPermissionStatus.objects.create(
+            token_fingerprint=token_fingerprint('user-token'), token_expires_at=user_expires_at,
+            checked_at=timezone.now(),
+        )
+        CountingGraphAPI().get_page_access_token('page1')
+
+        self.assertEqual(FacebookPageToken.objects.get(page_id='page1').expires_at, user_expires_at)
+
+
+class FakeClock:
+    """Monotonic clock that only moves when something sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload, headers=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = headers or {}
+        self.content = json.dumps(payload).encode()
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeSession:
+    """Returns canned responses in order for every GET or POST"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        return self.responses.pop(0)
+
+    post = get
+
+
+@override_settings(
+    FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_RATE_LIMIT_APP=(10, 2),
+    FACEBOOK_RATE_LIMIT_PAGE=(10, 2), FACEBOOK_RATE_LIMIT_TOKEN=(10, 2),
+    FACEBOOK_RATE_LIMIT_SLOWDOWN_AT=50, FACEBOOK_RATE_LIMIT_BACKOFF=(1.0, 60.0),
+)
+class RateGovernorTests(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.governor = RateGovernor(sleep=self.clock.sleep, clock=self.clock)
+        patcher = mock.patch('crm.facebook_api.rate_governor', self.governor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_waits_for_refill(self):
+        bucket = TokenBucket(rate=1, capacity=2, clock=self.clock)
+        self.assertEqual(bucket.try_acquire(1), 0)
+        self.assertEqual(bucket.try_acquire(1), 0)
+        self.assertEqual(bucket.try_acquire(1), 1)
+
+    def test_throttled_request_is_retried_after_backoff(self):
+        session = FakeSession(
+            FakeResponse(400, {'error': {'code': 613, 'message': 'Calls within one hour exceeded'}}),
+            FakeResponse(200, {'data': [1]}),
+        )
+        api = FacebookGraphAPI(session=session)
+
+        self.assertEqual(api.make_request('me/accounts'), {'data': [1]})
+        self.assertEqual(session.calls, 2)
+        tokens = self.governor.snapshot()['tokens']
+        self.assertEqual([entry['throttled'] for entry in tokens.values()], [1])
+
+    def test_permanent_errors_are_not_retried(self):
+        session = FakeSession(FakeResponse(400, {'error': {'code': 100, 'message': 'Bad field'}}))
+        self.assertIsNone(FacebookGraphAPI(session=session).make_request('me/accounts'))
+        self.assertEqual(session.calls, 1)
+
+    def test_usage_headers_slow_buckets_down(self):
+        api = FacebookGraphAPI(session=FakeSession(FakeResponse(200, {}, {
+            'X-App-Usage': json.dumps({'call_count': 75, 'total_cputime': 10, 'total_time': 20}),
+            'X-Business-Use-Case-Usage': json.dumps({'123': [
+                {'type': 'pages', 'call_count': 100, 'estimated_time_to_regain_access': 2},
+            ]}),
+        })))
+        api.page_tokens['page1'] = 'page-token'
+        api.make_request('page1/posts', access_token='page-token')
+
+        snapshot = self.governor.snapshot()
+        self.assertEqual(snapshot['app']['usage'], 75)
+        self.assertEqual(snapshot['app']['rate'], 5)
+        self.assertEqual(snapshot['pages']['page1']['paused_for'], 120)
+
+        # The next request on that page waits out the pause
+        api.session = FakeSession(FakeResponse(200, {}))
+        api.make_request('page1/posts', access_token='page-token')
+        self.assertGreaterEqual(sum(self.clock.slept), 120)
+
+
+class FakeTransportMixin:
+    """Fresh rate governor and circuit breakers on a fake clock, clients on canned responses"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        for target, value in [
+            ('crm.facebook_api.circuit_breakers', CircuitBreakers(clock=self.clock)),
+            ('crm.facebook_api.rate_governor', RateGovernor(sleep=self.clock.sleep, clock=self.clock)),
+            ('crm.facebook_api.time.sleep', self.clock.sleep),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def api(self, *responses):
+        api = FacebookGraphAPI(session=FakeSession(*responses))
+        api.page_tokens['page1'] = 'page-token'
+        return api
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_API_POOL_CONNECTIONS=3, FACEBOOK_API_POOL_MAXSIZE=7)
+class HTTPSessionTests(FakeTransportMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        previous = set_http_session(None)
+        self.addCleanup(set_http_session, previous)
+        request_stats.reset()
+        self.addCleanup(request_stats.reset)
+
+    def test_clients_share_one_pooled_keep_alive_session(self):
+        session = FacebookGraphAPI().get_session()
+        self.assertIs(FacebookGraphAPI().get_session(), session)
+        self.assertIs(get_http_session(), session)
+        adapter = session.get_adapter('https://graph.facebook.com/v19.0/me')
+        self.assertEqual((adapter._pool_connections, adapter._pool_maxsize), (3, 7))
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+
+    def test_requests_use_the_shared_session_and_record_latency(self):
+        fake = FakeSession(FakeResponse(200, {'id': 'post1'}), FakeResponse(200, {'data': []}))
+        set_http_session(fake)
+        FacebookGraphAPI().request('post1')
+        FacebookGraphAPI().request('post1/comments')
+        self.assertEqual(fake.calls, 2)
+
+        stats = request_stats.snapshot()
+        self.assertEqual((stats['calls'], stats['errors']), (2, 0))
+        self.assertEqual(set(stats['endpoints']), {'{id}', '{id}/comments'})
+        entry = stats['endpoints']['{id}']
+        self.assertEqual(entry['calls'], 1)
+        self.assertEqual(entry['bytes'], len(b'{"id": "post1"}'))
+        self.assertGreater(entry['total_time'], 0)
+        self.assertLessEqual(entry['min_time'], entry['max_time'])
+
+
+@override_settings(
+    FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_API_MAX_RETRIES=2,
+    FACEBOOK_API_CIRCUIT_FAILURES=3, FACEBOOK_API_CIRCUIT_RESET_SECONDS=30,
+)
+class RetryAndCircuitBreakerTests(FakeTransportMixin, TestCase):
+    def test_transient_errors_are_retried_with_backoff(self):
+        api = self.api(
+            FakeResponse(503, {}),
+            FakeResponse(500, {'error': {'code': 2, 'is_transient': True}}),
+            FakeResponse(200, {'id': 'post1'}),
+        )
+        self.assertEqual(api.request('post1'), {'id': 'post1'})
+        self.assertEqual(api.session.calls, 3)
+        self.assertEqual(len(self.clock.slept), 2)
+
+    def test_permanent_errors_raise_without_retry(self):
+        api = self.api(FakeResponse(403, {'error': {'code': 10, 'message': 'Permission denied'}}))
+        with self.assertRaises(GraphAPIError) as raised:
+            api.request('post1')
+        self.assertFalse(raised.exception.transient)
+        self.assertEqual(api.session.calls, 1)
+
+    def test_circuit_opens_and_fails_fast_until_reset(self):
+        api = self.api(*[FakeResponse(500, {})] * 3, FakeResponse(200, {'id': 'post2'}))
+        with self.assertRaises(GraphAPIError):
+            api.request('post1')
+        self.assertEqual(api.session.calls, 3)
+
+        # Open: no request is sent at all
+        with self.assertRaises(GraphAPIError) as raised:
+            api.request('post2')
+        self.assertTrue(raised.exception.transient)
+        self.assertEqual(api.session.calls, 3)
+
+        # After the reset timeout one trial goes through and closes the circuit
+        self.clock.now += 31
+        self.assertEqual(api.request('post2'), {'id': 'post2'})
+
+    def test_failed_cursor_page_raises_instead_of_ending_the_stream(self):
+        first_page = {'data': [{'id': 'c1'}], 'paging': {'next': 'https://graph.facebook.com/v19.0/post1/comments?after=x'}}
+        api = self.api(FakeResponse(400, {'error': {'code': 100, 'message': 'Invalid cursor'}}))
+        items = api.iter_collection('post1/comments', access_token='page-token', first_page=first_page)
+        self.assertEqual(next(items), {'id': 'c1'})
+        with self.assertRaises(GraphAPIError):
+            next(items)
+
+    @override_settings(FACEBOOK_RATE_LIMIT_ENABLED=False)
+    def test_batches_retry_only_the_failed_sub_requests(self):
+        class RecordingGraph(FakeGraph):
+            def _serve_batch(self, batch):
+                responses = super()._serve_batch(batch)
+                self.batches.append([(sub['relative_url'], response['code'])
+                                     for sub, response in zip(batch, responses)])
+                return responses
+
+        fake = RecordingGraph(pages=120, error_rate=0.2, seed=1)
+        fake.batches = []
+        api = FacebookGraphAPI(session=fake)
+        page_ids = fake.page_ids()
+        results = api.make_batch_request([(page_id, {'fields': 'id,name'}) for page_id in page_ids], max_retries=5)
+
+        # Every sub-request got its answer, in order
+        self.assertEqual([result['id'] for result in results], page_ids)
+        self.assertGreater(fake.errors, 0)
+        # 50 sub-requests per POST; each retry round resends exactly what failed in the one before
+        served = [sub for batch in fake.batches for sub in batch]
+        failed = [url for url, code in served if code != 200]
+        self.assertTrue(failed)
+        urls = [url for url, _ in served]
+        for url in set(urls):
+            self.assertEqual(urls.count(url), 1 + failed.count(url))
+        posts, offset, pending = 0, 0, len(page_ids)
+        while pending:
+            posts += -(-pending // 50)
+            current = served[offset:offset + pending]
+            offset += pending
+            pending = len([url for url, code in current if code != 200])
+        self.assertEqual(len(fake.batches), posts)
+        self.assertEqual([len(batch) for batch in fake.batches[:3]], [50, 50, 20])
+        self.assertEqual(offset, len(served))
+
+    def test_comment_fallbacks_only_follow_permanent_errors(self):
+        api = self.api(
+            FakeResponse(400, {'error': {'code': 100, 'message': 'Unsupported field'}}),
+            FakeResponse(200, {'data': [{'id': 'c1'}]}),
+        )
+        self.assertEqual(api.get_post_comments_with_enhanced_user_info('post1', 'page1'), {'data': [{'id': 'c1'}]})
+
+        api = self.api(*[FakeResponse(500, {})] * 3)
+        self.assertIsNone(api.get_post_comments_with_enhanced_user_info('post2', 'page1'))
+        # Method 1 and its retries only; no fallback methods
+        self.assertEqual(api.session.calls, 3)
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_API_MAX_RETRIES=0)
+class LookupMemoTests(FakeTransportMixin, TestCase):
+    def permanent_error(self):
+        return FakeResponse(400, {'error': {'code': 100, 'message': 'Unsupported field'}})
+
+    def test_working_comment_method_is_tried_first_next_time(self):
+        api = self.api(self.permanent_error(), FakeResponse(200, {'data': []}))
+        api.get_post_comments_with_enhanced_user_info('post1', 'page1')
+        api.memo.save()
+
+        api = self.api(FakeResponse(200, {'data': []}))
+        api.memo = LookupMemo.load()
+        self.assertEqual(api.get_post_comments_with_enhanced_user_info('post2', 'page1'), {'data': []})
+        self.assertEqual(api.session.calls, 1)
+
+    def test_unresolvable_users_are_skipped_until_expiry(self):
+        api = self.api(*[self.permanent_error()] * 8)
+        self.assertIsNone(api.get_user_profile_info('user1', 'page1'))
+        self.assertEqual(api.session.calls, 8)
+
+        self.assertIsNone(api.get_user_profile_info('user1', 'page1'))
+        self.assertEqual(api.session.calls, 8)
+
+        api.memo.save()
+        FacebookLookupMemo.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        api = self.api(FakeResponse(200, {'id': 'user1', 'name': 'Ana'}))
+        api.memo = LookupMemo.load()
+        self.assertEqual(api.get_user_profile_info('user1', 'page1')['name'], 'Ana')
+
+    @override_settings(FACEBOOK_LOOKUP_MEMO_UNRESOLVABLE_TTL=60, FACEBOOK_LOOKUP_MEMO_METHOD_TTL=3600)
+    def test_entries_held_in_memory_honour_expires_at(self):
+        start = timezone.now()
+        memo = LookupMemo()
+        with mock.patch('crm.memo.timezone.now', return_value=start):
+            memo.remember(FacebookLookupMemo.UNRESOLVABLE_USER, 'page1:user1')
+            memo.remember(FacebookLookupMemo.COMMENT_METHOD, 'page1', '2')
+            memo.save()
+        self.assertEqual(FacebookLookupMemo.objects.get(kind=FacebookLookupMemo.UNRESOLVABLE_USER).expires_at,
+                         start + timedelta(seconds=60))
+
+        # Past the unresolvable TTL but inside the method TTL, without reloading from the database
+        with mock.patch('crm.memo.timezone.now', return_value=start + timedelta(seconds=61)):
+            self.assertFalse(memo.has(FacebookLookupMemo.UNRESOLVABLE_USER, 'page1:user1'))
+            self.assertEqual(memo.get(FacebookLookupMemo.COMMENT_METHOD, 'page1'), '2')
+            self.assertEqual(memo.save(), 0)
+            self.assertEqual(list(FacebookLookupMemo.objects.values_list('kind', flat=True)),
+                             [FacebookLookupMemo.COMMENT_METHOD])
+
+            # Remembering an expired entry again renews it
+            memo.remember(FacebookLookupMemo.UNRESOLVABLE_USER, 'page1:user1')
+            self.assertTrue(memo.has(FacebookLookupMemo.UNRESOLVABLE_USER, 'page1:user1'))
+            self.assertEqual(memo.save(), 1)
+
+    def test_transient_failures_are_not_remembered(self):
+        api = self.api(FakeResponse(500, {}))
+        self.assertIsNone(api.get_user_profile_info('user1', 'page1'))
+        self.assertIsNone(api.memo.get(FacebookLookupMemo.UNRESOLVABLE_USER, 'page1:user1'))
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_API_MAX_RETRIES=0)
+class IdentityTests(FakeTransportMixin, TestCase):
+    def test_lru_evicts_least_recently_used(self):
+        cache = IdentityCache(maxsize=2)
+        cache.put_many({'1': 'Ana', '2': 'Ben'})
+        cache.get_many(['1'])
+        cache.put_many({'3': 'Cy'})
+        self.assertEqual(cache.get_many(['1', '2', '3']), {'1': 'Ana', '3': 'Cy'})
+
+    def test_users_are_resolved_in_one_lookup(self):
+        api = self.api(FakeResponse(200, {'1': {'id': '1', 'name': 'Ana'}, '2': {'id': '2', 'name': 'Ben'}}))
+        self.assertEqual(api.get_user_profiles(['1', '2'], 'page1'), {
+            '1': {'id': '1', 'name': 'Ana'}, '2': {'id': '2', 'name': 'Ben'},
+        })
+        self.assertEqual(api.session.calls, 1)
+
+    def test_failed_lookup_falls_back_per_user_and_remembers_dead_ids(self):
+        dead = FakeResponse(400, {'error': {'code': 100, 'message': 'Unsupported get request'}})
+        api = self.api(dead, FakeResponse(200, {'id': '1', 'name': 'Ana'}), *[dead] * 8)
+        self.assertEqual(api.get_user_profiles(['1', '2'], 'page1'), {'1': {'id': '1', 'name': 'Ana'}})
+
+        api.session = FakeSession(FakeResponse(200, {'1': {'id': '1', 'name': 'Ana'}}))
+        api.get_user_profiles(['1', '2'], 'page1')
+        self.assertEqual(api.session.calls, 1)
+
+    def test_resolved_name_shows_on_every_linked_comment(self):
+        page = FacebookPage.objects.create(page_id='page', name='Page')
+        post = FacebookPost.objects.create(post_id='post', page=page, created_time=timezone.now())
+        user = FacebookUser.objects.create(user_id='42', name='')
+        for i in range(3):
+            FacebookComment.objects.create(
+                comment_id=f'c{i}', post=post, message='Hi', from_name='User 42...', from_id='42',
+                user=user, created_time=timezone.now(),
+            )
+
+        user.name = 'Ana'
+        user.save()
+        self.assertEqual(
+            [comment.display_name for comment in FacebookComment.objects.select_related('user')], ['Ana'] * 3
+        )
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token')
+class FieldProfileTests(FakeTransportMixin, TestCase):
+    def test_profiles_cover_every_endpoint(self):
+        for endpoint, profiles in FacebookGraphAPI.FIELD_PROFILES.items():
+            self.assertEqual(set(profiles), {'minimal', 'standard', 'full'}, endpoint)
+
+    def test_minimal_comments_skip_unstored_fields(self):
+        api = self.api()
+        fields = api.comment_method_params(1, 100)['fields']
+        self.assertNotIn('picture', fields)
+        self.assertNotIn('reactions', fields)
+
+        api.field_profile = 'full'
+        self.assertEqual(api.comment_method_params(1, 100)['fields'], FacebookGraphAPI.COMMENT_FIELDS)
+
+    def test_unknown_profile_is_rejected(self):
+        with self.assertRaises(ValueError):
+            FacebookGraphAPI(field_profile='everything')
+
+    def test_payload_size_is_recorded_per_profile(self):
+        request_stats.reset()
+        self.addCleanup(request_stats.reset)
+        payload = {'data': [{'id': 'c1', 'message': 'Hi'}]}
+        api = self.api(FakeResponse(200, payload))
+        api.request('post1/comments')
+
+        entry = request_stats.snapshot()['profiles']['minimal']['{id}/comments']
+        self.assertEqual(entry['calls'], 1)
+        self.assertEqual(entry['bytes'], len(json.dumps(payload)))
+
+
+class PayloadLoggingTests(TestCase):
+    comment = {'id': 'post_1', 'message': 'Hi', 'from': {'id': '42'}, 'created_time': '2026-01-01T00:00:00+0000'}
+
+    def debug_messages(self):
+        with self.assertLogs('crm.sync', 'DEBUG') as logs:
+            normalize_comment(FacebookGraphAPI(), self.comment, {})
+        return '\n'.join(logs.output)
+
+    @override_settings(FACEBOOK_LOG_PAYLOADS=False)
+    def test_payloads_are_not_dumped_by_default(self):
+        self.assertNotIn('Raw comment data', self.debug_messages())
+
+    @override_settings(FACEBOOK_LOG_PAYLOADS=True)
+    def test_payloads_are_dumped_at_debug_when_enabled(self):
+        self.assertIn('Raw comment data', self.debug_messages())
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_API_MAX_RETRIES=2, FACEBOOK_METRICS_CACHE_TTL=0)
+class MetricsTests(FakeTransportMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.registry = MetricsRegistry()
+        patcher = mock.patch('crm.facebook_api.metrics', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def series(self, snapshot, name, **labels):
+        return next(series for series in snapshot[name] if series['labels'] == labels)
+
+    def test_requests_record_latency_decode_time_and_retries(self):
+        api = self.api(FakeResponse(503, {}), FakeResponse(200, {'id': 'post1'}))
+        api.request('123_456/comments')
+
+        snapshot = self.registry.snapshot()
+        self.assertEqual(self.series(snapshot, 'facebook_graph_request_seconds', endpoint='{id}/comments')['count'], 2)
+        self.assertEqual(self.series(snapshot, 'facebook_graph_decode_seconds', endpoint='{id}/comments')['count'], 1)
+        retries = self.series(snapshot, 'facebook_graph_retries_total', endpoint='{id}/comments', reason='transient')
+        self.assertEqual(retries['value'], 1)
+
+    def test_snapshots_diff_and_merge_per_series(self):
+        self.registry.observe('facebook_sync_flush_seconds', 0.02, model='facebookcomment')
+        before = self.registry.snapshot()
+        self.registry.observe('facebook_sync_flush_seconds', 3, model='facebookcomment')
+        self.registry.inc('facebook_sync_rows_total', 100, model='facebookcomment')
+
+        run = diff_snapshots(self.registry.snapshot(), before)
+        flush = self.series(run, 'facebook_sync_flush_seconds', model='facebookcomment')
+        self.assertEqual((flush['count'], flush['sum']), (1, 3))
+        self.assertEqual(sum(flush['buckets']), 1)
+
+        total = merge_snapshots([run, json.loads(json.dumps(run))])
+        self.assertEqual(self.series(total, 'facebook_sync_rows_total', model='facebookcomment')['value'], 200)
+
+    def test_prometheus_rendering_has_cumulative_buckets(self):
+        self.registry.observe('facebook_sync_flush_seconds', 0.02, model='facebookcomment')
+        self.registry.observe('facebook_sync_flush_seconds', 3, model='facebookcomment')
+        text = render_prometheus(self.registry.snapshot())
+
+        self.assertIn('# TYPE facebook_sync_flush_seconds histogram', text)
+        self.assertIn('facebook_sync_flush_seconds_bucket{model="facebookcomment",le="0.025"} 1', text)
+        self.assertIn('facebook_sync_flush_seconds_bucket{model="facebookcomment",le="5.0"} 2', text)
+        self.assertIn('facebook_sync_flush_seconds_bucket{model="facebookcomment",le="+Inf"} 2', text)
+        self.assertIn('facebook_sync_flush_seconds_count{model="facebookcomment"} 2', text)
+
+    def test_metrics_endpoint_sums_finished_jobs(self):
+        self.registry.inc('facebook_sync_rows_total', 40, model='facebookpost')
+        run = self.registry.snapshot()
+        now = timezone.now()
+        first = SyncJob.objects.create(status=SyncJob.SUCCEEDED, finished_at=now, metrics=run)
+        SyncJob.objects.create(status=SyncJob.FAILED, finished_at=now, metrics=run)
+        SyncJob.objects.create(status=SyncJob.RUNNING)
+
+        response = self.client.get(reverse('crm:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('facebook_sync_rows_total{model="facebookpost"} 80.0', response.content.decode())
+
+        response = self.client.get(reverse('crm:metrics'), {'job': first.pk})
+        self.assertIn('facebook_sync_rows_total{model="facebookpost"} 40.0', response.content.decode())
+
+        response = self.client.get(reverse('crm:sync_job_metrics', args=[first.pk]))
+        self.assertEqual(response.json()['metrics'], json.loads(json.dumps(run)))
+
+
+class BulkUpsertTests(TestCase):
+    def test_counts_split_inserts_from_updates_on_conflict(self):
+        FacebookUser.objects.create(user_id='u1', name='Old name', resolved=True)
+        merged, inserted_objs = [], []
+
+        def merge(obj, stored):
+            merged.append((obj.user_id, stored['name']))
+
+        users = [FacebookUser(user_id='u1', name='New name', resolved=True),
+                 FacebookUser(user_id='u2', name='First'), FacebookUser(user_id='u2', name='Second'),
+                 FacebookUser(user_id='u3', name='Third')]
+        counts = bulk_upsert(FacebookUser, users, 'user_id', ['name'], merge=merge, on_insert=inserted_objs.extend)
+
+        self.assertEqual(counts, (2, 1))
+        self.assertEqual(merged, [('u1', 'Old name')])
+        self.assertEqual([user.user_id for user in inserted_objs], ['u2', 'u3'])
+        self.assertEqual(dict(FacebookUser.objects.values_list('user_id', 'name')),
+                         {'u1': 'New name', 'u2': 'Second', 'u3': 'Third'})
+
+    def test_without_update_fields_conflicts_are_left_alone(self):
+        FacebookUser.objects.create(user_id='u1', name='Old name')
+        counts = bulk_upsert(FacebookUser, [FacebookUser(user_id='u1', name='New name'),
+                                            FacebookUser(user_id='u2', name='Other')], 'user_id')
+        self.assertEqual(counts, (1, 0))
+        self.assertEqual(FacebookUser.objects.get(user_id='u1').name, 'Old name')
+        self.assertEqual(bulk_upsert(FacebookUser, [], 'user_id', ['name']), (0, 0))
+
+
+class ConcurrencyLimiterTests(TestCase):
+    def test_slots_cap_in_flight_work_per_page_and_per_token(self):
+        limiter = ConcurrencyLimiter(per_page=2, per_token=3)
+        lock = threading.Lock()
+        in_flight, peak = {}, {}
+
+        def work(page_id, token):
+            with limiter.slot(page_id, token):
+                with lock:
+                    for key in (page_id, token):
+                        in_flight[key] = in_flight.get(key, 0) + 1
+                        peak[key] = max(peak.get(key, 0), in_flight[key])
+                time.sleep(0.02)
+                with lock:
+                    for key in (page_id, token):
+                        in_flight[key] -= 1
+
+        jobs = [('page1', 'token1')] * 6 + [('page2', 'token1')] * 6 + [('page3', 'token2')] * 6
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            list(pool.map(lambda job: work(*job), jobs))
+
+        # Two pages sharing token1 are held to its three slots between them
+        self.assertEqual(peak['token1'], 3)
+        self.assertEqual((peak['page1'], peak['page2'], peak['page3']), (2, 2, 2))
+        self.assertEqual(peak['token2'], 2)
+
+
+class SyncJobTests(TestCase):
+    def test_enqueue_reuses_the_active_job_until_it_finishes(self):
+        job, created = enqueue_sync_job()
+        self.assertTrue(created)
+        self.assertEqual(enqueue_sync_job(), (job, False))
+
+        SyncJob.objects.filter(pk=job.pk).update(status=SyncJob.SUCCEEDED)
+        second, created = enqueue_sync_job()
+        self.assertTrue(created)
+        self.assertNotEqual(second.pk, job.pk)
+
+    def test_claim_takes_the_oldest_queued_job_once(self):
+        older = SyncJob.objects.create()
+        newer = SyncJob.objects.create()
+        SyncJob.objects.filter(pk=newer.pk).update(created_at=older.created_at + timedelta(seconds=1))
+
+        job = claim_next_job('worker-1')
+        self.assertEqual(job.pk, older.pk)
+        self.assertEqual((job.status, job.worker), (SyncJob.RUNNING, 'worker-1'))
+        self.assertIsNotNone(job.started_at)
+        self.assertEqual(job.heartbeat_at, job.started_at)
+        self.assertEqual(claim_next_job('worker-2').pk, newer.pk)
+        self.assertIsNone(claim_next_job('worker-3'))
+
+    @override_settings(FACEBOOK_SYNC_JOB_STALE_MINUTES=30)
+    def test_job_with_a_stale_heartbeat_stops_blocking_the_queue(self):
+        now = timezone.now()
+        stale = SyncJob.objects.create(status=SyncJob.RUNNING, started_at=now - timedelta(hours=1),
+                                       heartbeat_at=now - timedelta(minutes=31))
+        alive = SyncJob.objects.create(status=SyncJob.RUNNING, started_at=now - timedelta(hours=1),
+                                       heartbeat_at=now - timedelta(minutes=1))
+        self.assertEqual(fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, SyncJob.FAILED)
+        self.assertIsNotNone(stale.finished_at)
+        self.assertIn('stopped reporting', stale.error)
+
+        # The live job still holds the queue; once it is done a new sync can be queued and claimed
+        self.assertEqual(enqueue_sync_job(), (alive, False))
+        SyncJob.objects.filter(pk=alive.pk).update(status=SyncJob.SUCCEEDED)
+        job, created = enqueue_sync_job()
+        self.assertTrue(created)
+        self.assertEqual(claim_next_job('worker-2').pk, job.pk)
+
+    def test_progress_json_reports_elapsed_time_and_throughput(self):
+        started = timezone.now() - timedelta(minutes=5)
+        job = SyncJob.objects.create(
+            status=SyncJob.SUCCEEDED, started_at=started, finished_at=started + timedelta(seconds=20),
+            pages_processed=1, posts_processed=50, comments_processed=120, messages_processed=80,
+        )
+        progress = self.client.get(reverse('crm:sync_job_progress', args=[job.pk])).json()
+        self.assertEqual((progress['status'], progress['posts'], progress['comments']), ('succeeded', 50, 120))
+        self.assertEqual(progress['elapsed_seconds'], 20.0)
+        self.assertEqual(progress['rows_per_second'], 12.5)
+
+        queued = SyncJob.objects.create()
+        progress = self.client.get(reverse('crm:sync_job_progress', args=[queued.pk])).json()
+        self.assertEqual((progress['elapsed_seconds'], progress['rows_per_second']), (0.0, 0.0))
+        self.assertEqual(self.client.get(reverse('crm:sync_job_progress', args=[queued.pk + 1])).status_code, 404)
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_RATE_LIMIT_ENABLED=False)
+class FakeGraphSyncTests(FakeTransportMixin, TransactionTestCase):
+    def sync(self, fake):
+        identity_cache.clear()
+        self.addCleanup(identity_cache.clear)
+        return FacebookSyncEngine(api=FacebookGraphAPI(session=fake), max_workers=1).run()
+
+    def assertStoredEverything(self, fake):
+        expected = fake.expected_counts()
+        self.assertEqual(FacebookPage.objects.count(), expected['pages'])
+        self.assertEqual(FacebookPost.objects.count(), expected['posts'])
+        self.assertEqual(FacebookComment.objects.count(), expected['comments'])
+        self.assertEqual(FacebookMessage.objects.count(), expected['messages'])
+
+    def test_full_then_incremental_sync(self):
+        fake = FakeGraph(pages=2, posts=30, comments=4, conversations=3, messages=60, nameless_ratio=0.25)
+        result = self.sync(fake)
+        self.assertEqual(result['errors'], [])
+        self.assertStoredEverything(fake)
+        # Nameless commenters were resolved by the bulk lookup, not given placeholders
+        self.assertFalse(FacebookComment.objects.exclude(from_name__startswith='Fake user').exists())
+        self.assertFalse(FacebookMessage.objects.filter(thread_id='').exists())
+
+        requests_before = fake.requests
+        result = self.sync(fake)
+        self.assertEqual(result['messages'], 0)
+        self.assertLess(fake.requests - requests_before, requests_before / 2)
+        self.assertStoredEverything(fake)
+
+    def test_sync_survives_injected_errors_and_throttling(self):
+        fake = FakeGraph(pages=1, posts=10, comments=3, conversations=3, messages=5, error_rate=0.1,
+                         throttle_rate=0.05, seed=3)
+        self.sync(fake)
+        self.assertGreater(fake.errors, 0)
+        self.assertGreater(fake.throttled, 0)
+        self.assertStoredEverything(fake)
+
+    def test_stream_broken_off_keeps_watermarks_and_next_sync_catches_up(self):
+        class BrokenPaging(FakeGraph):
+            broken = True
+
+            def _serve(self, path, params):
+                # Posts and messages past the first 100 fail for good, after one written chunk of each
+                if self.broken and int(params.get('after') or 0) >= 100 and path.split('/')[-1] in ('posts', 'messages'):
+                    return self._error(400, 100, "Unsupported get request")
+                return super()._serve(path, params)
+
+        fake = BrokenPaging(pages=1, posts=250, comments=1, conversations=2, messages=130)
+        result = self.sync(fake)
+        self.assertEqual(len(result['errors']), 3)
+        self.assertEqual(FacebookPost.objects.count(), 100)
+        self.assertEqual(FacebookMessage.objects.count(), 2 * 100)
+        self.assertIsNone(FacebookPage.objects.get().posts_synced_until)
+        self.assertFalse(FacebookConversation.objects.exclude(updated_time=None).exists())
+
+        fake.broken = False
+        result = self.sync(fake)
+        self.assertEqual(result['errors'], [])
+        self.assertStoredEverything(fake)
+        self.assertIsNotNone(FacebookPage.objects.get().posts_synced_until)
+
+    def test_page_listed_without_token_falls_back_to_the_store(self):
+        class TokenlessPage(FakeGraph):
+            def _serve(self, path, params):
+                status, body = super()._serve(path, params)
+                if path.strip('/') == 'me/accounts':
+                    del body['data'][0]['access_token']
+                return status, body
+
+        fake = TokenlessPage(pages=2, posts=3, comments=1, conversations=1, messages=1)
+        page_id = fake.page_ids()[0]
+        FacebookPageToken.objects.create(
+            page_id=page_id, user_token_fingerprint=token_fingerprint('user-token'), access_token='stored-token',
+            fetched_at=timezone.now(), expires_at=timezone.now() + timedelta(hours=1),
+        )
+        identity_cache.clear()
+        self.addCleanup(identity_cache.clear)
+        engine = FacebookSyncEngine(api=FacebookGraphAPI(session=fake), max_workers=1)
+        self.assertEqual(engine.run()['errors'], [])
+        self.assertNotIn(None, engine.api.page_tokens.values())
+        self.assertEqual(engine.api.get_page_access_token(page_id), 'stored-token')
+        self.assertStoredEverything(fake)
+
+    def test_benchsync_reports_and_cleans_up(self):
+        out = io.StringIO()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        with self.settings(FACEBOOK_ARCHIVE_ENABLED=True, FACEBOOK_ARCHIVE_DIR=archive_dir.name):
+            call_command('benchsync', pages=1, posts=5, comments=2, conversations=2, messages=3, latency=0,
+                         no_rate_limit=True, stdout=out)
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn('DB queries', out.getvalue())
+        self.assertNotIn('Incomplete', out.getvalue())
+        self.assertFalse(FacebookPage.objects.filter(page_id__startswith=FAKE_ID_PREFIX).exists())
+        self.assertFalse(FacebookUser.objects.filter(user_id__startswith=FAKE_ID_PREFIX).exists())
+        # Nothing a later reingest could bring back
+        self.assertEqual(list(iter_records(archive_dir.name)), [])
+        # Nor observations of synthetic posts skewing the engagement history
+        self.assertFalse(EngagementHistoryChunk.objects.exists())
+
+
+class ArchiveTests(FakeTransportMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_frames_are_indexed_by_endpoint_and_time(self):
+        archive = ResponseArchive(self.directory, frame_records=2)
+        archive.record('123_1/comments', '{id}/comments', {'access_token': 'secret', 'limit': 100}, {'data': [1]})
+        archive.record('123/posts', '{id}/posts', {}, {'data': [2]})
+        archive.record('me/accounts', 'me/accounts', {}, {'data': [{'access_token': 'page-secret'}]})
+        archive.record('123/conversations', '{id}/conversations', {}, {'data': [3]})
+        archive.flush()
+
+        self.assertEqual(len(find_frames(self.directory)), 2)
+        self.assertEqual(len(find_frames(self.directory, endpoints=['{id}/conversations'])), 1)
+        records = list(iter_records(self.directory, endpoints=['{id}/comments']))
+        self.assertEqual([record['body'] for record in records], [{'data': [1]}])
+        self.assertEqual(records[0]['params'], {'limit': 100})
+        self.assertEqual(list(iter_records(self.directory, since=records[0]['t'] + 3600)), [])
+        # Responses carrying page tokens never reach the disk
+        self.assertNotIn('page-secret', str(list(iter_records(self.directory))))
+
+    @override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_RATE_LIMIT_ENABLED=False,
+                       FACEBOOK_ARCHIVE_ENABLED=True)
+    def test_reingest_rebuilds_the_synced_data_without_api_calls(self):
+        fake = FakeGraph(pages=2, posts=12, comments=4, conversations=3, messages=60, nameless_ratio=0.25)
+        with self.settings(FACEBOOK_ARCHIVE_DIR=self.directory):
+            identity_cache.clear()
+            FacebookSyncEngine(api=FacebookGraphAPI(session=fake), max_workers=2).run()
+
+        def stored():
+            return (
+                list(FacebookPage.objects.order_by('page_id').values_list('page_id', 'name', 'posts_synced_until')),
+                list(FacebookPost.objects.order_by('post_id').values_list('post_id', 'likes_count', 'comments_count')),
+                list(FacebookComment.objects.order_by('comment_id').values_list('comment_id', 'from_name', 'user_id')),
+                list(FacebookMessage.objects.order_by('message_id').values_list('message_id', 'from_name')),
+                FacebookConversation.objects.count(),
+            )
+        synced = stored()
+        FacebookPage.objects.all().delete()
+        FacebookUser.objects.all().delete()
+
+        requests_before = fake.requests
+        out = io.StringIO()
+        call_command('reingest', dir=self.directory, stdout=out)
+        self.assertEqual(fake.requests, requests_before)
+        self.assertEqual(stored(), synced)
+        self.assertIn('Reingested 2 pages, 24 posts, 96 comments and 360 messages', out.getvalue())
+
+    def test_reingest_keeps_the_archived_time_of_engagement_readings(self):
+        fetched = datetime(2026, 3, 1, 12, tzinfo=dt_timezone.utc)
+        post = {'id': 'page1_1', 'created_time': '2026-02-27T08:00:00+0000', 'message': 'Hello',
+                'likes': {'summary': {'total_count': 7}}, 'comments': {'summary': {'total_count': 0}}}
+        archive = ResponseArchive(self.directory)
+        with mock.patch('crm.archive.time.time', return_value=fetched.timestamp()):
+            archive.record('page1', '{id}', {}, {'id': 'page1', 'name': 'Page', 'category': 'Shop'})
+            archive.record('page1/posts', '{id}/posts', {}, {'data': [post]})
+            archive.flush()
+
+        ArchiveIngest(self.directory).run()
+        chunk = EngagementHistoryChunk.objects.get()
+        self.assertEqual((chunk.start_time, chunk.end_time), (fetched, fetched))
+        self.assertEqual([row[1:3] for row in iter_observations()], [(int(fetched.timestamp()), 7)])
+        snapshot = PostDailySnapshot.objects.get()
+        self.assertEqual((snapshot.date, snapshot.captured_at), (timezone.localdate(fetched), fetched))
+
+
+@override_settings(FACEBOOK_ACCESS_TOKEN='user-token', FACEBOOK_RATE_LIMIT_ENABLED=False)
+class RollupTests(FakeTransportMixin, TransactionTestCase):
+    def daily_stats(self):
+        return list(PageDailyStats.objects.order_by('page_id', 'date').values_list(
+            'page_id', 'date', 'posts_count', 'comments_count', 'messages_count', 'reactions_count', 'shares_count',
+        ))
+
+    def test_sync_keeps_rollups_equal_to_a_rebuild(self):
+        fake = FakeGraph(pages=2, posts=30, comments=4, conversations=3, messages=30)
+        identity_cache.clear()
+        self.addCleanup(identity_cache.clear)
+        for _ in range(2):
+            FacebookSyncEngine(api=FacebookGraphAPI(session=fake), max_workers=2).run()
+
+        incremental = self.daily_stats()
+        self.assertEqual(sum(row[2] for row in incremental), FacebookPost.objects.count())
+        self.assertEqual(sum(row[3] for row in incremental), FacebookComment.objects.count())
+        self.assertEqual(sum(row[4] for row in incremental), FacebookMessage.objects.count())
+        self.assertEqual(PostDailySnapshot.objects.count(), FacebookPost.objects.count())
+        self.assertEqual(PageDailyStats.objects.filter(followers_count__isnull=False).count(), 2)
+
+        rebuild_daily_stats()
+        self.assertEqual(self.daily_stats(), incremental)
+
+    def test_counter_changes_move_the_publication_day_and_todays_snapshot(self):
+        page = FacebookPage.objects.create(page_id='page1', name='Page')
+        published = timezone.now() - timedelta(days=3)
+        row = {'post_id': 'page1_1', 'message': '', 'created_time': published,
+               'likes_count': 5, 'comments_count': 0, 'shares_count': 1}
+        store = SyncStore()
+        store.save_posts(page, [row])
+        store.save_posts(page, [dict(row, likes_count=12, shares_count=4)])
+
+        stats = PageDailyStats.objects.get(page=page)
+        self.assertEqual(stats.date, timezone.localdate(published))
+        self.assertEqual((stats.posts_count, stats.reactions_count, stats.shares_count), (1, 12, 4))
+        snapshot = PostDailySnapshot.objects.get()
+        self.assertEqual((snapshot.date, snapshot.likes_count), (timezone.localdate(), 12))
+
+        response = self.client.get(reverse('crm:post_engagement_growth', args=['page1_1']))
+        self.assertEqual(response.json()['days'][0]['likes_count'], 12)
+        response = self.client.get(reverse('crm:page_daily_stats', args=['page1']), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_old_readings_snapshot_their_own_day_and_never_replace_newer_ones(self):
+        page = FacebookPage.objects.create(page_id='page1', name='Page')
+        row = {'post_id': 'page1_1', 'message': '', 'created_time': timezone.now() - timedelta(days=10),
+               'likes_count': 20, 'comments_count': 0, 'shares_count': 0}
+        store = SyncStore()
+        store.save_posts(page, [row])
+        read_at = timezone.now() - timedelta(days=5)
+        store.save_posts(page, [dict(row, likes_count=8)], read_at=read_at)
+        earlier_today = timezone.now() - timedelta(seconds=1)
+        store.save_posts(page, [dict(row, likes_count=15)], read_at=earlier_today)
+
+        snapshots = list(PostDailySnapshot.objects.order_by('date').values_list('date', 'likes_count', 'captured_at'))
+        self.assertEqual(snapshots[0], (timezone.localdate(read_at), 8, read_at))
+        self.assertEqual(snapshots[1][:2], (timezone.localdate(), 20))
+        self.assertEqual(len(snapshots), 2)
+
+
+class EngagementHistoryTests(TestCase):
+    def observe(self, history, hours, *counters):
+        """counters are (pk, likes) pairs observed the given hours after the epoch"""
+        posts = [SimpleNamespace(pk=pk, post_id=str(pk), likes_count=likes, comments_count=0, shares_count=0)
+                 for pk, likes in counters]
+        history.observe(posts, {}, datetime.fromtimestamp(hours * 3600, tz=dt_timezone.utc))
+
+    def test_only_changed_counters_are_packed(self):
+        page = FacebookPage.objects.create(page_id='page1', name='Page')
+        row = {'post_id': 'page1_1', 'message': '', 'created_time': timezone.now(),
+               'likes_count': 5, 'comments_count': 1, 'shares_count': 0}
+        store = SyncStore()
+        for likes in (5, 5, 9):
+            store.save_posts(page, [dict(row, likes_count=likes)])
+            store.flush()
+
+        self.assertEqual(EngagementHistoryChunk.objects.count(), 2)
+        self.assertEqual(sum(len(chunk.data) for chunk in EngagementHistoryChunk.objects.all()), 2 * RECORD_BYTES)
+        post = FacebookPost.objects.get()
+        self.assertEqual([(pk, likes) for pk, _, likes, _, _ in iter_observations()], [(post.pk, 5), (post.pk, 9)])
+
+        self.assertEqual(compact_history(), (2, 1))
+        self.assertEqual(len(list(iter_observations())), 2)
+
+    def test_velocity_and_decay_queries(self):
+        history = EngagementHistory()
+        self.observe(history, 0, (1, 0), (2, 10))
+        self.observe(history, 6, (1, 40), (2, 12))
+        self.observe(history, 12, (1, 50), (3, 7))
+        history.flush()
+
+        columns = load_history()
+        self.assertEqual(columns['post'].tolist(), [1, 1, 1, 2, 2, 3])
+        window = [datetime.fromtimestamp(hours * 3600, tz=dt_timezone.utc) for hours in (3, 15)]
+        posts, gains, per_hour = engagement_velocity(columns, *window)
+        self.assertEqual(posts.tolist(), [1, 2, 3])
+        self.assertEqual(gains.tolist(), [50, 2, 7])
+        self.assertAlmostEqual(per_hour[0], 50 / 12)
+
+        curve = engagement_decay(columns, bucket_hours=6, buckets=4, created={1: 0, 2: 0, 3: 6 * 3600})
+        self.assertEqual(curve.tolist(), [10, 49, 10, 0])
+        self.assertEqual(half_life(curve, 6), 12)
+
+
+@override_settings(FACEBOOK_ANALYTICS_CACHE_TTL=0)
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Monday 2026-10-12 09:00 UTC
+        self.monday = datetime(2026, 10, 12, 9, tzinfo=dt_timezone.utc)
+        self.page = FacebookPage.objects.create(page_id='page1', name='Page one', followers_count=100)
+        self.quiet = FacebookPage.objects.create(page_id='page2', name='Page two', followers_count=0)
+        for i, likes in enumerate([10, 30, 30, 50]):
+            FacebookPost.objects.create(post_id=f'page1_{i}', page=self.page, likes_count=likes, shares_count=0,
+                                        created_time=self.monday + timedelta(days=i))
+        FacebookPost.objects.create(post_id='page2_0', page=self.quiet, likes_count=5, created_time=self.monday)
+
+    def message(self, number, thread, sender, minutes):
+        FacebookMessage.objects.create(
+            message_id=f'm{number}', page=self.page, thread_id=thread, from_id=sender, from_name=sender,
+            message='', created_time=self.monday + timedelta(minutes=minutes),
+        )
+
+    def test_epoch_matches_python_timestamps(self):
+        FacebookPost.objects.filter(post_id='page1_1').update(
+            created_time=self.monday + timedelta(seconds=59, microseconds=999900))
+        rows = FacebookPost.objects.annotate(epoch=analytics.Epoch('created_time')).values_list('created_time', 'epoch')
+        self.assertEqual([epoch for _, epoch in rows], [int(created.timestamp()) for created, _ in rows])
+
+    def test_reports_are_served_as_json(self):
+        response = self.client.get(reverse('crm:analytics_report', args=['engagement']), {'page': 'page1'})
+        self.assertEqual([page['page_id'] for page in response.json()['pages']], ['page1'])
+        self.assertEqual(self.client.get(reverse('crm:analytics_report', args=['nope'])).status_code, 404)
+
+    def test_engagement_rates_and_posting_hours(self):
+        pages = analytics.engagement_rates()['pages']
+        self.assertEqual([page['page_id'] for page in pages], ['page1', 'page2'])
+        self.assertEqual((pages[0]['engagement_per_post'], pages[0]['engagement_rate']), (30.0, 30.0))
+        self.assertIsNone(pages[1]['engagement_rate'])
+
+        heatmap = analytics.posting_heatmap(self.page)
+        self.assertEqual(heatmap['posts'][0][9], 1)
+        self.assertEqual(sum(map(sum, heatmap['posts'])), 4)
+        self.assertEqual(heatmap['best_slots'][0], {'weekday': 'Thursday', 'hour': 9, 'posts': 1,
+                                                    'average_engagement': 50.0})
+
+    def test_response_times_pair_customer_runs_with_page_replies(self):
+        for number, (thread, sender, minutes) in enumerate([
+            ('t1', 'user1', 0), ('t1', 'user1', 2), ('t1', 'page1', 10), ('t1', 'page1', 11),
+            ('t2', 'user2', 0), ('t2', 'page1', 120), ('t2', 'user2', 130),
+        ]):
+            self.message(number, thread, sender, minutes)
+        report = analytics.response_times()
+        self.assertEqual((report['responses'], report['unanswered']), (2, 1))
+        self.assertEqual(report['percentiles']['p50'], (600 + 7200) / 2)
+        self.assertEqual([bucket['responses'] for bucket in report['histogram']], [0, 1, 0, 1, 0, 0])
+
+    def test_top_commenters_and_percentiles(self):
+        FacebookUser.objects.create(user_id='u1', name='Ann', resolved=True)
+        for number, (user_id, post_id) in enumerate([('u1', 'page1_0'), ('u1', 'page1_0'), ('u1', 'page1_1'),
+                                                     ('u2', 'page2_0')]):
+            FacebookComment.objects.create(comment_id=f'c{number}', post=FacebookPost.objects.get(post_id=post_id),
+                                           message='', from_name='', from_id=user_id, created_time=self.monday)
+        commenters = analytics.top_commenters()['commenters']
+        self.assertEqual(commenters[0], {'user_id': 'u1', 'name': 'Ann', 'comments': 3, 'posts': 2, 'share': 75.0})
+
+        ranks = {post['post_id']: post for post in analytics.post_percentiles()['posts']}
+        self.assertEqual(ranks['page1_3']['page_percentile'], 100.0)
+        self.assertEqual(ranks['page1_1']['page_percentile'], ranks['page1_2']['page_percentile'])
+        self.assertEqual(ranks['page2_0']['page_percentile'], 0.0)
+        self.assertEqual(ranks['page2_0']['overall_percentile'], 0.0)
+
+        response = self.client.get(reverse('crm:analytics_report', args=['post-percentiles']), {'page': 'page2'})
+        self.assertEqual([post['post_id'] for post in response.json()['posts']], ['page2_0'])
+
+
+class SQLiteTuningTests(TransactionTestCase):
+    # synchronous can't be changed inside the transaction a TestCase wraps each test in
+    @override_settings(FACEBOOK_SQLITE_PRAGMAS={'cache_size': -1024, 'busy_timeout': 250})
+    def test_configured_pragmas_are_applied_to_connections(self):
+        apply_sqlite_pragmas(connection)
+        self.addCleanup(apply_sqlite_pragmas, connection, {'cache_size': -64 * 1024, 'busy_timeout': 5000})
+        self.assertEqual(
+            current_sqlite_pragmas(connection, ['cache_size', 'busy_timeout', 'temp_store']),
+            {'cache_size': -1024, 'busy_timeout': 250, 'temp_store': 2},
+        )
+        # The setting overrides single defaults instead of replacing them all
+        self.assertEqual(sqlite_pragmas(), {**DEFAULT_SQLITE_PRAGMAS, 'cache_size': -1024, 'busy_timeout': 250})
+
+    def test_new_connections_are_tuned(self):
+        # The test database connection was opened through the connection_created hook
+        self.assertEqual(current_sqlite_pragmas(connection, ['busy_timeout', 'temp_store']),
+                         {'busy_timeout': 5000, 'temp_store': 2})
+
+    def test_pragma_values_are_not_interpolated_blindly(self):
+        with self.assertRaises(ValueError):
+            apply_sqlite_pragmas(connection, {'journal_mode': 'WAL; DROP TABLE crm_facebookpage'})
@@ -0,0 +1,99 @@
+"""
+Shared page access token store.
+
+Page tokens all come back from a single `me/accounts` call, so they are
+stored in the database and reused by every view, sync run and worker
+process instead of being rediscovered page by page. A stored token is used
+until FACEBOOK_PAGE_TOKEN_TTL runs out or the user token it was derived from
+expires (as last reported by `debug_token`), whichever comes first.
+"""
+import hashlib
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import FacebookPageToken, FacebookPermissionStatus
+
+
+# Only one thread per process re-reads me/accounts at a time
+_refresh_lock = threading.Lock()
+
+
+def token_fingerprint(token):
+    """Stable, non-reversible key for an access token"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _token_ttl():
+    return timedelta(seconds=getattr(settings, 'FACEBOOK_PAGE_TOKEN_TTL', 86400))
+
+
+def token_expiry(user_token, now=None):
+    """When page tokens fetched now with this user token should stop being used"""
+    now = now or timezone.now()
+    expires_at = now + _token_ttl()
+    user_expires_at = (
+        FacebookPermissionStatus.objects
+        .filter(token_fingerprint=token_fingerprint(user_token))
+        .values_list('token_expires_at', flat=True)
+        .first()
+    )
+    if user_expires_at:
+        expires_at = min(expires_at, user_expires_at)
+    return expires_at
+
+
+def save_page_tokens(pages, user_token):
+    """Store the page tokens from a me/accounts response and return them as {page_id: token}"""
+    now = timezone.now()
+    expires_at = token_expiry(user_token, now)
+    fingerprint = token_fingerprint(user_token)
+
+    tokens = {page['id']: page['access_token'] for page in pages if page.get('access_token')}
+    FacebookPageToken.objects.bulk_create(
+        [
+            FacebookPageToken(
+                page_id=page_id, user_token_fingerprint=fingerprint, access_token=access_token,
+                fetched_at=now, expires_at=expires_at,
+            )
+            for page_id, access_token in tokens.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['page_id'],
+        update_fields=['user_token_fingerprint', 'access_token', 'fetched_at', 'expires_at'],
+    )
+    return tokens
+
+
+def get_stored_page_token(page_id, user_token):
+    """Unexpired stored token for the page, or None"""
+    return (
+        FacebookPageToken.objects
+        .filter(page_id=page_id, user_token_fingerprint=token_fingerprint(user_token), expires_at__gt=timezone.now())
+        .values_list('access_token', flat=True)
+        .first()
+    )
+
+
+def refresh_page_tokens(api):
+    """Fetch every page token with one me/accounts call and store them"""
+    pages_data = api.get_pages()
+    if not pages_data or 'data' not in pages_data:
+        return {}
+    return save_page_tokens(pages_data['data'], api.user_access_token)
+
+
+def get_page_token(api, page_id):
+    """Token for the page from the shared store, refreshing the store from me/accounts when needed"""
+    page_token = get_stored_page_token(page_id, api.user_access_token)
+    if page_token:
+        return page_token
+
+    with _refresh_lock:
+        # Another thread may have refreshed the store while we waited
+        page_token = get_stored_page_token(page_id, api.user_access_token)
+        if page_token:
+            return page_token
+        return refresh_page_tokens(api).get(page_id)
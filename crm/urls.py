@@ -6,6 +6,12 @@ app_name = 'crm'
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('sync-data/', views.sync_facebook_data, name='sync_data'),
+    path('sync-jobs/<int:job_id>/', views.sync_job_progress, name='sync_job_progress'),
+    path('sync-jobs/<int:job_id>/metrics/', views.sync_job_metrics, name='sync_job_metrics'),
+    path('metrics', views.metrics, name='metrics'),
+    path('pages/<str:page_id>/daily/', views.page_daily_stats, name='page_daily_stats'),
+    path('posts/<str:post_id>/growth/', views.post_engagement_growth, name='post_engagement_growth'),
+    path('analytics/<slug:report>/', views.analytics_report, name='analytics_report'),
     path('debug-api/', debug_views.debug_facebook_api, name='debug_api'),
     path('test-page/<str:page_id>/', debug_views.test_page_access, name='test_page'),
 ]
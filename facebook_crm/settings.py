@@ -78,6 +78,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests instead of reconnecting (and re-running pragmas) each time
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -129,12 +132,119 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Facebook API Configuration
 FACEBOOK_APP_ID = '1435605817637660'
 FACEBOOK_APP_SECRET = '1cea4b8514f86c712fa92284873310c4'
-FACEBOOK_ACCESS_TOKEN = 'EAAUZArQbMOxwBO0tBa96Cj5ktLU0cDMPMiHQmzInaA9XrS12Sh6B6ri0V0BY7aMKb7jgb8fC9JFKrO4O9XTm1elZAeJZCflOClqoWF0tZCtzwdg3ZB0lqFsxhjRnFC2fmRlBKBBKMP7CmaiFsMJFOZCJC5d9xEuZAlivNHZBBH1Bemd3JCKqch1KmvshPj4n' 
-
-
-
+FACEBOOK_ACCESS_TOKEN = 'EAAUZArQbMOxwBO0tBa96Cj5ktLU0cDMPMiHQmzInaA9XrS12Sh6B6ri0V0BY7aMKb7jgb8fC9JFKrO4O9XTm1elZAeJZCflOClqoWF0tZCtzwdg3ZB0lqFsxhjRnFC2fmRlBKBBKMP7CmaiFsMJFOZCJC5d9xEuZAlivNHZBBH1Bemd3JCKqch1KmvshPj4n'
+
+# Graph API HTTP transport (shared keep-alive connection pool)
+FACEBOOK_API_POOL_CONNECTIONS = 10   # number of host pools to cache
+FACEBOOK_API_POOL_MAXSIZE = 20       # max open connections per host
+FACEBOOK_API_KEEP_ALIVE = True
+FACEBOOK_API_TIMEOUT = (5, 30)       # (connect, read) seconds
+
+# Sync engine concurrency (Graph API fetches; DB writes always use one writer thread)
+FACEBOOK_SYNC_MAX_WORKERS = 8             # global worker pool size
+FACEBOOK_SYNC_PER_PAGE_CONCURRENCY = 4    # in-flight requests per page
+FACEBOOK_SYNC_PER_TOKEN_CONCURRENCY = 4   # in-flight requests per access token
+FACEBOOK_SYNC_WRITE_CHUNK_SIZE = 1000     # comment/message rows per bulk upsert transaction
+
+# Incremental sync: engagement on posts younger than the window is re-read on a
+# schedule that starts at BASE minutes and doubles per day of post age, up to MAX.
+FACEBOOK_SYNC_REFRESH_WINDOW_DAYS = 30
+FACEBOOK_SYNC_REFRESH_BASE_MINUTES = 15
+FACEBOOK_SYNC_REFRESH_MAX_HOURS = 24
+
+# Background sync jobs (`manage.py runsyncworker`)
+FACEBOOK_SYNC_JOB_STALE_MINUTES = 30      # running jobs without progress this long are failed
+
+# Dashboard totals are computed in one aggregate query and cached this many seconds (0 = no cache)
+FACEBOOK_DASHBOARD_STATS_TTL = 30
+
+# Permission/token status is checked during sync and by the idle worker, then cached this long
+FACEBOOK_PERMISSION_STATUS_TTL = 3600
+
+# Page access tokens from me/accounts are stored and shared by all processes for at most this
+# many seconds (less if the user token expires sooner, as reported by debug_token)
+FACEBOOK_PAGE_TOKEN_TTL = 86400
+
+# Client-side Graph API rate limiting: (requests per second, burst) token buckets per app,
+# per page and per access token. Buckets slow down linearly once the X-App-Usage /
+# X-Page-Usage / X-Business-Use-Case-Usage headers report usage above SLOWDOWN_AT percent,
+# and throttling errors (codes 4/17/32/613) pause them with jittered exponential BACKOFF
+# (base, cap seconds) before the request is retried up to MAX_RETRIES times.
+FACEBOOK_RATE_LIMIT_ENABLED = True
+FACEBOOK_RATE_LIMIT_APP = (20, 40)
+FACEBOOK_RATE_LIMIT_PAGE = (10, 20)
+FACEBOOK_RATE_LIMIT_TOKEN = (10, 20)
+FACEBOOK_RATE_LIMIT_SLOWDOWN_AT = 50
+FACEBOOK_RATE_LIMIT_MIN_FACTOR = 0.05
+FACEBOOK_RATE_LIMIT_BACKOFF = (1.0, 60.0)
+FACEBOOK_RATE_LIMIT_MAX_RETRIES = 3
+
+# Transient Graph API failures (timeouts, connection errors, 5xx, is_transient) are retried
+# up to MAX_RETRIES times with capped exponential BACKOFF (base, cap seconds) and full jitter.
+# After CIRCUIT_FAILURES consecutive transient failures an endpoint's circuit opens and its
+# requests fail fast for CIRCUIT_RESET_SECONDS before a single trial request is let through.
+FACEBOOK_API_MAX_RETRIES = 3
+FACEBOOK_API_BACKOFF = (0.5, 30.0)
+FACEBOOK_API_CIRCUIT_FAILURES = 5
+FACEBOOK_API_CIRCUIT_RESET_SECONDS = 30
+
+# Remembered fallback lookups: the comment/profile method that worked for a page is tried
+# first for this many seconds, and users no lookup could resolve are skipped for UNRESOLVABLE_TTL
+FACEBOOK_LOOKUP_MEMO_METHOD_TTL = 7 * 86400
+FACEBOOK_LOOKUP_MEMO_UNRESOLVABLE_TTL = 3 * 86400
+
+# Resolved commenter/sender names kept in each process's in-memory LRU
+FACEBOOK_USER_CACHE_SIZE = 10000
+
+# Graph API fields a sync requests: 'minimal' (only what gets stored), 'standard' or 'full'
+FACEBOOK_SYNC_FIELD_PROFILE = 'minimal'
+
+# Logging: sync counters and timings at INFO; per-item detail at DEBUG. Raw Graph API payloads
+# are only dumped when FACEBOOK_LOG_PAYLOADS is on and the crm loggers are at DEBUG.
+FACEBOOK_LOG_LEVEL = 'INFO'
+FACEBOOK_LOG_PAYLOADS = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'standard': {
+            'format': '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'standard',
+        },
+    },
+    'loggers': {
+        'crm': {
+            'handlers': ['console'],
+            'level': FACEBOOK_LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
 
+# Seconds the /metrics totals over finished sync jobs are cached (0 disables caching)
+FACEBOOK_METRICS_CACHE_TTL = 15
 
+# Raw Graph API response archive, replayed by `manage.py reingest`
+FACEBOOK_ARCHIVE_ENABLED = False
+FACEBOOK_ARCHIVE_DIR = BASE_DIR / 'facebook_archive'
+# 'gzip', or 'zstd' when the zstandard package is installed
+FACEBOOK_ARCHIVE_COMPRESSION = 'gzip'
+# Start a new segment file once the current one reaches this size
+FACEBOOK_ARCHIVE_SEGMENT_BYTES = 64 * 1024 * 1024
 
+# New SQLite connections get crm.db.DEFAULT_SQLITE_PRAGMAS (WAL lets dashboards read during a sync);
+# set FACEBOOK_SQLITE_PRAGMAS = {'name': value} to override individual pragmas
 
+# Record every change in post engagement counters as packed observations (see crm/history.py)
+FACEBOOK_HISTORY_ENABLED = True
+# Observations per stored chunk (24 bytes each)
+FACEBOOK_HISTORY_CHUNK_ROWS = 65536
 
+# Seconds the analytics reports (see crm/analytics.py) are cached (0 disables caching)
+FACEBOOK_ANALYTICS_CACHE_TTL = 300